@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from .models import RideUser, Ride, RideEvent
+from .models import RideUser, Ride, RideEvent, RideEventArchive, DriverMonthlyStats, DriverLocation, ReportJob
+from .authentication import invalidate_user_claims
 
 # For testing 'over 1 hour' trips
 # RideEvent._meta.get_field('created').editable = True
@@ -30,6 +31,13 @@ class RideUserAdmin(UserAdmin):
         ('Permissions', {'fields': ('role', 'is_active',)}),
     )
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+
+        # Tokens carry role/is_active, see: api/authentication.py
+        if change and {'role', 'is_active'} & set(form.changed_data):
+            invalidate_user_claims(obj.pk)
+
 
 class RideEventInline(admin.StackedInline):
     model = RideEvent
@@ -60,3 +68,73 @@ class RideEventAdmin(admin.ModelAdmin):
     list_filter = ('created',)
     
     ordering = ('-created',)
+
+    list_select_related = ('ride',)
+
+    # No COUNT(*) of the whole table on every page
+    show_full_result_count = False
+
+
+@admin.register(RideEventArchive)
+class RideEventArchiveAdmin(admin.ModelAdmin):
+    search_fields = ('ride__id', 'description')
+
+    list_display = ('id', 'ride', 'description', 'created', 'month',)
+
+    list_filter = ('month',)
+
+    ordering = ('-created',)
+
+    list_select_related = ('ride',)
+
+    show_full_result_count = False
+
+    # Archived history is read-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DriverMonthlyStats)
+class DriverMonthlyStatsAdmin(admin.ModelAdmin):
+    list_display = ('driver', 'month', 'trip_count', 'over_1h_count', 'total_duration', 'is_dirty',)
+
+    list_filter = ('month', 'is_dirty',)
+
+    ordering = ('-month',)
+
+
+@admin.register(DriverLocation)
+class DriverLocationAdmin(admin.ModelAdmin):
+    list_display = ('driver', 'lat', 'long', 'updated',)
+
+    ordering = ('-updated',)
+
+    list_select_related = ('driver',)
+
+    # Only written by pings
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'requested_by', 'created', 'finished', 'rows',)
+
+    list_filter = ('kind', 'status',)
+
+    ordering = ('-created',)
+
+    list_select_related = ('requested_by',)
+
+    # Queued through 'api/reports/<kind>/', run by 'manage.py run_report_jobs'
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
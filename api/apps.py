@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .instrumentation import install_query_recorder
+        from .sqlite import configure_sqlite
+
+        # Per request query stats, see: QueryInstrumentationMiddleware
+        connection_created.connect(install_query_recorder, dispatch_uid='api_query_recorder')
+        # SQLITE_TUNING, see: api/sqlite.py
+        connection_created.connect(configure_sqlite, dispatch_uid='api_configure_sqlite')
@@ -0,0 +1,267 @@
+import asyncio
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .authentication import ClaimsJWTAuthentication
+from .models import Ride, RideEvent
+from .routers import read_from_replica
+from .serializers import RideEventSerializer
+from .streams import broker
+from .views import RideViewset
+
+
+class AsyncAPIView(View):
+    """
+    - Base of the async views: authentication, RideViewset's permissions
+    and error responses the same as DRF's, without DRF's sync dispatch.
+    """
+    viewset_class = RideViewset
+    authentication_class = ClaimsJWTAuthentication
+
+    async def get(self, request, pk=None):
+        request = Request(request)
+        viewset = self.get_viewset(request, pk)
+
+        try:
+            await self.authenticate(request)
+            self.check_permissions(request, viewset)
+
+            return await self.respond(request, viewset)
+        except exceptions.APIException as exc:
+
+            return self.handle_exception(request, exc)
+
+    async def respond(self, request, viewset):
+        raise NotImplementedError
+
+    def get_viewset(self, request, pk):
+        # Same attributes the router sets on RideViewset for list/retrieve.
+        return self.viewset_class(
+            request=request,
+            args=(),
+            kwargs={'pk': pk} if pk is not None else {},
+            format_kwarg=None,
+            action='list' if pk is None else 'retrieve',
+            detail=pk is not None,
+            basename='ride',
+        )
+
+    async def authenticate(self, request):
+        authenticator = self.authentication_class()
+        result = await authenticator.aauthenticate(request)
+
+        if result is None:
+            request.user, request.auth = api_settings.UNAUTHENTICATED_USER(), None
+        else:
+            request.user, request.auth = result
+
+    def check_permissions(self, request, viewset):
+        # Permissions only read request.user, already loaded by authenticate().
+        for permission in viewset.get_permissions():
+            if not permission.has_permission(request, viewset):
+                if not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+
+                raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+    def render(self, data, status=200):
+        renderer = api_settings.DEFAULT_RENDERER_CLASSES[0]()
+
+        return HttpResponse(renderer.render(data), status=status, content_type=renderer.media_type)
+
+    def handle_exception(self, request, exc):
+        # Same body/status as DRF's exception_handler.
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {'detail': exc.detail}
+
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response = self.render(data, status=401)
+            response['WWW-Authenticate'] = self.authentication_class().authenticate_header(request)
+
+            return response
+
+        return self.render(data, status=exc.status_code)
+
+
+class AsyncRideView(AsyncAPIView):
+    """
+    - Async-native GET 'api/async/rides/' and 'api/async/rides/<pk>/',
+    same response as RideViewset's list/retrieve(filters, ordering,
+    ?fields/?expand, pagination, response cache).
+    - Reads with the async ORM(acount/aiterator/aget) and the cache's
+    async API, so under ASGI a request waiting on them doesn't hold a thread.
+    - The queryset, filters and serializer come from RideViewset itself,
+    only the I/O differs.
+    """
+
+    async def respond(self, request, viewset):
+        # Same as RideViewset.replica_actions
+        with read_from_replica():
+            data, cache_status = await viewset.acached_response(
+                lambda: self.get_data(viewset), request, **viewset.kwargs
+            )
+
+        response = self.render(data)
+        if cache_status:
+            response['X-Cache'] = cache_status
+
+        return response
+
+    async def get_data(self, viewset):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+
+        if viewset.action == 'retrieve':
+            try:
+                ride = await queryset.aget(pk=viewset.kwargs['pk'])
+            except Ride.DoesNotExist:
+                raise exceptions.NotFound(f"No {Ride._meta.object_name} matches the given query.")
+            except (TypeError, ValueError):
+                raise exceptions.NotFound()
+
+            return viewset.get_serializer(ride).data
+
+        paginator = viewset.paginator
+        page = await paginator.apaginate_queryset(queryset, viewset.request, view=viewset)
+        if page is None:
+            rides = [ride async for ride in queryset.aiterator(chunk_size=2000)]
+
+            return viewset.get_serializer(rides, many=True).data
+
+        return paginator.get_paginated_response(viewset.get_serializer(page, many=True).data).data
+
+
+class RideEventStreamView(AsyncAPIView):
+    """
+    - GET 'api/rides/<pk>/events/stream/': server-sent events of the
+    ride's new RideEvents, pushed as the writes commit(api/streams.py).
+    One idle connection per watcher instead of polling 'api/rides/<pk>/'.
+    - Reconnecting with Last-Event-ID(EventSource does it) or ?after=<event id>
+    first sends the events missed meanwhile.
+    - ?wait=<seconds>: long-poll instead, a JSON list of the events after
+    ?after= as soon as there is one, or an empty list after the wait.
+    - Server-sent events need an ASGI server, long-poll also works under WSGI.
+    """
+    max_wait = 60
+    # Sent once, how long EventSource waits before reconnecting(ms).
+    retry = 3000
+
+    async def respond(self, request, viewset):
+        try:
+            ride_id = int(viewset.kwargs['pk'])
+        except ValueError:
+            raise exceptions.NotFound()
+
+        if not await Ride.objects.filter(pk=ride_id).aexists():
+            raise exceptions.NotFound(f"No {Ride._meta.object_name} matches the given query.")
+
+        after = self.get_after(request)
+
+        if 'wait' in request.query_params:
+            return self.render(await self.long_poll(ride_id, after, self.get_wait(request)))
+
+        if not isinstance(request._request, ASGIRequest):
+            raise exceptions.ValidationError({
+                'wait': "Server-sent events need an ASGI server, long-poll with ?wait=<seconds> instead."
+            })
+
+        response = StreamingHttpResponse(self.stream(ride_id, after), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Proxies(ie: nginx) would otherwise buffer the stream.
+        response['X-Accel-Buffering'] = 'no'
+
+        return response
+
+    def get_after(self, request):
+        after = request.query_params.get('after') or request.headers.get('Last-Event-ID')
+        if not after:
+
+            return None
+
+        try:
+            return int(after)
+        except ValueError:
+            raise exceptions.ValidationError({'after': "A valid event id is required."})
+
+    def get_wait(self, request):
+        try:
+            wait = float(request.query_params['wait'])
+        except ValueError:
+            raise exceptions.ValidationError({'wait': "A number of seconds is required."})
+
+        return min(max(wait, 0), self.max_wait)
+
+    async def get_missed_events(self, ride_id, after):
+        events = RideEvent.objects.filter(ride_id=ride_id, id__gt=after).order_by('id')
+
+        return [RideEventSerializer(event).data async for event in events[:1000]]
+
+    async def long_poll(self, ride_id, after, wait):
+        # Subscribe first: nothing committed after the missed events query is lost.
+        subscription = broker.subscribe(ride_id)
+        try:
+            events = await self.get_missed_events(ride_id, after) if after is not None else []
+            if events:
+
+                return events
+
+            try:
+                events.append(await asyncio.wait_for(subscription.queue.get(), wait))
+            except asyncio.TimeoutError:
+
+                return events
+
+            while not subscription.queue.empty():
+                events.append(subscription.queue.get_nowait())
+        finally:
+            broker.unsubscribe(ride_id, subscription)
+
+        return [event for event in events if after is None or event['id'] > after]
+
+    async def stream(self, ride_id, after):
+        loop = asyncio.get_running_loop()
+        heartbeat = getattr(settings, 'RIDE_EVENT_STREAM_HEARTBEAT', 15)
+        # Watchers reconnect(with Last-Event-ID) after this, so a connection
+        # never outlives a deploy or a lost client for long.
+        deadline = loop.time() + getattr(settings, 'RIDE_EVENT_STREAM_TIMEOUT', 300)
+
+        subscription = broker.subscribe(ride_id)
+        try:
+            yield f'retry: {self.retry}\n\n'.encode()
+
+            last_id = after
+            if after is not None:
+                for event in await self.get_missed_events(ride_id, after):
+                    last_id = event['id']
+                    yield self.format_event(event)
+
+            # Overflowed: too slow to keep up, reconnecting catches up from the database.
+            while not subscription.overflowed:
+                timeout = min(heartbeat, deadline - loop.time())
+                if timeout <= 0:
+                    break
+
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield b': keep-alive\n\n'
+                    continue
+
+                if last_id is not None and event['id'] <= last_id:
+                    continue
+                last_id = event['id']
+                yield self.format_event(event)
+        finally:
+            broker.unsubscribe(ride_id, subscription)
+
+    def format_event(self, event):
+        data = api_settings.DEFAULT_RENDERER_CLASSES[0]().render(event)
+
+        return b'id: %d\nevent: ride_event\ndata: %s\n\n' % (event['id'], data)
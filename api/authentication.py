@@ -0,0 +1,203 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .metrics import auth_duration, timed
+from .models import RideUser
+
+# Claims put in the tokens issued by 'api/login/' and 'api/refresh/'
+USER_CLAIMS = ('username', 'role', 'is_active', 'is_staff', 'is_superuser')
+CLAIMS_VERSION_CLAIM = 'claims_version'
+
+
+def get_claims_cache():
+    return caches[getattr(settings, 'JWT_CLAIMS_CACHE', 'default')]
+
+
+def get_claims_cache_key(user_id):
+    return f'jwt_claims_version:{user_id}'
+
+
+def get_claims_cache_timeout():
+    return getattr(settings, 'JWT_CLAIMS_CACHE_TIMEOUT', 60)
+
+
+def get_claims_version(user_id):
+    """
+    - The user's current RideUser.claims_version, None if there is no such user.
+    - Cached for JWT_CLAIMS_CACHE_TIMEOUT seconds, a missing/evicted entry
+    is read from the database again, never assumed.
+    """
+
+    cache = get_claims_cache()
+    key = get_claims_cache_key(user_id)
+    claims_version = cache.get(key)
+    if claims_version is None:
+        claims_version = RideUser.objects.filter(pk=user_id).values_list('claims_version', flat=True).first()
+        if claims_version is not None:
+            cache.set(key, claims_version, get_claims_cache_timeout())
+
+    return claims_version
+
+
+async def aget_claims_version(user_id):
+    cache = get_claims_cache()
+    key = get_claims_cache_key(user_id)
+    claims_version = await cache.aget(key)
+    if claims_version is None:
+        claims_version = await RideUser.objects.filter(pk=user_id).values_list('claims_version', flat=True).afirst()
+        if claims_version is not None:
+            await cache.aset(key, claims_version, get_claims_cache_timeout())
+
+    return claims_version
+
+
+def invalidate_user_claims(user_id):
+    """
+    - Call when a user's role or is_active changes: tokens issued before
+    no longer carry the right claims and are rejected.
+    - The version is kept on the user row, the cache only saves reading it
+    on every request. Other processes' local caches see the new one after
+    at most JWT_CLAIMS_CACHE_TIMEOUT seconds.
+    """
+
+    RideUser.objects.filter(pk=user_id).update(claims_version=F('claims_version') + 1)
+    get_claims_cache().delete(get_claims_cache_key(user_id))
+
+
+def set_user_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    token[CLAIMS_VERSION_CLAIM] = user.claims_version
+
+    return token
+
+
+class RideTokenUser(TokenUser):
+    """
+    - Stateless request.user built from the token claims.
+    """
+
+    @property
+    def role(self):
+        return self.token.get('role')
+
+    @property
+    def is_active(self):
+        return self.token.get('is_active', False)
+
+    def get_role_display(self):
+        return RideUser.RoleChoices(self.role).label
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    - Trusts role/is_active/is_staff from the token instead of loading
+    RideUser from the database on every request (JWT_TRUST_CLAIMS).
+    - Tokens without the claims(issued before) still load the user.
+    - Timed per outcome, see: api_auth_duration_seconds at /metrics
+    """
+
+    def trusts_claims(self, validated_token):
+        return getattr(settings, 'JWT_TRUST_CLAIMS', False) and 'role' in validated_token
+
+    def get_user(self, validated_token):
+        if not self.trusts_claims(validated_token):
+            return super().get_user(validated_token)
+
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        claims_version = get_claims_version(user_id) if user_id is not None else None
+
+        return self.get_token_user(validated_token, claims_version)
+
+    def authenticate(self, request):
+        with timed(auth_duration, result='failed') as labels:
+            result = super().authenticate(request)
+            labels['result'] = 'anonymous' if result is None else 'authenticated'
+
+        return result
+
+    async def aauthenticate(self, request):
+        """
+        - authenticate() for async views(api/async_views.py).
+        """
+
+        with timed(auth_duration, result='failed') as labels:
+            result = await self._aauthenticate(request)
+            labels['result'] = 'anonymous' if result is None else 'authenticated'
+
+        return result
+
+    async def _aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if not self.trusts_claims(validated_token):
+            return await sync_to_async(super().get_user)(validated_token)
+
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        claims_version = await aget_claims_version(user_id) if user_id is not None else None
+
+        return self.get_token_user(validated_token, claims_version)
+
+    def get_token_user(self, validated_token, claims_version):
+        # claims_version: the user's current one, None without a user id(or user)
+        if claims_version is None or validated_token.get(CLAIMS_VERSION_CLAIM, 0) != claims_version:
+            raise AuthenticationFailed(
+                _("User has changed, log in or refresh the token again."),
+                code='claims_outdated',
+            )
+
+        user = RideTokenUser(validated_token)
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code='user_inactive')
+
+        return user
+
+
+class RideTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return set_user_claims(super().get_token(user), user)
+
+
+class RideTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    - The refresh already loads the user, the new access token gets its
+    current claims instead of the ones copied from the refresh token.
+    """
+
+    def validate(self, attrs):
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            return super().validate(attrs)
+
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        user = RideUser.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(
+                self.error_messages['no_active_account'],
+                'no_active_account',
+            )
+
+        return {'access': str(set_user_claims(refresh.access_token, user))}
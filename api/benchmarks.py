@@ -0,0 +1,460 @@
+import math
+import random
+import statistics
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from .models import RideUser, Ride, RideEvent
+from .estimates import COORDINATE_FIELDS, estimate_queryset, estimate_trips, haversine_km_scalar
+from .middleware import brotli, compress_brotli, compress_gzip
+from .querysets import calculate_distance, filter_within_radius
+from .renderers import ORJSONRenderer
+from .serializers import RideSerializer, FastRideSerializer
+
+# Centered around Manila, same as the Postman collection's lat/long.
+CENTER_LAT = 14.5995
+CENTER_LONG = 120.9842
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    """
+    - Register a benchmark, run with 'python manage.py benchmark <name>'.
+    - Scenarios print with write() and return their metrics(saved with
+    --output, compared with --compare): '*_ms' and '*queries' are better
+    lower, '*_per_s' higher.
+    """
+
+    def register(func):
+        SCENARIOS[name] = func
+
+        return func
+
+    return register
+
+
+def timed(func, repeat=5):
+    """
+    - Run func repeat times, returns (median seconds, last result).
+    """
+
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings), result
+
+
+def seed_users(count, role=RideUser.RoleChoices.RIDER, prefix='bench'):
+    users = [
+        RideUser(
+            username=f'{prefix}_{role.lower()}_{i}',
+            email=f'{prefix}_{role.lower()}_{i}@example.com',
+            first_name='Bench',
+            last_name=f'User{i}',
+            role=role,
+            password='!',
+        )
+        for i in range(count)
+    ]
+
+    return RideUser.objects.bulk_create(users, batch_size=1000)
+
+
+def seed_rides(count, riders, drivers, spread=2.0, seed=0, batch_size=5000):
+    """
+    - Bulk insert rides with pickup points scattered around the center.
+    - bulk_create skips save(), so pickup_cell is set here.
+    """
+
+    rng = random.Random(seed)
+    now = timezone.now()
+    created = 0
+
+    while created < count:
+        rides = []
+        for _ in range(min(batch_size, count - created)):
+            ride = Ride(
+                rider=rng.choice(riders),
+                driver=rng.choice(drivers),
+                pickup_lat=round(CENTER_LAT + rng.uniform(-spread, spread), 6),
+                pickup_long=round(CENTER_LONG + rng.uniform(-spread, spread), 6),
+                dropoff_lat=round(CENTER_LAT + rng.uniform(-spread, spread), 6),
+                dropoff_long=round(CENTER_LONG + rng.uniform(-spread, spread), 6),
+                pickup_time=now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+            )
+            ride.set_pickup_cell()
+            rides.append(ride)
+
+        Ride.objects.bulk_create(rides)
+        created += len(rides)
+
+
+def seed_events(per_ride, batch_size=5000):
+    """
+    - Bulk insert per_ride events for every ride, created now(so they
+    are all in the 24h recent_events window).
+    """
+
+    if not per_ride:
+
+        return
+
+    descriptions = [
+        RideEvent.get_description_by_status(ride_status)
+        for ride_status in Ride.STATUS_TIMESTAMP_FIELDS
+    ]
+    ride_ids = Ride.objects.order_by('id').values_list('id', flat=True)
+    rides_per_batch = max(batch_size // per_ride, 1)
+
+    for start in range(0, ride_ids.count(), rides_per_batch):
+        RideEvent.objects.bulk_create([
+            RideEvent(ride_id=ride_id, description=descriptions[i % len(descriptions)])
+            for ride_id in ride_ids[start:start + rides_per_batch]
+            for i in range(per_ride)
+        ])
+
+
+def seed_dataset(options):
+    riders = seed_users(options['users'])
+    drivers = seed_users(max(options['users'] // 4, 1), role=RideUser.RoleChoices.DRIVER)
+    seed_rides(options['rides'], riders, drivers)
+    seed_events(options['events'])
+
+    return riders, drivers
+
+
+@scenario('distance')
+def bench_distance(options, write):
+    """
+    - Full-table distance sort vs grid prefiltered radius search.
+    """
+
+    radius_km = options['radius_km']
+
+    def full_scan():
+        queryset = calculate_distance(Ride.objects.all(), CENTER_LAT, CENTER_LONG)
+
+        return list(
+            queryset.filter(distance_km__lte=radius_km)
+            .order_by('distance_km', 'id').values_list('id', 'distance_km')
+        )
+
+    def prefiltered():
+        queryset = filter_within_radius(Ride.objects.all(), CENTER_LAT, CENTER_LONG, radius_km)
+
+        return list(queryset.order_by('distance_km', 'id').values_list('id', 'distance_km'))
+
+    def sorted_page():
+        queryset = calculate_distance(Ride.objects.all(), CENTER_LAT, CENTER_LONG)
+
+        return list(queryset.order_by('distance_km')[:20])
+
+    sort_time, _ = timed(sorted_page, options['repeat'])
+    full_time, expected = timed(full_scan, options['repeat'])
+    grid_time, actual = timed(prefiltered, options['repeat'])
+
+    write(f'first page by distance_km: {sort_time * 1000:.1f}ms')
+    write(f'rides within {radius_km}km: {len(actual)} (matches full scan: {actual == expected})')
+    write(f'full scan:   {full_time * 1000:.1f}ms')
+    write(f'grid cells:  {grid_time * 1000:.1f}ms ({full_time / grid_time:.1f}x)')
+
+    return {
+        'sorted_page_ms': sort_time * 1000,
+        'full_scan_ms': full_time * 1000,
+        'grid_ms': grid_time * 1000,
+    }
+
+
+@scenario('serialize')
+def bench_serialize(options, write):
+    """
+    - Fetch and serialize one list page the way RideViewset does.
+    """
+
+    page_size = options['page_size']
+    cutoff = timezone.now() - timedelta(hours=24)
+
+    def fetch():
+        recent_events = Prefetch(
+            'events',
+            queryset=RideEvent.objects.filter(created__gte=cutoff),
+            to_attr='recent_events',
+        )
+        queryset = Ride.objects.select_related('driver', 'rider').prefetch_related(recent_events)
+
+        return list(queryset.order_by('-pickup_time')[:page_size])
+
+    fetch_time, rides = timed(fetch, options['repeat'])
+    serialize_time, _ = timed(lambda: RideSerializer(rides, many=True).data, options['repeat'])
+    fast_time, _ = timed(lambda: FastRideSerializer(rides, many=True).data, options['repeat'])
+
+    write(f'fetch {page_size} rides:     {fetch_time * 1000:.2f}ms')
+    write(f'serialize {page_size} rides: {serialize_time * 1000:.2f}ms')
+    write(f'FastRideSerializer:    {fast_time * 1000:.2f}ms ({serialize_time / fast_time:.1f}x)')
+
+    return {
+        'fetch_ms': fetch_time * 1000,
+        'serialize_ms': serialize_time * 1000,
+        'fast_serialize_ms': fast_time * 1000,
+    }
+
+
+@scenario('estimates')
+def bench_estimates(options, write):
+    """
+    - Trip estimates of every ride: NumPy over the coordinate columns vs
+    a Python loop over the rows.
+    """
+
+    road_factor, speed_kmh = settings.RIDE_ROAD_FACTOR, settings.RIDE_AVERAGE_SPEED_KMH
+    base, per_km, per_minute = settings.RIDE_FARE_BASE, settings.RIDE_FARE_PER_KM, settings.RIDE_FARE_PER_MINUTE
+
+    def python_loop(rows):
+        estimates = []
+        for pickup_lat, pickup_long, dropoff_lat, dropoff_long in rows:
+            trip_km = haversine_km_scalar(pickup_lat, pickup_long, dropoff_lat, dropoff_long)
+            road_km = trip_km * road_factor
+            eta_minutes = road_km / speed_kmh * 60
+            fare = max(base + road_km * per_km + eta_minutes * per_minute, settings.RIDE_FARE_MINIMUM)
+            estimates.append((round(trip_km, 2), round(eta_minutes, 1), round(fare, 2)))
+
+        return estimates
+
+    load_time, rows = timed(lambda: list(Ride.objects.values_list(*COORDINATE_FIELDS)), options['repeat'])
+    total_time, (_, estimates) = timed(lambda: estimate_queryset(Ride.objects.all()), options['repeat'])
+
+    coordinates = list(zip(*rows))
+    numpy_time, _ = timed(lambda: estimate_trips(*coordinates), options['repeat'])
+    loop_time, expected = timed(lambda: python_loop(rows), options['repeat'])
+
+    error = max(
+        (abs(actual - row[0]) for actual, row in zip(estimates['trip_km'].tolist(), expected)),
+        default=0.0,
+    )
+
+    write(f'load {len(rows)} rides:    {load_time * 1000:.1f}ms')
+    write(f'python loop:         {loop_time * 1000:.1f}ms')
+    write(f'numpy:               {numpy_time * 1000:.1f}ms ({loop_time / numpy_time:.1f}x)')
+    write(f'load + numpy:        {total_time * 1000:.1f}ms')
+    write(f'max trip_km error:   {error:.2g}')
+
+    return {
+        'load_ms': load_time * 1000,
+        'python_loop_ms': loop_time * 1000,
+        'numpy_ms': numpy_time * 1000,
+        'load_numpy_ms': total_time * 1000,
+    }
+
+
+@scenario('render')
+def bench_render(options, write):
+    """
+    - Render one full list page(nested users and events) with DRF's
+    JSONRenderer vs ORJSONRenderer, and its size on the wire.
+    """
+
+    page_size = options['page_size']
+    rides = list(Ride.objects.order_by('-pickup_time')[:page_size])
+    RideEvent.objects.bulk_create([
+        RideEvent(ride=ride, description=description)
+        for ride in rides
+        for description in ('Driver is on the way. ', 'Driver is at the pickup point. ')
+    ])
+
+    queryset = Ride.objects.select_related('driver', 'rider').prefetch_related(
+        Prefetch('events', to_attr='recent_events')
+    )
+    rides = list(queryset.filter(id__in=[ride.id for ride in rides]).order_by('-pickup_time'))
+    data = {'count': len(rides), 'next': None, 'previous': None,
+            'results': RideSerializer(rides, many=True).data}
+
+    json_time, content = timed(lambda: JSONRenderer().render(data), options['repeat'])
+    orjson_time, orjson_content = timed(lambda: ORJSONRenderer().render(data), options['repeat'])
+    gzip_time, gzipped = timed(lambda: compress_gzip(orjson_content), options['repeat'])
+
+    write(f'JSONRenderer:   {json_time * 1000:.2f}ms')
+    write(f'ORJSONRenderer: {orjson_time * 1000:.2f}ms ({json_time / orjson_time:.1f}x, '
+          f'same output: {content == orjson_content})')
+    write(f'{page_size} rides: {len(orjson_content)} bytes')
+    write(f'gzip:   {len(gzipped)} bytes in {gzip_time * 1000:.2f}ms')
+    if brotli is not None:
+        brotli_time, compressed = timed(lambda: compress_brotli(orjson_content), options['repeat'])
+        write(f'brotli: {len(compressed)} bytes in {brotli_time * 1000:.2f}ms')
+    else:
+        write('brotli: not installed')
+
+    return {
+        'json_render_ms': json_time * 1000,
+        'orjson_render_ms': orjson_time * 1000,
+        'bytes': len(orjson_content),
+        'gzip_bytes': len(gzipped),
+    }
+
+
+def api_client():
+    """
+    - Authenticated client for an admin created in the benchmark's transaction.
+    """
+
+    from rest_framework.test import APIClient
+
+    admin, _ = RideUser.objects.get_or_create(
+        username='bench_admin',
+        defaults={
+            'role': RideUser.RoleChoices.ADMIN,
+            'is_staff': True,
+            'is_superuser': True,
+        },
+    )
+    client = APIClient(SERVER_NAME='localhost')
+    client.force_authenticate(user=admin)
+
+    return client
+
+
+@scenario('book')
+def bench_book(options, write):
+    """
+    - N single 'book' calls vs one 'bulk_book' call with N rides.
+    """
+
+    client = api_client()
+    riders = list(RideUser.objects.filter(role=RideUser.RoleChoices.RIDER)[:50])
+    drivers = list(RideUser.objects.filter(role=RideUser.RoleChoices.DRIVER)[:50])
+    rng = random.Random(1)
+    pickup_time = timezone.now().isoformat()
+
+    rides = [
+        {
+            'rider': rng.choice(riders).id,
+            'driver': rng.choice(drivers).id,
+            'pickup_lat': str(round(CENTER_LAT + rng.uniform(-1, 1), 6)),
+            'pickup_long': str(round(CENTER_LONG + rng.uniform(-1, 1), 6)),
+            'dropoff_lat': str(round(CENTER_LAT + rng.uniform(-1, 1), 6)),
+            'dropoff_long': str(round(CENTER_LONG + rng.uniform(-1, 1), 6)),
+            'pickup_time': pickup_time,
+        }
+        for _ in range(options['batch'])
+    ]
+
+    def single():
+        for ride in rides:
+            client.post('/api/rides/book/', ride, format='json')
+
+    def bulk():
+        client.post('/api/rides/bulk_book/', rides, format='json')
+
+    single_time, _ = timed(single, options['repeat'])
+    bulk_time, _ = timed(bulk, options['repeat'])
+
+    write(f"{options['batch']} x book:    {single_time * 1000:.1f}ms")
+    write(f"1 x bulk_book:     {bulk_time * 1000:.1f}ms ({single_time / bulk_time:.1f}x)")
+
+    return {
+        'single_book_ms': single_time * 1000,
+        'bulk_book_ms': bulk_time * 1000,
+    }
+
+
+def percentile(sorted_values, percent):
+    # Nearest-rank percentile
+    rank = math.ceil(percent / 100 * len(sorted_values))
+
+    return sorted_values[max(rank, 1) - 1]
+
+
+@scenario('api')
+def bench_api(options, write):
+    """
+    - Send --requests requests to each ride endpoint(real URLs, through
+    the whole middleware/DRF stack) and measure latency percentiles,
+    queries per request and throughput.
+    - The response cache is off unless --cache, every request hits the database.
+    """
+
+    client = api_client()
+    ride = Ride.objects.select_related('rider').order_by('-pickup_time').first()
+    rider = ride.rider
+    driver = RideUser.objects.filter(role=RideUser.RoleChoices.DRIVER).first()
+    booking = {
+        'rider': rider.id,
+        'driver': driver.id,
+        'pickup_lat': str(CENTER_LAT),
+        'pickup_long': str(CENTER_LONG),
+        'dropoff_lat': '14.5547',
+        'dropoff_long': '121.0244',
+        'pickup_time': timezone.now().isoformat(),
+    }
+    location = f'lat={CENTER_LAT}&long={CENTER_LONG}'
+    radius_km = options['radius_km']
+
+    requests = [
+        ('list', 'get', '/api/rides/', None),
+        ('list ?status=', 'get', '/api/rides/?status=PU', None),
+        ('list ?rider__email=', 'get', f'/api/rides/?rider__email={rider.email}', None),
+        ('list ?ordering=pickup_time', 'get', '/api/rides/?ordering=pickup_time', None),
+        ('list ?pagination=cursor', 'get', '/api/rides/?pagination=cursor', None),
+        ('list ?fields=&expand=', 'get', '/api/rides/?fields=id,status,pickup_time&expand=', None),
+        ('list ?ordering=distance_km', 'get', f'/api/rides/?{location}&ordering=distance_km', None),
+        ('list ?radius_km=', 'get',
+            f'/api/rides/?{location}&radius_km={radius_km}&ordering=distance_km', None),
+        ('retrieve', 'get', f'/api/rides/{ride.id}/', None),
+        ('history', 'get', f'/api/rides/{ride.id}/history/', None),
+        ('book', 'post', '/api/rides/book/', booking),
+        ('update_status', 'post', f'/api/rides/{ride.id}/update_status/', {'status': Ride.StatusChoices.ENROUTE}),
+        ('events create', 'post', '/api/events/', {'ride_id': ride.id, 'description': 'Benchmark.'}),
+    ]
+
+    cache_settings = nullcontext() if options['cache'] else override_settings(RESPONSE_CACHE_TIMEOUT=0)
+    results = {}
+    write(f"{'endpoint':<30}{'p50':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'req/s':>9}")
+
+    with cache_settings:
+        for name, method, url, data in requests:
+            send = getattr(client, method)
+            # Warm up: first-request imports, statement caches
+            response = send(url, data, format='json')
+            if response.status_code >= 400:
+                write(f'{name}: {response.status_code} {response.content[:200]!r}')
+                continue
+
+            timings = []
+            queries = 0
+            start = time.perf_counter()
+            for _ in range(options['requests']):
+                with CaptureQueriesContext(connection) as captured:
+                    request_start = time.perf_counter()
+                    send(url, data, format='json')
+                    timings.append(time.perf_counter() - request_start)
+                queries += len(captured.captured_queries)
+            elapsed = time.perf_counter() - start
+
+            timings.sort()
+            results[name] = {
+                'p50_ms': percentile(timings, 50) * 1000,
+                'p95_ms': percentile(timings, 95) * 1000,
+                'p99_ms': percentile(timings, 99) * 1000,
+                'queries': queries / len(timings),
+                'req_per_s': len(timings) / elapsed,
+            }
+            result = results[name]
+            write(
+                f"{name:<30}{result['p50_ms']:>7.1f}ms{result['p95_ms']:>7.1f}ms"
+                f"{result['p99_ms']:>7.1f}ms{result['queries']:>9.1f}{result['req_per_s']:>9.1f}"
+            )
+
+    return results
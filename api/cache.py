@@ -0,0 +1,173 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+from .metrics import response_cache_requests
+
+# Hard cap on RESPONSE_CACHE_TIMEOUT: cached rides keep showing events that
+# already left the 24h recent_events window for at most this long.
+MAX_TIMEOUT = 300
+
+
+def get_response_cache():
+    return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def get_cache_stats():
+    """
+    - Hits/misses of this process since it started, all processes'
+    are at /metrics(api_response_cache_requests_total).
+    """
+
+    stats = {
+        'hits': response_cache_requests.get(result='hit'),
+        'misses': response_cache_requests.get(result='miss'),
+    }
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / total if total else 0.0
+
+    return stats
+
+
+def get_table_versions(tables):
+    """
+    - Current version counter of each table.
+    - Missing counters start from the current time, so an evicted counter
+    never goes back to a version that is still cached.
+    """
+
+    cache = get_response_cache()
+    keys = [f'response_cache_version:{table}' for table in tables]
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+
+    return [versions[key] for key in keys]
+
+
+async def aget_table_versions(tables):
+    """
+    - get_table_versions() with the cache's async API.
+    """
+
+    cache = get_response_cache()
+    keys = [f'response_cache_version:{table}' for table in tables]
+    versions = await cache.aget_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), None)
+            versions[key] = await cache.aget(key)
+
+    return [versions[key] for key in keys]
+
+
+def bump_table_versions(*tables):
+    """
+    - Invalidate every cached response that depends on these tables,
+    once the current transaction commits.
+    """
+
+    def bump():
+        cache = get_response_cache()
+        for table in tables:
+            key = f'response_cache_version:{table}'
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.add(key, time.time_ns(), None)
+
+    transaction.on_commit(bump)
+
+
+class CachedResponseMixin:
+    """
+    - Caches the data of list/retrieve responses, keyed on the action,
+    the normalized query params and the versions of cache_tables.
+    - Writes to those tables bump their version(bump_table_versions),
+    which makes every older entry unreachable.
+    """
+    cache_tables = ()
+
+    def get_response_cache_key(self, request, *args, **kwargs):
+        versions = get_table_versions(self.cache_tables)
+
+        return self.make_response_cache_key(versions, request, *args, **kwargs)
+
+    def make_response_cache_key(self, versions, request, *args, **kwargs):
+        params = sorted(
+            (key, sorted(value for value in values if value != ''))
+            for key, values in request.query_params.lists()
+        )
+        params = [(key, values) for key, values in params if values]
+        digest = hashlib.sha1(repr((args, sorted(kwargs.items()), params)).encode()).hexdigest()
+        versions = '.'.join(str(version) for version in versions)
+
+        return f'response_cache:{self.basename}:{self.action}:{digest}:{versions}'
+
+    def get_response_cache_timeout(self):
+        return min(getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 0), MAX_TIMEOUT)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        timeout = self.get_response_cache_timeout()
+        if not timeout:
+            return handler(request, *args, **kwargs)
+
+        cache = get_response_cache()
+        key = self.get_response_cache_key(request, *args, **kwargs)
+        data = cache.get(key)
+
+        if data is not None:
+            response_cache_requests.inc(result='hit')
+
+            return Response(data, headers={'X-Cache': 'HIT'})
+
+        response_cache_requests.inc(result='miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, timeout)
+        response['X-Cache'] = 'MISS'
+
+        return response
+
+    async def acached_response(self, get_data, request, *args, **kwargs):
+        """
+        - cached_response() for async views, get_data is a coroutine
+        function returning the response data.
+        - Same keys as cached_response(), sync and async views share entries.
+        - Returns (data, X-Cache header or None when caching is off).
+        """
+
+        timeout = self.get_response_cache_timeout()
+        if not timeout:
+
+            return await get_data(), None
+
+        cache = get_response_cache()
+        versions = await aget_table_versions(self.cache_tables)
+        key = self.make_response_cache_key(versions, request, *args, **kwargs)
+        data = await cache.aget(key)
+
+        if data is not None:
+            response_cache_requests.inc(result='hit')
+
+            return data, 'HIT'
+
+        response_cache_requests.inc(result='miss')
+        data = await get_data()
+        await cache.aset(key, data, timeout)
+
+        return data, 'MISS'
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,97 @@
+import math
+
+import numpy as np
+from django.conf import settings
+
+# Mean earth radius(IUGG)
+EARTH_RADIUS_KM = 6371.0088
+
+ESTIMATE_FIELDS = ('trip_km', 'eta_minutes', 'fare')
+COORDINATE_FIELDS = ('pickup_lat', 'pickup_long', 'dropoff_lat', 'dropoff_long')
+
+
+def haversine_km(lat1, long1, lat2, long2):
+    """
+    - Great-circle distance in km, element-wise over NumPy arrays(or scalars).
+    """
+
+    lat1, long1, lat2, long2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, long1, lat2, long2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+
+    # clip: rounding can put a just over 1 for antipodal points.
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_km_scalar(lat1, long1, lat2, long2):
+    """
+    - Plain math reference of haversine_km, for one pair of points.
+    """
+
+    lat1, long1, lat2, long2 = map(math.radians, (lat1, long1, lat2, long2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((long2 - long1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(max(a, 0.0), 1.0)))
+
+
+def estimate_trips(pickup_lat, pickup_long, dropoff_lat, dropoff_long):
+    """
+    - Trip length(pick-up to drop-off), ETA and fare of every ride at once,
+    as arrays: {'trip_km': ..., 'eta_minutes': ..., 'fare': ...}
+    - Straight-line distance times RIDE_ROAD_FACTOR for the road distance,
+    driven at RIDE_AVERAGE_SPEED_KMH. See: ride/settings.py
+    """
+
+    trip_km = haversine_km(pickup_lat, pickup_long, dropoff_lat, dropoff_long)
+    road_km = trip_km * getattr(settings, 'RIDE_ROAD_FACTOR', 1.3)
+    eta_minutes = road_km / getattr(settings, 'RIDE_AVERAGE_SPEED_KMH', 20) * 60
+    fare = (
+        getattr(settings, 'RIDE_FARE_BASE', 45)
+        + road_km * getattr(settings, 'RIDE_FARE_PER_KM', 15)
+        + eta_minutes * getattr(settings, 'RIDE_FARE_PER_MINUTE', 2)
+    )
+    fare = np.maximum(fare, getattr(settings, 'RIDE_FARE_MINIMUM', 75))
+
+    return {
+        'trip_km': np.round(trip_km, 2),
+        'eta_minutes': np.round(eta_minutes, 1),
+        'fare': np.round(fare, 2),
+    }
+
+
+def estimate_rides(rides):
+    """
+    - Sets ride.estimate({'trip_km', 'eta_minutes', 'fare'}) on every ride
+    already loaded, in one vectorized pass, see: RideListSerializer
+    """
+
+    rides = list(rides)
+    if not rides:
+
+        return rides
+
+    coordinates = np.array(
+        [(ride.pickup_lat, ride.pickup_long, ride.dropoff_lat, ride.dropoff_long) for ride in rides],
+        dtype=np.float64,
+    )
+    estimates = estimate_trips(*coordinates.T)
+    # tolist(): plain floats for the renderers
+    columns = [estimates[field].tolist() for field in ESTIMATE_FIELDS]
+
+    for ride, values in zip(rides, zip(*columns)):
+        ride.estimate = dict(zip(ESTIMATE_FIELDS, values))
+
+    return rides
+
+
+def estimate_queryset(queryset, *fields):
+    """
+    - Estimates of every ride of a queryset from one values_list() pass
+    over the coordinate columns(and fields, ie: 'id').
+    - Returns ([values of each field], {'trip_km': array, ...}).
+    """
+
+    rows = list(queryset.values_list(*COORDINATE_FIELDS, *fields))
+    columns = list(zip(*rows)) or [()] * (len(COORDINATE_FIELDS) + len(fields))
+    coordinates = [np.array(column, dtype=np.float64) for column in columns[:len(COORDINATE_FIELDS)]]
+
+    return columns[len(COORDINATE_FIELDS):], estimate_trips(*coordinates)
@@ -0,0 +1,75 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# QueryStats of the current request/blocks(nested), see: track_queries
+_query_stats = ContextVar('query_stats', default=())
+
+
+class QueryStats:
+    """
+    - Number of queries, total time and slowest statement of a request
+    (QueryInstrumentationMiddleware) or a block(track_queries).
+    """
+
+    def __init__(self, keep_statements=False):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_duration = 0.0
+        self.slowest_sql = ''
+        self.statements = [] if keep_statements else None
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        if duration >= self.slowest_duration:
+            self.slowest_duration = duration
+            self.slowest_sql = sql
+        if self.statements is not None:
+            self.statements.append(sql)
+
+
+def record_query(execute, sql, params, many, context):
+    # connection.execute_wrappers entry, installed on every connection.
+    active_stats = _query_stats.get()
+    if not active_stats:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for stats in active_stats:
+            stats.add(sql, duration)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    - connection_created receiver(ApiConfig.ready).
+    - Installed on the connection instead of per request, so queries the
+    async ORM runs in its worker thread are counted too: the stats follow
+    the request through the context variable.
+    """
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def track_queries(keep_statements=False):
+    """
+    - Count the queries run inside the block:
+        with track_queries() as stats:
+            ...
+        stats.count, stats.duration, stats.slowest_sql
+    - Blocks can be nested(ie: a test around a request), each counts
+    every query run inside it.
+    """
+
+    stats = QueryStats(keep_statements)
+    token = _query_stats.set((*_query_stats.get(), stats))
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ReportJob
+from .reports import (
+    DRIVER_TRIPS_COLUMNS,
+    RIDE_ESTIMATE_COLUMNS,
+    get_date_range,
+    iter_driver_trips_over_1_hour,
+    iter_ride_estimates,
+    write_report,
+)
+from .routers import read_from_replica
+
+logger = logging.getLogger('api.jobs')
+
+
+def driver_trips_rows(since, until, params):
+    return iter_driver_trips_over_1_hour(since, until, use_stats=not params.get('raw'))
+
+
+def ride_estimates_rows(since, until, params):
+    return iter_ride_estimates(since, until)
+
+
+# kind -> (columns, rows(since, until, params)), same as the export commands.
+REPORTS = {
+    ReportJob.KindChoices.DRIVER_TRIPS: (DRIVER_TRIPS_COLUMNS, driver_trips_rows),
+    ReportJob.KindChoices.RIDE_ESTIMATES: (RIDE_ESTIMATE_COLUMNS, ride_estimates_rows),
+}
+
+
+def get_reports_dir():
+    return Path(getattr(settings, 'REPORTS_DIR', settings.BASE_DIR / 'reports'))
+
+
+def get_job_key(kind, params):
+    payload = json.dumps({'kind': kind, **params}, sort_keys=True, default=str)
+
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def enqueue_report(kind, params, user_id=None):
+    """
+    - Queue a report, unless the same one(kind and params) is already
+    queued or running: requests sent meanwhile share that job.
+    - Returns (job, created).
+    """
+
+    key = get_job_key(kind, params)
+    active = ReportJob.objects.filter(key=key, status__in=ReportJob.ACTIVE_STATUSES)
+
+    job = active.first()
+    if job is not None:
+
+        return job, False
+
+    try:
+        with transaction.atomic():
+            return ReportJob.objects.create(kind=kind, params=params, key=key, requested_by_id=user_id), True
+    except IntegrityError:
+        # Created by a concurrent request since, see: report_job_active_key_unique
+        job = ReportJob.objects.filter(key=key).order_by('-created', '-id').first()
+        if job is None:
+            raise
+
+        return job, False
+
+
+def requeue_stale_jobs():
+    """
+    - Jobs running for more than REPORT_JOB_TIMEOUT seconds are assumed
+    lost(ie: worker killed) and queued again.
+    """
+
+    oldest = timezone.now() - timedelta(seconds=getattr(settings, 'REPORT_JOB_TIMEOUT', 3600))
+
+    return ReportJob.objects.filter(
+        status=ReportJob.StatusChoices.RUNNING,
+        started__lt=oldest,
+    ).update(status=ReportJob.StatusChoices.QUEUED, worker='', started=None)
+
+
+def claim_job(worker):
+    """
+    - Take the oldest queued job for worker, None when there is none.
+    - The UPDATE only matches while the job is still queued, so two
+    workers never run the same job(no SELECT ... FOR UPDATE, works on SQLite).
+    """
+
+    queued = ReportJob.objects.filter(status=ReportJob.StatusChoices.QUEUED)
+
+    while True:
+        job = queued.order_by('created', 'id').first()
+        if job is None:
+
+            return None
+
+        started = timezone.now()
+        claimed = queued.filter(id=job.id).update(
+            status=ReportJob.StatusChoices.RUNNING,
+            started=started,
+            worker=worker,
+        )
+        if claimed:
+            job.status, job.started, job.worker = ReportJob.StatusChoices.RUNNING, started, worker
+
+            return job
+
+
+def get_owned_job(job):
+    """
+    - The job, only while still claimed by this run: requeue_stale_jobs
+    may have given it to another worker meanwhile.
+    """
+
+    return ReportJob.objects.filter(
+        id=job.id,
+        status=ReportJob.StatusChoices.RUNNING,
+        worker=job.worker,
+        started=job.started,
+    )
+
+
+def run_job(job):
+    """
+    - Write the report to REPORTS_DIR, then mark the job done(or failed).
+    - Written to a temporary name first(one per worker thread): a download
+    never gets half a file.
+    - A job requeued meanwhile(see: requeue_stale_jobs) is left to the
+    worker that has it now, the file is discarded.
+    """
+
+    columns, get_rows = REPORTS[job.kind]
+    params = job.params
+    directory = get_reports_dir()
+    extension = params.get('format', 'xlsx')
+    name = f"{job.kind}-{job.id}.{extension}"
+    partial = directory / f"{job.kind}-{job.id}.{os.getpid()}-{threading.get_ident()}.partial.{extension}"
+    owned = get_owned_job(job)
+
+    try:
+        since, until = get_date_range(params.get('month'), params.get('since'), params.get('until'))
+        directory.mkdir(parents=True, exist_ok=True)
+        # A long read, kept off the primary when there is a replica.
+        with read_from_replica():
+            job.rows = write_report(get_rows(since, until, params), partial, columns)
+
+        if not owned.exists():
+            logger.warning("Report job %s was queued again, discarding %s", job.id, partial.name)
+            partial.unlink(missing_ok=True)
+
+            return job
+
+        os.replace(partial, directory / name)
+    except Exception as e:
+        logger.exception("Report job %s failed", job.id)
+        partial.unlink(missing_ok=True)
+        job.status = ReportJob.StatusChoices.FAILED
+        job.error = f'{type(e).__name__}: {e}'
+    else:
+        logger.info("Report job %s done: %s(%s rows)", job.id, name, job.rows)
+        job.status = ReportJob.StatusChoices.DONE
+        job.file = name
+
+    job.finished = timezone.now()
+    fields = ['status', 'file', 'rows', 'error', 'finished']
+    if not owned.update(**{field: getattr(job, field) for field in fields}):
+        logger.warning("Report job %s was queued again, not marked %s", job.id, job.get_status_display())
+
+    return job
+
+
+def work(worker, stop=None, once=False, poll=2.0):
+    """
+    - Worker loop of 'manage.py run_report_jobs': run queued jobs one at a
+    time, wait poll seconds when there is none.
+    - once: return when the queue is empty instead.
+    """
+
+    stop = stop or threading.Event()
+
+    while not stop.is_set():
+        try:
+            job = claim_job(worker)
+        except DatabaseError:
+            # ie: 'database is locked' on SQLite, retried after poll
+            logger.exception("Worker %s couldn't claim a job", worker)
+            stop.wait(poll)
+            continue
+
+        if job is not None:
+            run_job(job)
+            continue
+
+        if once:
+            break
+
+        requeue_stale_jobs()
+        stop.wait(poll)
@@ -0,0 +1,238 @@
+import heapq
+import math
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import DriverLocation, Ride, RideUser
+from .querysets import GLOBE_KM_DEGREE
+
+# ~1.1km cells: a city-sized search stays within a few rings.
+CELL_DEGREES = 0.01
+
+# A driver with a ride in these statuses isn't available.
+BUSY_STATUSES = (Ride.StatusChoices.PICKUP, Ride.StatusChoices.ENROUTE)
+
+# Pings are re-read this far back on every sync: a ping committed late
+# with an older timestamp is still picked up.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+def get_cell(lat, long):
+    return int(math.floor(lat / CELL_DEGREES)), int(math.floor(long / CELL_DEGREES))
+
+
+class DriverLocationIndex:
+    """
+    - In-memory grid of the drivers' last known locations for
+    nearest-driver lookups without SQL: driver id -> (lat, long, updated)
+    and cell -> driver ids.
+    - Built from DriverLocation once, then kept up to date incrementally:
+    pings of this process are applied right away(update), each lookup
+    first reads the pings saved since the last one(sync), so pings
+    handled by other processes are seen too.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def update(self, driver_id, lat, long, updated):
+        with self.lock:
+            self._update(driver_id, lat, long, updated)
+
+    def _update(self, driver_id, lat, long, updated):
+        current = self.locations.get(driver_id)
+        if current is not None:
+            # Older than what the index has(ie: read again by sync)
+            if current[2] > updated:
+                return
+
+            cell = get_cell(current[0], current[1])
+            drivers = self.cells.get(cell)
+            if drivers is not None:
+                drivers.discard(driver_id)
+                if not drivers:
+                    del self.cells[cell]
+
+        cell = get_cell(lat, long)
+        self.locations[driver_id] = (lat, long, updated)
+        self.cells.setdefault(cell, set()).add(driver_id)
+
+        # Rows/columns with drivers so far, bounds the ring search.
+        if self.bounds is None:
+            self.bounds = (cell[0], cell[0], cell[1], cell[1])
+        else:
+            min_row, max_row, min_column, max_column = self.bounds
+            self.bounds = (
+                min(min_row, cell[0]), max(max_row, cell[0]),
+                min(min_column, cell[1]), max(max_column, cell[1]),
+            )
+
+    def sync(self):
+        """
+        - Apply the pings saved since the last sync, every recent location
+        the first time.
+        """
+
+        now = timezone.now()
+        if self.synced is None:
+            since = now - timedelta(seconds=get_max_age())
+        else:
+            since = self.synced - SYNC_OVERLAP
+
+        rows = DriverLocation.objects.filter(updated__gte=since).values_list(
+            'driver_id', 'lat', 'long', 'updated'
+        )
+
+        with self.lock:
+            for row in rows:
+                self._update(*row)
+            if self.synced is None or now > self.synced:
+                self.synced = now
+
+    def clear(self):
+        with self.lock:
+            self.locations = {}
+            self.cells = {}
+            self.bounds = None
+            self.synced = None
+
+    def nearest(self, lat, long, limit, max_km):
+        """
+        - Up to limit (distance_km, driver id, (lat, long, updated)) within
+        max_km, nearest first.
+        - Same equirectangular distance as calculate_distance(api/querysets.py).
+        - Scans the grid in rings around the point, stops once no driver in
+        the next ring can be nearer than the ones found.
+        """
+
+        oldest = timezone.now() - timedelta(seconds=get_max_age())
+        lat_km = GLOBE_KM_DEGREE
+        long_km = GLOBE_KM_DEGREE * math.cos(math.radians(lat))
+        # Distance covered by one ring of cells, in the narrowest direction
+        ring_km = CELL_DEGREES * min(lat_km, long_km)
+
+        row, column = get_cell(lat, long)
+        max_rings = int(max_km / ring_km) + 1 if ring_km > 0 else 0
+        # kept as (-distance, driver id): heap[0] is the farthest of the best
+        best = []
+
+        with self.lock:
+            # Past the occupied cells a ring only finds empty cells.
+            max_rings = min(max_rings, self.get_max_ring(row, column))
+
+            for ring in range(max_rings + 1):
+                for cell in self.get_ring(row, column, ring):
+                    for driver_id in self.cells.get(cell, ()):
+                        driver_lat, driver_long, updated = self.locations[driver_id]
+                        if updated < oldest:
+                            continue
+
+                        distance = math.hypot((driver_lat - lat) * lat_km, (driver_long - long) * long_km)
+                        if distance > max_km:
+                            continue
+
+                        if len(best) < limit:
+                            heapq.heappush(best, (-distance, driver_id))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, driver_id))
+
+                # Everything outside the rings scanned is at least this far.
+                if len(best) >= limit and -best[0][0] <= ring * ring_km:
+                    break
+
+            return sorted(
+                (-distance, driver_id, self.locations[driver_id])
+                for distance, driver_id in best
+            )
+
+    def get_max_ring(self, row, column):
+        if self.bounds is None:
+
+            return 0
+
+        min_row, max_row, min_column, max_column = self.bounds
+
+        return max(row - min_row, max_row - row, column - min_column, max_column - column, 0)
+
+    def get_ring(self, row, column, ring):
+        if ring == 0:
+            yield row, column
+
+            return
+
+        for offset in range(-ring, ring + 1):
+            yield row - ring, column + offset
+            yield row + ring, column + offset
+        for offset in range(-ring + 1, ring):
+            yield row + offset, column - ring
+            yield row + offset, column + ring
+
+
+driver_index = DriverLocationIndex()
+
+
+def get_max_age():
+    # Drivers that haven't pinged for this long are left out.
+    return getattr(settings, 'DRIVER_LOCATION_MAX_AGE', 300)
+
+
+def save_driver_location(driver_id, lat, long):
+    """
+    - Ping: one UPDATE for drivers that pinged before.
+    - Returns the timestamp, or None if driver_id isn't a driver.
+    """
+
+    updated = timezone.now()
+    saved = DriverLocation.objects.filter(driver_id=driver_id).update(lat=lat, long=long, updated=updated)
+    if not saved:
+        if not RideUser.objects.filter(id=driver_id, role=RideUser.RoleChoices.DRIVER).exists():
+
+            return None
+
+        DriverLocation.objects.update_or_create(
+            driver_id=driver_id,
+            defaults={'lat': lat, 'long': long, 'updated': updated},
+        )
+
+    driver_index.update(driver_id, lat, long, updated)
+
+    return updated
+
+
+def nearest_available_drivers(lat, long, k, max_km):
+    """
+    - The k nearest active drivers without a ride in BUSY_STATUSES,
+    as (distance_km, RideUser, (lat, long, updated)).
+    - The index gives the nearest candidates, one query keeps the
+    available ones. Asks the index for more while too many are busy.
+    """
+
+    driver_index.sync()
+
+    limit = k * 4
+    while True:
+        candidates = driver_index.nearest(lat, long, limit, max_km)
+        busy = Ride.objects.filter(driver=OuterRef('pk'), status__in=BUSY_STATUSES)
+        drivers = RideUser.objects.filter(
+            id__in=[driver_id for _, driver_id, _ in candidates],
+            role=RideUser.RoleChoices.DRIVER,
+            is_active=True,
+        ).exclude(Exists(busy)).in_bulk()
+
+        available = [
+            (distance, drivers[driver_id], location)
+            for distance, driver_id, location in candidates
+            if driver_id in drivers
+        ]
+
+        # Fewer candidates than asked: there are no more within max_km.
+        if len(available) >= k or len(candidates) < limit:
+
+            return available[:k]
+
+        limit *= 4
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.cache import bump_table_versions
+from api.models import RideEvent, RideEventArchive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move RideEvents older than --days days to the monthly RideEventArchive, "
+        "in batches. Archived events stay readable at 'api/rides/<id>/history/'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only count the events that would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        # Rides show the last 24h of events(recent_events), keep them hot.
+        if options['days'] < 1:
+            raise CommandError("--days must be at least 1.")
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        events = RideEvent.objects.filter(created__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'{events.count()} event(s) created before {cutoff:%Y-%m-%d %H:%M} to archive.')
+
+            return
+
+        archived = 0
+        while True:
+            # Short transactions: writers on RideEvent are never blocked for long.
+            batch = list(events.order_by('created', 'id')[:options['batch_size']])
+            if not batch:
+                break
+
+            archived += RideEventArchive.archive(batch)
+            self.stdout.write(f'{archived} event(s) archived...')
+
+        if archived:
+            bump_table_versions('rideevent')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{archived} event(s) created before {cutoff:%Y-%m-%d %H:%M} archived.'
+        ))
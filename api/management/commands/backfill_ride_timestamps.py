@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Ride, RideEvent, RideEventArchive, DriverMonthlyStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill Ride.pickup_started_at/dropoff_at/completed_at from the latest "
+        "matching RideEvent of each ride, archived events included."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--overwrite',
+            action='store_true',
+            help="Recompute timestamps that are already set.",
+        )
+
+    def handle(self, *args, **options):
+        bounds = Ride.objects.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.stdout.write('No rides to backfill.')
+
+            return
+
+        batch_size = options['batch_size']
+
+        for ride_status, field in Ride.STATUS_TIMESTAMP_FIELDS.items():
+            # Events written by update_status/book start with the description
+            prefix = RideEvent.get_description_by_status(ride_status).strip()
+            latest_event = [
+                Subquery(
+                    model.objects
+                    .filter(ride=OuterRef('pk'), description__startswith=prefix)
+                    .order_by('-created')
+                    .values('created')[:1]
+                )
+                # Archived events are always older than the hot ones
+                for model in (RideEvent, RideEventArchive)
+            ]
+
+            # Trip durations change: the rollup months before and after are dirty.
+            changes_duration = field in ('pickup_started_at', 'dropoff_at')
+
+            updated = dirty = 0
+            for start in range(bounds['first'], bounds['last'] + 1, batch_size):
+                rides = Ride.objects.filter(id__gte=start, id__lt=start + batch_size)
+                if not options['overwrite']:
+                    rides = rides.filter(**{f'{field}__isnull': True})
+
+                if not changes_duration:
+                    updated += rides.update(**{field: Coalesce(*latest_event)})
+                    continue
+
+                batch = Ride.objects.filter(id__in=list(rides.values_list('id', flat=True)))
+                dirty += DriverMonthlyStats.mark_rides_dirty(batch)
+                updated += batch.update(**{field: Coalesce(*latest_event)})
+                dirty += DriverMonthlyStats.mark_rides_dirty(batch)
+
+            self.stdout.write(f'{field}: {updated} ride(s) processed.')
+            if dirty:
+                self.stdout.write(f'{field}: driver months marked dirty, run rebuild_driver_stats.')
@@ -0,0 +1,116 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.benchmarks import SCENARIOS, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway dataset and time the given scenarios. "
+        "Everything is rolled back afterwards."
+    )
+
+    # Options that change the numbers, saved with the results
+    dataset_options = ('users', 'rides', 'events', 'repeat', 'requests', 'cache', 'page_size', 'batch')
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"One or more of: {', '.join(SCENARIOS)}")
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--rides', type=int, default=100000)
+        parser.add_argument('--events', type=int, default=0, help="Events per ride")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=50, help="Requests per endpoint(api)")
+        parser.add_argument('--cache', action='store_true', help="Keep the response cache on(api)")
+        parser.add_argument('--radius-km', type=float, default=5.0)
+        parser.add_argument('--page-size', type=int, default=40)
+        parser.add_argument('--batch', type=int, default=500, help="Rides per bulk request")
+        parser.add_argument('--output', help="Save the results as JSON")
+        parser.add_argument('--compare', help="JSON results of a previous run to compare with")
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=10.0,
+            help="Percent worse than --compare to report as a regression",
+        )
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        results = {}
+        with transaction.atomic():
+            self.stdout.write(f"Seeding {options['rides']} rides...")
+            seed_dataset(options)
+
+            for name in names:
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                results[name] = SCENARIOS[name](options, self.stdout.write) or {}
+
+            transaction.set_rollback(True)
+
+        dataset = {key: options[key] for key in self.dataset_options}
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({
+                    'created': timezone.now().isoformat(),
+                    'options': dataset,
+                    'results': results,
+                }, file, indent=2)
+            self.stdout.write(f"Results saved to {options['output']}")
+
+        if baseline is not None:
+            self.compare(baseline, dataset, results, options['threshold'])
+
+    def compare(self, baseline, dataset, results, threshold):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"compared with {baseline.get('created', '?')}"))
+        if baseline.get('options', dataset) != dataset:
+            self.stdout.write(self.style.WARNING(
+                f"Different options: {baseline.get('options')}, the numbers may not be comparable."
+            ))
+
+        regressions = 0
+
+        for key, old, new in self.pair_metrics(baseline.get('results', {}), results):
+            lower_is_better = key.endswith(('_ms', 'queries'))
+            if not lower_is_better and not key.endswith('_per_s'):
+                continue
+            if not old:
+                continue
+
+            change = (new - old) / old * 100
+            if abs(change) <= threshold:
+                continue
+
+            # Only changes over the threshold are listed
+            line = f'{key}: {old:.2f} -> {new:.2f} ({change:+.1f}%)'
+            if (change > 0) == lower_is_better:
+                regressions += 1
+                self.stdout.write(self.style.WARNING(f'{line}  <- regression'))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if regressions:
+            self.stdout.write(self.style.WARNING(f'{regressions} regression(s) over {threshold}%.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'No regressions over {threshold}%.'))
+
+    def pair_metrics(self, old, new, prefix=''):
+        # (dotted key, old, new) of every number in both results
+        for key, value in new.items():
+            if key not in old:
+                continue
+
+            if isinstance(value, dict) and isinstance(old[key], dict):
+                yield from self.pair_metrics(old[key], value, f'{prefix}{key}.')
+            elif isinstance(value, (int, float)) and isinstance(old[key], (int, float)):
+                yield f'{prefix}{key}', old[key], value
@@ -0,0 +1,189 @@
+import logging
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import override_settings
+from django.utils import timezone
+
+from api.benchmarks import CENTER_LAT, CENTER_LONG, percentile, seed_rides, seed_users
+from api.models import Ride, RideUser
+
+PROFILES = ('default', 'tuned')
+
+
+class Command(BaseCommand):
+    help = (
+        "Run writer threads(book/update_status) and reader threads(list/retrieve) "
+        "against a throwaway SQLite file, with SQLite's defaults and with the "
+        "SQLITE_TUNING profile(see: api/sqlite.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('profiles', nargs='*', help=f"One or more of: {', '.join(PROFILES)}")
+        parser.add_argument('--writers', type=int, default=4, help="Threads booking rides and updating their status")
+        parser.add_argument('--readers', type=int, default=8, help="Threads listing and retrieving rides")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per profile")
+        parser.add_argument('--rides', type=int, default=2000, help="Rides seeded before the run")
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or list(PROFILES)
+        unknown = [profile for profile in profiles if profile not in PROFILES]
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(unknown)}")
+        if connection.vendor != 'sqlite':
+            raise CommandError("The database isn't SQLite.")
+
+        for profile in profiles:
+            self.stdout.write(self.style.MIGRATE_HEADING(profile))
+            with tempfile.TemporaryDirectory() as directory:
+                with self.use_database(Path(directory) / 'benchmark.sqlite3', profile == 'tuned'):
+                    admin = self.seed(options)
+                    self.report(self.run(admin, options), options['duration'])
+
+    @contextmanager
+    def use_database(self, path, tuned):
+        """
+        - Point 'default' at a new SQLite file for the block, every thread's
+        connection is created from the same settings dict.
+        """
+
+        settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+        name = settings_dict['NAME']
+        connections.close_all()
+        settings_dict['NAME'] = str(path)
+        try:
+            # No replica routing, no response cache: every request hits the file.
+            with override_settings(SQLITE_TUNING=tuned, DATABASE_ROUTERS=[], RESPONSE_CACHE_TIMEOUT=0):
+                call_command('migrate', verbosity=0, interactive=False)
+                yield
+        finally:
+            connections.close_all()
+            settings_dict['NAME'] = name
+
+    def seed(self, options):
+        riders = seed_users(50)
+        drivers = seed_users(20, role=RideUser.RoleChoices.DRIVER)
+        seed_rides(options['rides'], riders, drivers)
+
+        return RideUser.objects.create(
+            username='bench_admin',
+            role=RideUser.RoleChoices.ADMIN,
+            is_staff=True,
+            is_superuser=True,
+        )
+
+    def run(self, admin, options):
+        from rest_framework.test import APIClient
+
+        ride_ids = list(Ride.objects.values_list('id', flat=True))
+        riders = list(RideUser.objects.filter(role=RideUser.RoleChoices.RIDER).values_list('id', flat=True))
+        drivers = list(RideUser.objects.filter(role=RideUser.RoleChoices.DRIVER).values_list('id', flat=True))
+        deadline = time.perf_counter() + options['duration']
+        results = {}
+        lock = threading.Lock()
+
+        def send(client, name, method, url, data=None):
+            start = time.perf_counter()
+            try:
+                response = getattr(client, method)(url, data, format='json')
+                error = None if response.status_code < 400 else f'HTTP {response.status_code}'
+            except Exception as e:
+                response, error = None, f'{type(e).__name__}: {e}'
+            duration = time.perf_counter() - start
+
+            with lock:
+                result = results.setdefault(name, {'timings': [], 'errors': {}})
+                if error is None:
+                    result['timings'].append(duration)
+                else:
+                    result['errors'][error] = result['errors'].get(error, 0) + 1
+
+            return response if error is None else None
+
+        def writer(seed):
+            rng = random.Random(seed)
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user=admin)
+
+            while time.perf_counter() < deadline:
+                response = send(client, 'book', 'post', '/api/rides/book/', {
+                    'rider': rng.choice(riders),
+                    'driver': rng.choice(drivers),
+                    'pickup_lat': str(CENTER_LAT),
+                    'pickup_long': str(CENTER_LONG),
+                    'dropoff_lat': '14.5547',
+                    'dropoff_long': '121.0244',
+                    'pickup_time': timezone.now().isoformat(),
+                })
+                if response is None:
+                    continue
+
+                ride_id = response.data['data']['id']
+                for ride_status in (Ride.StatusChoices.ENROUTE, Ride.StatusChoices.DROPOFF):
+                    send(client, 'update_status', 'post', f'/api/rides/{ride_id}/update_status/', {
+                        'status': ride_status,
+                    })
+
+        def reader(seed):
+            rng = random.Random(seed)
+            client = APIClient(SERVER_NAME='localhost')
+            client.force_authenticate(user=admin)
+
+            while time.perf_counter() < deadline:
+                send(client, 'list', 'get', '/api/rides/')
+                send(client, 'retrieve', 'get', f'/api/rides/{rng.choice(ride_ids)}/')
+
+        def thread(target, seed):
+            try:
+                target(seed)
+            finally:
+                # Connections are per thread
+                connection.close()
+
+        threads = [
+            threading.Thread(target=thread, args=(writer, i))
+            for i in range(options['writers'])
+        ] + [
+            threading.Thread(target=thread, args=(reader, options['writers'] + i))
+            for i in range(options['readers'])
+        ]
+        # Slow requests are expected here, see: QUERY_LOG_SLOW_MS
+        query_logger = logging.getLogger('api.queries')
+        disabled, query_logger.disabled = query_logger.disabled, True
+        try:
+            for worker in threads:
+                worker.start()
+            for worker in threads:
+                worker.join()
+        finally:
+            query_logger.disabled = disabled
+
+        return results
+
+    def report(self, results, duration):
+        self.stdout.write(f"{'request':<16}{'ok':>8}{'errors':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'ok/s':>9}")
+
+        for name in ('book', 'update_status', 'list', 'retrieve'):
+            result = results.get(name)
+            if result is None:
+                continue
+
+            timings = sorted(result['timings'])
+            errors = sum(result['errors'].values())
+            if timings:
+                latencies = ''.join(
+                    f'{percentile(timings, percent) * 1000:>7.1f}ms' for percent in (50, 95, 99)
+                )
+            else:
+                latencies = f"{'-':>9}" * 3
+            self.stdout.write(f'{name:<16}{len(timings):>8}{errors:>8}{latencies}{len(timings) / duration:>9.1f}')
+
+            for error, count in sorted(result['errors'].items(), key=lambda item: -item[1]):
+                self.stdout.write(self.style.WARNING(f'    {count} x {error[:120]}'))
@@ -0,0 +1,148 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import RideUser, Ride, RideEvent
+from api.views import RideViewset, RideEventViewset
+
+
+class Command(BaseCommand):
+    help = (
+        "Run every RideViewset/RideEventViewset action once and print the "
+        "query plan of each query it makes. Everything is rolled back afterwards."
+    )
+
+    def handle(self, *args, **options):
+        self.full_scans = 0
+        self.table_names = set(connection.introspection.table_names())
+
+        with transaction.atomic():
+            admin, ride, event = self.create_fixtures()
+            factory = APIRequestFactory(SERVER_NAME='localhost')
+
+            requests = [
+                ('rides list', RideViewset, 'get', 'list', '/api/rides/', {}, None),
+                ('rides list ?status=', RideViewset, 'get', 'list', '/api/rides/?status=PU', {}, None),
+                ('rides list ?rider__email=', RideViewset, 'get', 'list',
+                    f'/api/rides/?rider__email={ride.rider.email}', {}, None),
+                ('rides list ?ordering=pickup_time', RideViewset, 'get', 'list',
+                    '/api/rides/?ordering=pickup_time', {}, None),
+                ('rides list ?pagination=cursor', RideViewset, 'get', 'list',
+                    '/api/rides/?pagination=cursor&status=PU', {}, None),
+                ('rides list ?ordering=distance_km', RideViewset, 'get', 'list',
+                    '/api/rides/?lat=14.5995&long=120.9842&ordering=distance_km', {}, None),
+                ('rides list ?radius_km=', RideViewset, 'get', 'list',
+                    '/api/rides/?lat=14.5995&long=120.9842&radius_km=5&ordering=distance_km', {}, None),
+                ('rides retrieve', RideViewset, 'get', 'retrieve', f'/api/rides/{ride.id}/',
+                    {'pk': ride.id}, None),
+                ('rides history', RideViewset, 'get', 'history', f'/api/rides/{ride.id}/history/',
+                    {'pk': ride.id}, None),
+                ('rides book', RideViewset, 'post', 'book', '/api/rides/book/', {}, {
+                    'rider': ride.rider_id,
+                    'driver': ride.driver_id,
+                    'pickup_lat': '14.5995',
+                    'pickup_long': '120.9842',
+                    'dropoff_lat': '14.5547',
+                    'dropoff_long': '121.0244',
+                    'pickup_time': timezone.now().isoformat(),
+                }),
+                ('rides update_status', RideViewset, 'post', 'update_status',
+                    f'/api/rides/{ride.id}/update_status/', {'pk': ride.id}, {'status': 'ER'}),
+                ('events create', RideEventViewset, 'post', 'create', '/api/events/', {},
+                    {'ride_id': ride.id, 'description': 'Explain queries.'}),
+                ('events destroy', RideEventViewset, 'delete', 'destroy',
+                    f'/api/events/{event.id}/', {'pk': event.id}, None),
+                ('rides delete_forever', RideViewset, 'delete', 'delete_forever',
+                    f'/api/rides/{ride.id}/delete_forever/', {'pk': ride.id}, None),
+            ]
+
+            for name, viewset, method, action, path, kwargs, data in requests:
+                request = getattr(factory, method)(path, data, format='json')
+                force_authenticate(request, user=admin)
+                # Same as the router: @action(serializer_class=...) etc.
+                initkwargs = getattr(getattr(viewset, action), 'kwargs', {})
+                view = viewset.as_view({method: action}, **initkwargs)
+
+                with CaptureQueriesContext(connection) as queries:
+                    response = view(request, **kwargs)
+                    response.render()
+
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{name} ({response.status_code})'))
+                for query in queries.captured_queries:
+                    self.explain(query['sql'])
+
+            self.stdout.write(self.style.MIGRATE_HEADING('Ride.recents'))
+            with CaptureQueriesContext(connection) as queries:
+                list(Ride.recents.all())
+            for query in queries.captured_queries:
+                self.explain(query['sql'])
+
+            transaction.set_rollback(True)
+
+        if self.full_scans:
+            self.stdout.write(self.style.WARNING(f'{self.full_scans} full table scan(s) found.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No full table scans found.'))
+
+    def create_fixtures(self):
+        admin = RideUser.objects.create(
+            username='explain_queries_admin',
+            role=RideUser.RoleChoices.ADMIN,
+            is_staff=True,
+            is_superuser=True,
+        )
+        rider = RideUser.objects.create(
+            username='explain_queries_rider',
+            email='explain_queries_rider@example.com',
+            phone_number='explain_rider',
+        )
+        driver = RideUser.objects.create(
+            username='explain_queries_driver',
+            role=RideUser.RoleChoices.DRIVER,
+            phone_number='explain_driver',
+        )
+        ride = Ride.objects.create(
+            rider=rider,
+            driver=driver,
+            pickup_lat=14.5995,
+            pickup_long=120.9842,
+            dropoff_lat=14.5547,
+            dropoff_long=121.0244,
+            pickup_time=timezone.now() - timedelta(hours=1),
+        )
+        event = RideEvent.objects.create(ride=ride, description='Explain queries.')
+
+        return admin, ride, event
+
+    def explain(self, sql):
+        # Only statements that read rows have a plan worth looking at.
+        if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+
+            return
+
+        self.stdout.write(f'  {sql}')
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            else:
+                cursor.execute(f'EXPLAIN {sql}')
+                plan = [row[0] for row in cursor.fetchall()]
+
+        for line in plan:
+            # SQLite: 'SCAN <table>' without an index is a full table scan,
+            # scans of subqueries(ie: UNION results) are not.
+            words = line.split()
+            full_scan = (
+                words[0] == 'SCAN' and 'USING' not in line and
+                len(words) > 1 and words[1] in self.table_names
+            )
+            if full_scan:
+                self.full_scans += 1
+                self.stdout.write(self.style.WARNING(f'    {line}  <- full scan'))
+            else:
+                self.stdout.write(f'    {line}')
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.reports import DRIVER_TRIPS_COLUMNS, get_date_range, iter_driver_trips_over_1_hour, write_report
+from api.routers import read_from_replica
+
+
+class Command(BaseCommand):
+    help = "Export driver trips over 1 hour per month to .xlsx or .csv."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default='driver_trips_over_1_hour.xlsx',
+            help="Output file, .xlsx or .csv (default: driver_trips_over_1_hour.xlsx)",
+        )
+        parser.add_argument('--month', help="Only this month, YYYY-MM")
+        parser.add_argument('--since', help="Drop-offs from this date, YYYY-MM-DD")
+        parser.add_argument('--until', help="Drop-offs before this date, YYYY-MM-DD")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument(
+            '--raw',
+            action='store_true',
+            help="Compute from the rides instead of the DriverMonthlyStats rollup",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            since, until = get_date_range(options['month'], options['since'], options['until'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rows = iter_driver_trips_over_1_hour(
+            since,
+            until,
+            chunk_size=options['chunk_size'],
+            use_stats=not options['raw'],
+        )
+
+        # A long read, kept off the primary when there is a replica.
+        try:
+            with read_from_replica():
+                count = write_report(rows, options['output'], DRIVER_TRIPS_COLUMNS)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Export completed: {options['output']} ({count} rows)"
+        ))
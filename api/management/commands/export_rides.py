@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.reports import RIDE_ESTIMATE_COLUMNS, get_date_range, iter_ride_estimates, write_report
+from api.routers import read_from_replica
+
+
+class Command(BaseCommand):
+    help = "Export every ride with its trip length, ETA and fare to .xlsx or .csv."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default='ride_estimates.csv',
+            help="Output file, .xlsx or .csv (default: ride_estimates.csv)",
+        )
+        parser.add_argument('--since', help="Pick-ups from this date, YYYY-MM-DD")
+        parser.add_argument('--until', help="Pick-ups before this date, YYYY-MM-DD")
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        try:
+            since, until = get_date_range(since=options['since'], until=options['until'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        rows = iter_ride_estimates(since, until, chunk_size=options['chunk_size'])
+
+        # A long read, kept off the primary when there is a replica.
+        try:
+            with read_from_replica():
+                count = write_report(rows, options['output'], RIDE_ESTIMATE_COLUMNS)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Export completed: {options['output']} ({count} rows)"
+        ))
@@ -0,0 +1,147 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.authentication import RideTokenObtainPairSerializer
+from api.models import RideUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Send GET requests to running server(s) with many concurrent keep-alive "
+        "connections and print throughput and latency, ie: WSGI vs ASGI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+', help="ie: http://127.0.0.1:8000/api/rides/")
+        parser.add_argument('--requests', type=int, default=2000, help="Requests per url")
+        parser.add_argument('--concurrency', type=int, default=50, help="Open connections")
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--token', help="Access token, one is issued for --username otherwise")
+        parser.add_argument('--username', help="Admin to issue the token for(default: first admin)")
+
+    def handle(self, *args, **options):
+        token = options['token'] or self.issue_token(options['username'])
+
+        for url in options['urls']:
+            self.stdout.write(self.style.MIGRATE_HEADING(url))
+            result = asyncio.run(self.run(url, token, options))
+            self.report(result)
+
+    def issue_token(self, username):
+        users = RideUser.objects.filter(role=RideUser.RoleChoices.ADMIN, is_superuser=True)
+        if username:
+            users = users.filter(username=username)
+
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError("No admin found to issue a token for, create one or pass --token.")
+
+        return str(RideTokenObtainPairSerializer.get_token(user).access_token)
+
+    async def run(self, url, token, options):
+        url = urlsplit(url)
+        if url.scheme != 'http':
+            raise CommandError("Only http:// urls are supported.")
+
+        path = url.path + (f'?{url.query}' if url.query else '')
+        request = (
+            f'GET {path} HTTP/1.1\r\n'
+            f'Host: {url.netloc}\r\n'
+            f'Authorization: Bearer {token}\r\n'
+            'Accept: application/json\r\n'
+            'Connection: keep-alive\r\n'
+            '\r\n'
+        ).encode()
+
+        remaining = options['requests']
+        latencies = []
+        statuses = {}
+        errors = []
+
+        async def client():
+            nonlocal remaining
+            reader = writer = None
+
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+                    writer.write(request)
+                    status, keep_alive = await asyncio.wait_for(
+                        self.read_response(reader), options['timeout']
+                    )
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as exc:
+                    errors.append(exc)
+                    if writer is not None:
+                        writer.close()
+                    reader = writer = None
+                    continue
+
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+                if not keep_alive:
+                    writer.close()
+                    reader = writer = None
+
+            if writer is not None:
+                writer.close()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+        elapsed = time.perf_counter() - start
+
+        return {'elapsed': elapsed, 'latencies': latencies, 'statuses': statuses, 'errors': errors}
+
+    async def read_response(self, reader):
+        """
+        - Read one HTTP/1.1 response, returns (status, keep-alive).
+        """
+
+        head = await reader.readuntil(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split(' ', 2)[1])
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip().lower()
+
+        if 'content-length' in headers:
+            await reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            # No length: the body ends with the connection.
+            await reader.read()
+
+            return status, False
+
+        return status, headers.get('connection') != 'close'
+
+    def report(self, result):
+        latencies = sorted(result['latencies'])
+        done = len(latencies)
+        statuses = ', '.join(f'{status}: {count}' for status, count in sorted(result['statuses'].items()))
+
+        self.stdout.write(f"requests:   {done} in {result['elapsed']:.2f}s ({done / result['elapsed']:.1f} req/s)")
+        self.stdout.write(f"statuses:   {statuses or '-'}")
+        if result['errors']:
+            self.stdout.write(self.style.WARNING(
+                f"errors:     {len(result['errors'])} (first: {result['errors'][0]!r})"
+            ))
+        if done >= 2:
+            percentiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f'latency:    p50 {percentiles[49] * 1000:.1f}ms, p95 {percentiles[94] * 1000:.1f}ms, '
+                f'p99 {percentiles[98] * 1000:.1f}ms, max {latencies[-1] * 1000:.1f}ms'
+            )
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models.functions import TruncMonth
+
+from api.models import Ride, DriverMonthlyStats
+from api.reports import rebuild_driver_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild DriverMonthlyStats for the months marked dirty, "
+        "or the given/all months."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', action='append', default=[], help="YYYY-MM, can be repeated")
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Rebuild every month with drop-offs, ie: after backfill_ride_timestamps",
+        )
+
+    def handle(self, *args, **options):
+        if options['all']:
+            months = set(
+                Ride.objects
+                .filter(dropoff_at__isnull=False)
+                .annotate(month=TruncMonth('dropoff_at'))
+                .values_list('month', flat=True)
+                .distinct()
+            )
+            months = {month.date() for month in months}
+            months |= set(DriverMonthlyStats.objects.values_list('month', flat=True).distinct())
+        elif options['month']:
+            try:
+                months = {datetime.strptime(month, '%Y-%m').date() for month in options['month']}
+            except ValueError:
+                raise CommandError("Invalid month, expected YYYY-MM.")
+        else:
+            months = set(
+                DriverMonthlyStats.objects
+                .filter(is_dirty=True)
+                .values_list('month', flat=True)
+                .distinct()
+            )
+
+        if not months:
+            self.stdout.write('Nothing to rebuild.')
+
+            return
+
+        for month in sorted(months):
+            count = rebuild_driver_stats(month)
+            self.stdout.write(f"{month.strftime('%Y-%m')}: {count} driver(s)")
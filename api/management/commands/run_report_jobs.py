@@ -0,0 +1,61 @@
+import os
+import socket
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.jobs import requeue_stale_jobs, work
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the report jobs queued by 'api/reports/<kind>/' with a pool of worker "
+        "threads, until stopped(Ctrl+C). See: api/jobs.py"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Jobs run at the same time")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds between checks when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty, ie: from cron")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("--workers must be at least 1.")
+        if options['poll'] <= 0:
+            raise CommandError("--poll must be more than 0.")
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f"Queued {requeued} stale job(s) again."))
+
+        stop = threading.Event()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+        def thread(worker):
+            try:
+                work(worker, stop, once=options['once'], poll=options['poll'])
+            finally:
+                # Connections are per thread
+                connection.close()
+
+        threads = [
+            threading.Thread(target=thread, args=(f'{prefix}:{i}',))
+            for i in range(options['workers'])
+        ]
+        for worker in threads:
+            worker.start()
+        self.stdout.write(f"{len(threads)} worker(s) running.")
+
+        try:
+            for worker in threads:
+                while worker.is_alive():
+                    worker.join(timeout=0.5)
+        except KeyboardInterrupt:
+            # Running jobs are finished first
+            self.stdout.write("Stopping after the running jobs...")
+            stop.set()
+            for worker in threads:
+                worker.join()
+
+        self.stdout.write(self.style.SUCCESS("Workers stopped."))
@@ -0,0 +1,49 @@
+import sqlite3
+import time
+from contextlib import closing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api.routers import REPLICA_DB_ALIAS
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the SQLite primary into the SQLite replica(DATABASE_REPLICA_NAME), "
+        "for trying the primary/replica routing locally."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--every',
+            type=float,
+            help="Keep copying every N seconds, ie: to mimic a replica's lag",
+        )
+
+    def handle(self, *args, **options):
+        if REPLICA_DB_ALIAS not in connections.settings:
+            raise CommandError("No replica configured, set DATABASE_REPLICA_NAME.")
+
+        for alias in (DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS):
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f"'{alias}' is not SQLite, replicate it with the database's own replication.")
+
+        if options['every'] is not None and options['every'] <= 0:
+            raise CommandError("--every must be more than 0.")
+
+        while True:
+            self.sync()
+            if options['every'] is None:
+                break
+            time.sleep(options['every'])
+
+    def sync(self):
+        primary = connections.settings[DEFAULT_DB_ALIAS]['NAME']
+        replica = connections.settings[REPLICA_DB_ALIAS]['NAME']
+
+        # Online backup: a consistent copy even while the primary is written to.
+        with closing(sqlite3.connect(primary)) as source, closing(sqlite3.connect(replica)) as target:
+            source.backup(target)
+
+        self.stdout.write(self.style.SUCCESS(f"Copied {primary} to {replica}"))
@@ -0,0 +1,329 @@
+import atexit
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponse
+
+# Seconds, from 5ms(cached responses) to 10s
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # label values -> value
+        self.values = {}
+
+    def get_key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def describe(self):
+        return {'type': self.type, 'help': self.documentation, 'labelnames': self.labelnames}
+
+    def empty(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.get_key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self.get_key(labels), 0)
+
+    def empty(self):
+        return 0
+
+
+class Histogram(Metric):
+    """
+    - Values are [count of each bucket..., count over the last bucket, sum],
+    the buckets are made cumulative when rendered.
+    """
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(float(bucket) for bucket in buckets)
+
+    def observe(self, value, **labels):
+        key = self.get_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = self.empty()
+            counts[index] += 1
+            counts[-1] += value
+
+    def describe(self):
+        return {**super().describe(), 'buckets': self.buckets}
+
+    def empty(self):
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+
+class Registry:
+    """
+    - Counters/histograms of this process, kept in memory: recording one
+    is a dict update under a lock.
+    - Several worker processes(ie: gunicorn -w 4): with METRICS_DIR set,
+    each process saves a snapshot there every METRICS_FLUSH_INTERVAL
+    seconds(and on exit), /metrics adds up the snapshots of every process.
+    Snapshots of workers that exited are kept, so counters never go back.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.reset()
+
+    def reset(self):
+        # Also called in forked children: they start from zero, with their
+        # own snapshot file, and the parent's lock may have been held.
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.started = time.time_ns()
+        self.next_flush = 0.0
+        for metric in self.metrics.values():
+            metric.values = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self.metrics[metric.name] = metric
+
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: {
+                    **metric.describe(),
+                    'values': [
+                        [key, list(value) if isinstance(value, list) else value]
+                        for key, value in metric.values.items()
+                    ],
+                }
+                for name, metric in self.metrics.items()
+            }
+
+    def get_directory(self):
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def get_path(self, directory):
+        return os.path.join(directory, f'metrics-{os.getpid()}-{self.started}.json')
+
+    def maybe_flush(self):
+        # Called after every request, only writes every METRICS_FLUSH_INTERVAL.
+        if time.monotonic() >= self.next_flush and self.get_directory():
+            self.flush()
+
+    def flush(self):
+        directory = self.get_directory()
+        if not directory:
+            return
+
+        # Another thread is already writing it.
+        if not self.flush_lock.acquire(blocking=False):
+            return
+
+        try:
+            self.next_flush = time.monotonic() + getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+            os.makedirs(directory, exist_ok=True)
+            path = self.get_path(directory)
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(self.snapshot(), file)
+            # Readers see the old or the new snapshot, never half of one.
+            os.replace(f'{path}.tmp', path)
+        finally:
+            self.flush_lock.release()
+
+    def collect(self):
+        """
+        - This process' metrics, or every process' with METRICS_DIR.
+        """
+
+        directory = self.get_directory()
+        if not directory:
+            return self.snapshot()
+
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+            try:
+                with open(path) as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                # Removed meanwhile
+                continue
+
+        return merge_snapshots(snapshots)
+
+
+def merge_snapshots(snapshots):
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            values = merged.setdefault(name, {**metric, 'values': {}})
+            # Buckets changed between deploys, the old snapshot can't be added.
+            if metric.get('buckets') != values.get('buckets'):
+                continue
+
+            for key, value in metric['values']:
+                key = tuple(key)
+                current = values['values'].get(key)
+                if current is None:
+                    values['values'][key] = value
+                elif isinstance(value, list):
+                    values['values'][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    values['values'][key] = current + value
+
+    for metric in merged.values():
+        metric['values'] = list(metric['values'].items())
+
+    return merged
+
+
+def escape_label(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(labelnames, key, extra=()):
+    labels = [f'{name}="{escape_label(value)}"' for name, value in zip(labelnames, key)]
+    labels += [f'{name}="{value}"' for name, value in extra]
+
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+
+    return str(value)
+
+
+def render(snapshot):
+    """
+    - Prometheus text format(version 0.0.4).
+    """
+
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric['labelnames']
+
+        for key, value in sorted(metric['values'], key=lambda item: list(item[0])):
+            if metric['type'] != 'histogram':
+                lines.append(f'{name}{format_labels(labelnames, key)} {format_value(value)}')
+                continue
+
+            cumulative = 0
+            for bucket, count in zip([*metric['buckets'], '+Inf'], value[:-1]):
+                cumulative += count
+                bucket = format_value(bucket) if bucket != '+Inf' else bucket
+                lines.append(f"{name}_bucket{format_labels(labelnames, key, [('le', bucket)])} {cumulative}")
+            lines.append(f'{name}_sum{format_labels(labelnames, key)} {format_value(value[-1])}')
+            lines.append(f'{name}_count{format_labels(labelnames, key)} {cumulative}')
+
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """
+    - Observe how long the block took:
+        with timed(serializer_duration, serializer='RideSerializer'):
+            ...
+    - Labels can still be changed inside the block(ie: the outcome).
+    """
+
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+
+
+def record_request(action, status_code, duration, query_stats):
+    # See: QueryInstrumentationMiddleware
+    requests_total.inc(action=action, status=status_code)
+    request_duration.observe(duration, action=action)
+    db_queries.inc(query_stats.count, action=action)
+    db_query_duration.inc(query_stats.duration, action=action)
+    registry.maybe_flush()
+
+
+def metrics_view(request):
+    """
+    - GET '/metrics' for Prometheus to scrape.
+    - With METRICS_TOKEN set, 'Authorization: Bearer <METRICS_TOKEN>' is required.
+    Without it, the metrics are only served with DEBUG on: per-action request
+    and query counts of a deployment aren't public.
+    """
+
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        if not settings.DEBUG:
+
+            return HttpResponse('Not Found\n', status=404, content_type=CONTENT_TYPE)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+
+        return HttpResponse('Unauthorized\n', status=401, content_type=CONTENT_TYPE)
+
+    return HttpResponse(render(registry.collect()), content_type=CONTENT_TYPE)
+
+
+registry = Registry()
+os.register_at_fork(after_in_child=registry.reset)
+atexit.register(registry.flush)
+
+requests_total = registry.counter(
+    'api_requests_total', "Requests per view action(ie: RideViewset.list) and status code.", ('action', 'status')
+)
+request_duration = registry.histogram(
+    'api_request_duration_seconds', "Request latency per view action, compression included.", ('action',)
+)
+db_queries = registry.counter(
+    'api_db_queries_total', "Database queries run by requests, per view action.", ('action',)
+)
+db_query_duration = registry.counter(
+    'api_db_query_duration_seconds_total', "Time requests spent in database queries, per view action.", ('action',)
+)
+serializer_duration = registry.histogram(
+    'api_serializer_duration_seconds', "Time spent building serializer.data, per serializer.", ('serializer',)
+)
+response_cache_requests = registry.counter(
+    'api_response_cache_requests_total', "Ride list/retrieve response cache lookups(hit/miss).", ('result',)
+)
+auth_duration = registry.histogram(
+    'api_auth_duration_seconds',
+    "JWT authentication time per outcome(authenticated/anonymous/failed).",
+    ('result',),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
@@ -0,0 +1,222 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+from .instrumentation import track_queries
+from .metrics import record_request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+query_logger = logging.getLogger('api.queries')
+
+
+def compress_gzip(content):
+    # Django's GZipMiddleware way: up to 100 random bytes in the gzip header
+    # make the compressed length vary(BREACH mitigation).
+    return compress_string(content, max_random_bytes=GZipMiddleware.max_random_bytes)
+
+
+def compress_brotli(content):
+    # Quality 4-5 is close to gzip's speed with smaller output,
+    # the default(11) is meant for static files.
+    return brotli.compress(content, quality=5)
+
+
+def get_encodings():
+    encodings = {'gzip': compress_gzip}
+    if brotli is not None:
+        encodings['br'] = compress_brotli
+
+    return encodings
+
+
+def parse_accept_encoding(header):
+    """
+    - 'gzip, br;q=0.9, *;q=0' -> {'gzip': 1.0, 'br': 0.9, '*': 0.0}
+    """
+
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    - Compresses responses of COMPRESSION_MIN_SIZE bytes or more with
+    the encoding the client prefers from Accept-Encoding: br(if the
+    brotli package is installed) or gzip.
+    - Only COMPRESSION_CONTENT_TYPES(the API's JSON): HTML pages(admin,
+    login) carry CSRF tokens next to reflected input, which BREACH can
+    recover from compressed lengths. The API authenticates with bearer
+    tokens a cross-site page can't send, and gzip adds random bytes too.
+    - Streaming responses(ie: server-sent events) are left alone.
+    - Sync and async: under ASGI the compression runs on the event loop,
+    not through sync_to_async on the single shared sync thread(which
+    MiddlewareMixin.process_response would). It's a few ms of CPU for
+    the largest pages, see: 'python manage.py benchmark render'
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header('Content-Encoding'):
+
+            return response
+
+        content_type = response.get('Content-Type', '').partition(';')[0].strip().lower()
+        if content_type not in getattr(settings, 'COMPRESSION_CONTENT_TYPES', ('application/json',)):
+
+            return response
+
+        min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        if len(response.content) < min_size:
+
+            return response
+
+        # Responses this big can be compressed, caches must key on it.
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = self.choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+
+            return response
+
+        compressed = get_encodings()[encoding](response.content)
+        if len(compressed) >= len(response.content):
+
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+
+        # The body changed, a strong ETag no longer matches it byte for byte.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+
+        return response
+
+    def choose_encoding(self, header):
+        accepted = parse_accept_encoding(header)
+        wildcard = accepted.get('*', 0.0)
+        best, best_quality = None, 0.0
+
+        # On equal quality the first one wins, br compresses better.
+        for encoding in sorted(get_encodings(), key=lambda name: name != 'br'):
+            quality = accepted.get(encoding, wildcard)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+
+        return best
+
+
+class QueryInstrumentationMiddleware:
+    """
+    - Records the number of queries, total database time and slowest
+    statement of every request, per view action(ie: RideViewset.list).
+    - Exported with the request's latency at /metrics(see: api/metrics.py).
+    - DEBUG: sent back as X-Query-Count/X-Query-Time-Ms/X-Slowest-Query-Ms
+    headers.
+    - Logged to 'api.queries': DEBUG for every request, WARNING over
+    QUERY_LOG_MAX_QUERIES queries or QUERY_LOG_SLOW_MS milliseconds.
+    - Sync and async(api/async_views.py) views.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        with track_queries() as stats:
+            response = self.get_response(request)
+
+        return self.report(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with track_queries() as stats:
+            response = await self.get_response(request)
+
+        return self.report(request, response, stats, time.perf_counter() - start)
+
+    def report(self, request, response, stats, duration):
+        action = self.get_action(request)
+        record_request(action, response.status_code, duration, stats)
+        duration_ms = stats.duration * 1000
+        slowest_ms = stats.slowest_duration * 1000
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(stats.count)
+            response['X-Query-Time-Ms'] = f'{duration_ms:.1f}'
+            response['X-Slowest-Query-Ms'] = f'{slowest_ms:.1f}'
+
+        too_many = stats.count > getattr(settings, 'QUERY_LOG_MAX_QUERIES', 20)
+        too_slow = duration_ms > getattr(settings, 'QUERY_LOG_SLOW_MS', 200)
+        level = logging.WARNING if too_many or too_slow else logging.DEBUG
+        if query_logger.isEnabledFor(level):
+            query_logger.log(
+                level,
+                '%s %s %s: %d queries in %.1fms, slowest %.1fms: %s',
+                request.method, request.path, action, stats.count,
+                duration_ms, slowest_ms, stats.slowest_sql,
+            )
+
+        return response
+
+    def get_action(self, request):
+        # 'RideViewset.list' for viewsets, the url name otherwise.
+        match = request.resolver_match
+        if match is None:
+
+            return '-'
+
+        view = match.func
+        actions = getattr(view, 'actions', None)
+        if actions and request.method.lower() in actions:
+            return f'{view.cls.__name__}.{actions[request.method.lower()]}'
+
+        return match.view_name
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 2000
+
+
+def fill_pickup_cell(apps, schema_editor):
+    from api.querysets import get_grid_cell
+
+    Ride = apps.get_model('api', 'Ride')
+    rides = Ride.objects.filter(pickup_cell__isnull=True).only('pickup_lat', 'pickup_long')
+    batch = []
+
+    for ride in rides.iterator(chunk_size=BATCH_SIZE):
+        ride.pickup_cell = get_grid_cell(ride.pickup_lat, ride.pickup_long)
+        batch.append(ride)
+
+        if len(batch) >= BATCH_SIZE:
+            Ride.objects.bulk_update(batch, ['pickup_cell'])
+            batch = []
+
+    if batch:
+        Ride.objects.bulk_update(batch, ['pickup_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_ride_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='pickup_cell',
+            field=models.IntegerField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(fill_pickup_cell, migrations.RunPython.noop),
+    ]
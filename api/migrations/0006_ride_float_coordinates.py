@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_ride_pickup_cell'),
+    ]
+
+    operations = [
+        # Nullable so 0008 can be reversed before the data is copied back.
+        migrations.AlterField(
+            model_name='ride',
+            name='dropoff_lat',
+            field=models.DecimalField(decimal_places=16, max_digits=22, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ride',
+            name='dropoff_long',
+            field=models.DecimalField(decimal_places=16, max_digits=22, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ride',
+            name='pickup_lat',
+            field=models.DecimalField(decimal_places=16, max_digits=22, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ride',
+            name='pickup_long',
+            field=models.DecimalField(decimal_places=16, max_digits=22, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='dropoff_lat_float',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='dropoff_long_float',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='pickup_lat_float',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='pickup_long_float',
+            field=models.FloatField(null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:09
+
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+# Copied one primary key range at a time, each range in its own
+# transaction, so large tables are never locked in one long UPDATE.
+BATCH_SIZE = 10000
+
+COORDINATES = ['pickup_lat', 'pickup_long', 'dropoff_lat', 'dropoff_long']
+
+
+def copy_in_batches(Ride, source_suffix, target_suffix, output_field):
+    bounds = Ride.objects.aggregate(first=models.Min('id'), last=models.Max('id'))
+    if bounds['first'] is None:
+
+        return
+
+    values = {
+        f'{name}{target_suffix}': Cast(f'{name}{source_suffix}', output_field)
+        for name in COORDINATES
+    }
+
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        Ride.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(**values)
+
+
+def copy_to_float(apps, schema_editor):
+    Ride = apps.get_model('api', 'Ride')
+    copy_in_batches(Ride, '', '_float', models.FloatField())
+
+
+def copy_to_decimal(apps, schema_editor):
+    Ride = apps.get_model('api', 'Ride')
+    copy_in_batches(Ride, '_float', '', models.DecimalField(max_digits=22, decimal_places=16))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('api', '0006_ride_float_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_to_float, copy_to_decimal),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:10
+
+from django.db import migrations, models
+
+
+COORDINATES = ['pickup_lat', 'pickup_long', 'dropoff_lat', 'dropoff_long']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_copy_ride_coordinates'),
+    ]
+
+    operations = [
+        *[
+            migrations.RemoveField(model_name='ride', name=name)
+            for name in COORDINATES
+        ],
+        *[
+            migrations.RenameField(model_name='ride', old_name=f'{name}_float', new_name=name)
+            for name in COORDINATES
+        ],
+        *[
+            migrations.AlterField(model_name='ride', name=name, field=models.FloatField())
+            for name in COORDINATES
+        ],
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_ride_coordinates_to_float'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ride',
+            name='rider',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rider_rides', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['pickup_time', 'id'], name='ride_pickup_time_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['status', 'pickup_time'], name='ride_status_pickup_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['rider', 'pickup_time'], name='ride_rider_pickup_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rideevent',
+            index=models.Index(fields=['ride', 'created'], name='rideevent_ride_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rideuser',
+            index=models.Index(fields=['email'], name='rideuser_email_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='dropoff_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='pickup_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:13
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_ride_status_timestamps'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverMonthlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('trip_count', models.PositiveIntegerField(default=0)),
+                ('over_1h_count', models.PositiveIntegerField(default=0)),
+                ('total_duration', models.DurationField(default=datetime.timedelta)),
+                ('is_dirty', models.BooleanField(default=False)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='driver_stats_month_idx'), models.Index(condition=models.Q(('is_dirty', True)), fields=['month'], name='driver_stats_dirty_idx')],
+                'constraints': [models.UniqueConstraint(fields=('driver', 'month'), name='driver_monthly_stats_unique')],
+            },
+        ),
+    ]
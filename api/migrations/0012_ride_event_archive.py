@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_driver_monthly_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RideEventArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('description', models.CharField(default='', max_length=100)),
+                ('created', models.DateTimeField()),
+                ('month', models.DateField()),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='rideevent',
+            index=models.Index(fields=['created'], name='rideevent_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='rideeventarchive',
+            name='ride',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_events', to='api.ride'),
+        ),
+        migrations.AddIndex(
+            model_name='rideeventarchive',
+            index=models.Index(fields=['ride', 'created'], name='rideeventarchive_ride_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rideeventarchive',
+            index=models.Index(fields=['month'], name='rideeventarchive_month_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_ride_event_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverLocation',
+            fields=[
+                ('driver', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='location', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('lat', models.FloatField()),
+                ('long', models.FloatField()),
+                ('updated', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['updated'], name='driverlocation_updated_idx')],
+            },
+        ),
+    ]
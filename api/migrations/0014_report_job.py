@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_driver_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('driver_trips', 'Driver trips over 1 hour'), ('ride_estimates', 'Ride estimates')], max_length=30)),
+                ('params', models.JSONField(default=dict)),
+                ('key', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('QU', 'Queued'), ('RU', 'Running'), ('DN', 'Done'), ('FA', 'Failed')], default='QU', max_length=2)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('file', models.CharField(blank=True, max_length=255)),
+                ('rows', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('requested_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='report_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created'], name='reportjob_status_created_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['QU', 'RU'])), fields=('key',), name='report_job_active_key_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 07:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_report_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rideuser',
+            name='claims_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_rideuser_claims_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rideevent',
+            name='ride',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='api.ride'),
+        ),
+    ]
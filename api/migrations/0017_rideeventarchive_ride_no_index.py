@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_rideevent_ride_no_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rideeventarchive',
+            name='ride',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_events', to='api.ride'),
+        ),
+    ]
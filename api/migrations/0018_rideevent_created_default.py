@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 08:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_rideeventarchive_ride_no_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rideevent',
+            name='created',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+from datetime import timedelta
+
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from .managers import RecentRidesManager
+from .querysets import get_grid_cell
 
 
 class RideUser(AbstractUser):
@@ -18,9 +23,29 @@ class RideUser(AbstractUser):
     phone_number = models.CharField(
         max_length=15, unique=True, null=True
     )
+    # Bumped when role/is_active change, tokens issued before are rejected.
+    # Only changed by invalidate_user_claims, see: api/authentication.py
+    claims_version = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Ride list ?rider__email= filter
+            models.Index(fields=['email'], name='rideuser_email_idx'),
+        ]
     
     def __str__(self):
         return f'{self.username}({self.get_role_display()})'
+
+    def save(self, *args, **kwargs):
+        # An instance loaded before a claims_version bump(ie: admin form)
+        # would otherwise write the old version back, re-enabling old tokens.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'claims_version'
+            ]
+
+        super().save(*args, **kwargs)
     
 
 
@@ -37,6 +62,8 @@ class Ride(models.Model):
         on_delete=models.SET_NULL,
         null=True,
         related_name='rider_rides',
+        # Covered by ride_rider_pickup_time_idx
+        db_index=False,
     )
     driver = models.ForeignKey(
         RideUser, 
@@ -44,30 +71,94 @@ class Ride(models.Model):
         null=True,
         related_name='driver_rides',
     )
-    pickup_lat = models.DecimalField(max_digits=22, decimal_places=16)
-    pickup_long = models.DecimalField(max_digits=22, decimal_places=16)
-    dropoff_lat = models.DecimalField(max_digits=22, decimal_places=16)
-    dropoff_long = models.DecimalField(max_digits=22, decimal_places=16)
+    # Serialized as fixed 16 decimal place strings, see: CoordinateField
+    pickup_lat = models.FloatField()
+    pickup_long = models.FloatField()
+    dropoff_lat = models.FloatField()
+    dropoff_long = models.FloatField()
     pickup_time = models.DateTimeField()
     status = models.CharField(
         max_length=15,
         choices=StatusChoices.choices,
         default=StatusChoices.PICKUP
     )
+    # Latest time the ride reached these statuses, see: set_status
+    pickup_started_at = models.DateTimeField(null=True, blank=True)
+    dropoff_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    # Grid cell of the pickup point, used to prefilter distance searches.
+    # See: api/querysets.py
+    pickup_cell = models.IntegerField(null=True, db_index=True, editable=False)
     
     objects = models.Manager()
     recents = RecentRidesManager()
 
+    class Meta:
+        indexes = [
+            # Default -pickup_time list order, cursor pages and the
+            # RecentRidesManager cutoff
+            models.Index(fields=['pickup_time', 'id'], name='ride_pickup_time_id_idx'),
+            # ?status= and ?rider__email= list filters, still ordered by pickup_time
+            models.Index(fields=['status', 'pickup_time'], name='ride_status_pickup_time_idx'),
+            models.Index(fields=['rider', 'pickup_time'], name='ride_rider_pickup_time_idx'),
+        ]
+
+    STATUS_TIMESTAMP_FIELDS = {
+        StatusChoices.PICKUP: 'pickup_started_at',
+        StatusChoices.DROPOFF: 'dropoff_at',
+        StatusChoices.COMPLETED: 'completed_at',
+    }
+
+    def set_status(self, ride_status, timestamp):
+        """
+        - Change status and record when it happened.
+        - Returns the changed fields for save(update_fields=...).
+        """
+
+        self.status = ride_status
+        changed_fields = ['status']
+
+        timestamp_field = self.STATUS_TIMESTAMP_FIELDS.get(ride_status)
+        if timestamp_field:
+            setattr(self, timestamp_field, timestamp)
+            changed_fields.append(timestamp_field)
+
+        return changed_fields
+
+    def set_pickup_cell(self):
+        self.pickup_cell = get_grid_cell(self.pickup_lat, self.pickup_long)
+
+    def save(self, *args, **kwargs):
+        self.set_pickup_cell()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'pickup_cell' not in update_fields:
+            if {'pickup_lat', 'pickup_long'} & set(update_fields):
+                kwargs['update_fields'] = [*update_fields, 'pickup_cell']
+
+        super().save(*args, **kwargs)
+
 
 class RideEvent(models.Model):
+    # Covered by rideevent_ride_created_idx(ride first)
     ride = models.ForeignKey(
         Ride,
         on_delete=models.CASCADE,
-        related_name='events'
+        related_name='events',
+        db_index=False,
     )
 
     description = models.CharField(max_length=100, default='')
-    created = models.DateTimeField(auto_now_add=True)
+    # Same as auto_now_add, but a given time is kept(ie: bulk_update_status
+    # sets the rides' status timestamps and their events' at once).
+    created = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # recent_events Prefetch: ride_id IN (...) AND created >= cutoff
+            models.Index(fields=['ride', 'created'], name='rideevent_ride_created_idx'),
+            # archive_ride_events: created < cutoff, the admin's -created ordering
+            models.Index(fields=['created'], name='rideevent_created_idx'),
+        ]
 
     @classmethod
     def get_description_by_status(cls, ride_status):
@@ -82,4 +173,280 @@ class RideEvent(models.Model):
         if ride_status not in descriptions:
             raise ValueError(f"Status '{ride_status}' does not exist. ")
 
-        return descriptions[ride_status]
\ No newline at end of file
+        return descriptions[ride_status]
+
+
+class RideEventArchive(models.Model):
+    """
+    - Cold storage of RideEvents older than the hot table keeps
+    ('python manage.py archive_ride_events'), so RideEvent stays small.
+    - Keeps the events' ids, partitioned by month of 'created'.
+    - Read with the hot events through 'api/rides/<id>/history/'.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    # Covered by rideeventarchive_ride_idx(ride first)
+    ride = models.ForeignKey(
+        Ride,
+        on_delete=models.CASCADE,
+        related_name='archived_events',
+        db_index=False,
+    )
+
+    description = models.CharField(max_length=100, default='')
+    created = models.DateTimeField()
+    # First day of the month of created
+    month = models.DateField()
+    archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ride', 'created'], name='rideeventarchive_ride_idx'),
+            models.Index(fields=['month'], name='rideeventarchive_month_idx'),
+        ]
+
+    @staticmethod
+    def get_month(timestamp):
+        return timezone.localtime(timestamp).date().replace(day=1)
+
+    @classmethod
+    def archive(cls, events):
+        """
+        - Move the events to the archive, in one transaction.
+        - Events already archived(ie: a run interrupted after the
+        insert) are only deleted from the hot table.
+        """
+
+        archived = [
+            cls(
+                id=event.id,
+                ride_id=event.ride_id,
+                description=event.description,
+                created=event.created,
+                month=cls.get_month(event.created),
+            )
+            for event in events
+        ]
+
+        with transaction.atomic():
+            cls.objects.bulk_create(archived, ignore_conflicts=True)
+            RideEvent.objects.filter(id__in=[event.id for event in events]).delete()
+
+        return len(archived)
+
+
+class DriverMonthlyStats(models.Model):
+    """
+    - Rollup of dropped-off trips per driver per month, kept up to date
+    by update_status so reports don't have to go through every ride.
+    - Months that can't be updated incrementally are marked dirty and
+    rebuilt by 'python manage.py rebuild_driver_stats'.
+    """
+    LONG_TRIP = timedelta(hours=1)
+
+    driver = models.ForeignKey(
+        RideUser,
+        on_delete=models.CASCADE,
+        related_name='monthly_stats',
+    )
+    # First day of the month
+    month = models.DateField()
+    trip_count = models.PositiveIntegerField(default=0)
+    over_1h_count = models.PositiveIntegerField(default=0)
+    total_duration = models.DurationField(default=timedelta)
+    is_dirty = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['driver', 'month'], name='driver_monthly_stats_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['month'], name='driver_stats_month_idx'),
+            models.Index(
+                fields=['month'],
+                name='driver_stats_dirty_idx',
+                condition=models.Q(is_dirty=True),
+            ),
+        ]
+
+    @property
+    def avg_duration(self):
+        if not self.trip_count:
+            return None
+
+        return self.total_duration / self.trip_count
+
+    @staticmethod
+    def get_month(timestamp):
+        return timezone.localtime(timestamp).date().replace(day=1)
+
+    @classmethod
+    def record_dropoff(cls, ride, previous_dropoff_at=None):
+        """
+        - Add a dropped-off ride to its driver's month.
+        - A ride dropped off again would be counted twice, its old and
+        new months are marked dirty instead.
+        """
+
+        if not (ride.driver_id and ride.pickup_started_at and ride.dropoff_at):
+
+            return
+
+        if previous_dropoff_at:
+            cls.mark_dirty(ride.driver_id, previous_dropoff_at)
+            cls.mark_dirty(ride.driver_id, ride.dropoff_at)
+
+            return
+
+        duration = ride.dropoff_at - ride.pickup_started_at
+        month = cls.get_month(ride.dropoff_at)
+        increments = {
+            'trip_count': F('trip_count') + 1,
+            'over_1h_count': F('over_1h_count') + int(duration > cls.LONG_TRIP),
+            'total_duration': F('total_duration') + duration,
+        }
+
+        if cls.objects.filter(driver_id=ride.driver_id, month=month).update(**increments):
+
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    driver_id=ride.driver_id,
+                    month=month,
+                    trip_count=1,
+                    over_1h_count=int(duration > cls.LONG_TRIP),
+                    total_duration=duration,
+                )
+        except IntegrityError:
+            # Created by a concurrent request in the meantime
+            cls.objects.filter(driver_id=ride.driver_id, month=month).update(**increments)
+
+    @classmethod
+    def record_pickup(cls, ride):
+        """
+        - A ride picked up again after its drop-off: the trip's duration
+        changes, its month is marked dirty.
+        """
+
+        cls.mark_dirty(ride.driver_id, ride.dropoff_at)
+
+    @classmethod
+    def mark_dirty(cls, driver_id, timestamp):
+        if not (driver_id and timestamp):
+
+            return
+
+        cls.objects.update_or_create(
+            driver_id=driver_id,
+            month=cls.get_month(timestamp),
+            defaults={'is_dirty': True},
+        )
+
+    @classmethod
+    def mark_rides_dirty(cls, rides):
+        """
+        - Mark the drop-off month of every ride in a Ride queryset dirty,
+        ie: after bulk timestamp changes. One upsert.
+        """
+
+        pairs = {
+            (driver_id, cls.get_month(dropoff_at))
+            for driver_id, dropoff_at in rides.filter(
+                driver__isnull=False, dropoff_at__isnull=False
+            ).values_list('driver_id', 'dropoff_at')
+        }
+        cls.objects.bulk_create(
+            [cls(driver_id=driver_id, month=month, is_dirty=True) for driver_id, month in pairs],
+            update_conflicts=True,
+            unique_fields=['driver', 'month'],
+            update_fields=['is_dirty'],
+        )
+
+        return len(pairs)
+
+
+class DriverLocation(models.Model):
+    """
+    - Last known location of a driver, sent by 'api/users/<id>/ping/'.
+    - Searched through the in-memory index of api/locations.py, not SQL.
+    """
+    driver = models.OneToOneField(
+        RideUser,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='location',
+    )
+    lat = models.FloatField()
+    long = models.FloatField()
+    updated = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Pings since the index last synced, see: DriverLocationIndex.sync
+            models.Index(fields=['updated'], name='driverlocation_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.driver_id}: {self.lat}, {self.long}'
+
+
+class ReportJob(models.Model):
+    """
+    - A report export queued by 'api/reports/<kind>/' and written to
+    REPORTS_DIR by 'manage.py run_report_jobs'. See: api/jobs.py
+    """
+    class KindChoices(models.TextChoices):
+        DRIVER_TRIPS = 'driver_trips', 'Driver trips over 1 hour'
+        RIDE_ESTIMATES = 'ride_estimates', 'Ride estimates'
+
+    class StatusChoices(models.TextChoices):
+        QUEUED = 'QU', 'Queued'
+        RUNNING = 'RU', 'Running'
+        DONE = 'DN', 'Done'
+        FAILED = 'FA', 'Failed'
+
+    ACTIVE_STATUSES = (StatusChoices.QUEUED, StatusChoices.RUNNING)
+
+    kind = models.CharField(max_length=30, choices=KindChoices.choices)
+    # Validated request, ie: {"month": "2025-11", "format": "xlsx"}
+    params = models.JSONField(default=dict)
+    # Hash of kind and params, identical requests share the active job.
+    key = models.CharField(max_length=64)
+    status = models.CharField(
+        max_length=2,
+        choices=StatusChoices.choices,
+        default=StatusChoices.QUEUED,
+    )
+    requested_by = models.ForeignKey(
+        RideUser,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='report_jobs',
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    # File name in REPORTS_DIR once done
+    file = models.CharField(max_length=255, blank=True)
+    rows = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            # One queued/running job per key, concurrent requests can't both create one.
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=models.Q(status__in=['QU', 'RU']),
+                name='report_job_active_key_unique',
+            ),
+        ]
+        indexes = [
+            # Workers pick the oldest queued job
+            models.Index(fields=['status', 'created'], name='reportjob_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.id}({self.get_status_display()})'
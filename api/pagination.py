@@ -1,8 +1,159 @@
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination, Cursor
 
 
 class RidesPagination(PageNumberPagination):
     # Page size was not specified in requirement.
     page_size = 20
     max_page_size = 40
-    page_size_query_param = 'page_size'
\ No newline at end of file
+    page_size_query_param = 'page_size'
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """
+        - paginate_queryset() with the async ORM(acount/aiterator).
+        """
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is a cached_property, set it instead of the sync count()
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            )
+
+        self.page.object_list = [
+            ride async for ride in self.page.object_list.aiterator(chunk_size=page_size)
+        ]
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+
+        return list(self.page)
+
+
+class RidesCursorPagination(CursorPagination):
+    """
+    - Keyset pagination on (pickup_time, id): every page is a range
+    scan from the last ride seen, no COUNT(*) and no OFFSET.
+    - Follows the queryset's pickup_time direction, so it works
+    with ?ordering=pickup_time and the default -pickup_time.
+    """
+    page_size = 20
+    max_page_size = 40
+    page_size_query_param = 'page_size'
+    ordering = ('-pickup_time', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+
+        return self.set_page([ride async for ride in queryset.aiterator(chunk_size=self.page_size + 1)])
+
+    def get_page_queryset(self, queryset, request):
+        """
+        - The page's rides plus one, to know if there is a next page.
+        """
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+        ascending = tuple(queryset.query.order_by[:1]) == ('pickup_time',)
+        self.ordering = ('pickup_time', 'id') if ascending else ('-pickup_time', '-id')
+
+        reverse = self.cursor.reverse if self.cursor else False
+        if ascending == reverse:
+            queryset = queryset.order_by('-pickup_time', '-id')
+            lookup = 'lt'
+        else:
+            queryset = queryset.order_by('pickup_time', 'id')
+            lookup = 'gt'
+
+        if self.cursor:
+            pickup_time, ride_id = self.parse_position(self.cursor.position)
+            queryset = queryset.filter(
+                Q(**{f'pickup_time__{lookup}': pickup_time}) |
+                Q(pickup_time=pickup_time, **{f'id__{lookup}': ride_id})
+            )
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.cursor and self.cursor.reverse:
+            self.page.reverse()
+            self.has_next = self.cursor is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        return self.page
+
+    def parse_position(self, position):
+        try:
+            pickup_time, ride_id = position.split('|')
+            pickup_time = parse_datetime(pickup_time)
+            ride_id = int(ride_id)
+        except (AttributeError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if pickup_time is None:
+            raise NotFound(self.invalid_cursor_message)
+
+        return pickup_time, ride_id
+
+    def get_position(self, ride):
+        return f'{ride.pickup_time.isoformat()}|{ride.id}'
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.get_position(self.page[-1]))
+        )
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.get_position(self.page[0]))
+        )
+
+
+def use_cursor_pagination(request):
+    """
+    - Cursor mode is opt-in: ?pagination=cursor (or a cursor from a
+    previous page), or RIDES_PAGINATION = 'cursor' in settings.
+    - Ordering by distance_km has no stable keyset, it stays on pages.
+    """
+
+    params = request.query_params
+    mode = params.get('pagination') or getattr(settings, 'RIDES_PAGINATION', 'page')
+    if mode != 'cursor' and 'cursor' not in params:
+
+        return False
+
+    return 'distance_km' not in params.get('ordering', '')
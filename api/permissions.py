@@ -12,4 +12,20 @@ class IsRideUserAdmin(BasePermission):
 
             return False
         
-        return request.user.role == RideUser.RoleChoices.ADMIN
\ No newline at end of file
+        return request.user.role == RideUser.RoleChoices.ADMIN
+
+
+class IsDriverSelf(BasePermission):
+    """
+    - Lets drivers call detail actions(ie: ping) on themselves only.
+    """
+
+    def has_permission(self, request, view):
+        if not request.user.is_authenticated:
+
+            return False
+
+        return (
+            request.user.role == RideUser.RoleChoices.DRIVER
+            and str(view.kwargs.get('pk')) == str(request.user.pk)
+        )
\ No newline at end of file
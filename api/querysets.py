@@ -1,34 +1,147 @@
+import math
+
 from django.db.models import F, FloatField, ExpressionWrapper
-from django.db.models.functions import Sqrt, Power, Cast, Cos, Radians
+from django.db.models.functions import Sqrt, Power, Cos, Radians
 
-def calculate_distance(queryset, lat, long):
+GLOBE_KM_DEGREE = 111.32
+
+# Size (in degrees) of one cell of the pickup grid. 0.05 degree is ~5.5km
+# on the latitude axis, small enough to keep city-sized radius searches to
+# a handful of cells.
+GRID_CELL_DEGREES = 0.05
+GRID_COLUMNS = int(round(360 / GRID_CELL_DEGREES))
+GRID_ROWS = int(round(180 / GRID_CELL_DEGREES))
+
+# Past this many candidate cells an IN (...) lookup is no longer cheaper
+# than a plain bounding box over the coordinates.
+GRID_MAX_CELLS = 400
+
+
+def parse_coordinates(lat, long):
     """
-    - Calculate distance by getting query params: lat long.
-    - Annotate to recent rides.
+    - Parse and validate query params: lat long.
+    - Returns None if invalid.
     """
 
     try:
         lat = float(lat)
         long = float(long)
     except Exception as e:
-        
-        return queryset
-    
+
+        return None
+
     # Check north/south(latitude) and east/west
     if not (90 >= lat >= -90 and 180 >= long >= -180):
-        
+
+        return None
+
+    return lat, long
+
+
+def parse_radius(radius_km):
+    """
+    - Parse and validate query param: radius_km.
+    - Returns None unless it's a finite number, 0 or more.
+    """
+
+    try:
+        radius_km = float(radius_km)
+    except Exception as e:
+
+        return None
+
+    if not (math.isfinite(radius_km) and radius_km >= 0):
+
+        return None
+
+    return radius_km
+
+
+def _grid_row(lat):
+    return min(max(int(math.floor((lat + 90) / GRID_CELL_DEGREES)), 0), GRID_ROWS - 1)
+
+
+def _grid_column(long):
+    return min(max(int(math.floor((long + 180) / GRID_CELL_DEGREES)), 0), GRID_COLUMNS - 1)
+
+
+def get_grid_cell(lat, long):
+    """
+    - Integer id of the grid cell a point falls in (row-major).
+    """
+
+    return _grid_row(float(lat)) * GRID_COLUMNS + _grid_column(float(long))
+
+
+def calculate_distance(queryset, lat, long):
+    """
+    - Calculate distance by getting query params: lat long.
+    - Annotate to recent rides.
+    """
+
+    coordinates = parse_coordinates(lat, long)
+    if coordinates is None:
+
         return queryset
-    
-    globe_km_degree = 111.32
+
+    lat, long = coordinates
 
     queryset = queryset.annotate(
         distance_km=ExpressionWrapper(Sqrt(
-            Power((Cast(F('pickup_lat'), FloatField()) - lat) 
-                * globe_km_degree, 2) +
-            Power((Cast(F('pickup_long'), FloatField()) - long)
-                * globe_km_degree * Cos(Radians(lat)), 2
+            Power((F('pickup_lat') - lat)
+                * GLOBE_KM_DEGREE, 2) +
+            Power((F('pickup_long') - long)
+                * GLOBE_KM_DEGREE * Cos(Radians(lat)), 2
             )
         ),output_field=FloatField(),)
     )
-    
-    return queryset
\ No newline at end of file
+
+    return queryset
+
+
+def filter_within_radius(queryset, lat, long, radius_km):
+    """
+    - Narrow rides to the grid cells around lat long first, then
+    annotate the exact distance and keep rides within radius_km.
+    - The bounding box uses the same equirectangular projection as
+    calculate_distance, so no ride within the radius is left out.
+    """
+
+    coordinates = parse_coordinates(lat, long)
+    if coordinates is None:
+
+        return queryset
+
+    radius_km = parse_radius(radius_km)
+    if radius_km is None:
+
+        return calculate_distance(queryset, *coordinates)
+
+    lat, long = coordinates
+    # Padded slightly so float rounding never drops a ride on the edge.
+    lat_span = radius_km / GLOBE_KM_DEGREE + 1e-9
+    long_scale = GLOBE_KM_DEGREE * math.cos(math.radians(lat))
+
+    # Near the poles every longitude is within reach.
+    if long_scale > 1e-9:
+        long_span = radius_km / long_scale + 1e-9
+    else:
+        long_span = 360
+
+    rows = range(_grid_row(lat - lat_span), _grid_row(lat + lat_span) + 1)
+    columns = range(_grid_column(long - long_span), _grid_column(long + long_span) + 1)
+
+    if len(rows) * len(columns) <= GRID_MAX_CELLS:
+        cells = [row * GRID_COLUMNS + column for row in rows for column in columns]
+        queryset = queryset.filter(pickup_cell__in=cells)
+    else:
+        queryset = queryset.filter(
+            pickup_lat__gte=lat - lat_span,
+            pickup_lat__lte=lat + lat_span,
+            pickup_long__gte=long - long_span,
+            pickup_long__lte=long + long_span,
+        )
+
+    queryset = calculate_distance(queryset, lat, long)
+
+    return queryset.filter(distance_km__lte=radius_km)
@@ -0,0 +1,28 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    - Same output as DRF's compact JSONRenderer, encoded with orjson.
+    - datetime is handled by orjson, Decimal/timedelta/lazy strings
+    etc. fall back to DRF's JSONEncoder.
+    - ?format=json with an indent(ie: browsable API) keeps JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=JSONEncoder().default, option=ORJSON_OPTIONS)
+
+        # Same as JSONRenderer: U+2028/U+2029 are valid JSON but break
+        # JavaScript, escape them.
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
@@ -0,0 +1,287 @@
+import csv
+import heapq
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum, Value
+from django.db.models.functions import Concat, TruncMonth
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .estimates import ESTIMATE_FIELDS, estimate_queryset
+from .models import Ride, DriverMonthlyStats
+
+DRIVER_TRIPS_COLUMNS = ['driver_name', 'month', 'trips_over_1_hour']
+RIDE_ESTIMATE_COLUMNS = ['ride_id', 'rider_id', 'driver_id', 'status', 'pickup_time', *ESTIMATE_FIELDS]
+
+
+def parse_month(value):
+    try:
+        month = datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        raise ValueError(f"Invalid month '{value}', expected YYYY-MM.") from None
+
+    return timezone.make_aware(month)
+
+
+def parse_date(value):
+    try:
+        date = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD.") from None
+
+    return timezone.make_aware(date)
+
+
+def get_date_range(month=None, since=None, until=None):
+    """
+    - (since, until) of a report from 'YYYY-MM' or 'YYYY-MM-DD' strings,
+    either a whole month or since/until(both optional, until exclusive).
+    - Raises ValueError for invalid values.
+    """
+
+    if month:
+        if since or until:
+            raise ValueError("Use either month or since/until.")
+        since = parse_month(month)
+
+        return since, (since.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    return (
+        parse_date(since) if since else None,
+        parse_date(until) if until else None,
+    )
+
+
+def get_month_bounds(month):
+    since = timezone.make_aware(datetime.combine(month, time.min))
+    until = timezone.make_aware(datetime.combine((month + timedelta(days=32)).replace(day=1), time.min))
+
+    return since, until
+
+
+def driver_trips_over_1_hour(since=None, until=None, months=None):
+    """
+    - Trips longer than 1 hour (pick-up to drop-off) per driver per month.
+    - since/until bound the drop-off time, until is exclusive.
+    - months: only these months(first days), ie: the ones the rollup can't answer.
+    """
+
+    rides = (
+        Ride.objects
+        .filter(driver__isnull=False, dropoff_at__isnull=False, pickup_started_at__isnull=False)
+        .annotate(duration=ExpressionWrapper(
+            F('dropoff_at') - F('pickup_started_at'), output_field=DurationField()
+        ))
+        .filter(duration__gt=timedelta(hours=1))
+    )
+
+    if since:
+        rides = rides.filter(dropoff_at__gte=since)
+    if until:
+        rides = rides.filter(dropoff_at__lt=until)
+    if months is not None:
+        in_months = Q(pk__in=[])
+        for month in months:
+            month_since, month_until = get_month_bounds(month)
+            in_months |= Q(dropoff_at__gte=month_since, dropoff_at__lt=month_until)
+        rides = rides.filter(in_months)
+
+    return (
+        rides
+        .annotate(
+            driver_name=Concat('driver__first_name', Value(' '), 'driver__last_name'),
+            month=TruncMonth('dropoff_at'),
+        )
+        .values('driver_id', 'driver_name', 'month')
+        .annotate(trips_over_1_hour=Count('id'))
+        .order_by('month', 'driver_name', 'driver_id')
+    )
+
+
+def filter_stats_months(stats, since=None, until=None):
+    if since:
+        stats = stats.filter(month__gte=timezone.localtime(since).date())
+    if until:
+        stats = stats.filter(month__lt=timezone.localtime(until).date())
+
+    return stats
+
+
+def driver_trips_over_1_hour_from_stats(since=None, until=None, exclude_months=()):
+    """
+    - Same report read from the DriverMonthlyStats rollup, month granularity.
+    """
+
+    stats = filter_stats_months(DriverMonthlyStats.objects.filter(over_1h_count__gt=0), since, until)
+    if exclude_months:
+        stats = stats.exclude(month__in=exclude_months)
+
+    return (
+        stats
+        .annotate(
+            driver_name=Concat('driver__first_name', Value(' '), 'driver__last_name'),
+            trips_over_1_hour=F('over_1h_count'),
+        )
+        .values('driver_id', 'driver_name', 'month', 'trips_over_1_hour')
+        .order_by('month', 'driver_name', 'driver_id')
+    )
+
+
+def is_month_start(timestamp):
+    local = timezone.localtime(timestamp)
+
+    return local.day == 1 and local.time() == local.time().min
+
+
+def is_whole_months(since=None, until=None):
+    return all(is_month_start(bound) for bound in (since, until) if bound)
+
+
+def get_stale_months(since=None, until=None):
+    """
+    - Months of the range the rollup can't answer: marked dirty, or with
+    drop-offs but no rollup rows at all(ie: rebuild_driver_stats --all
+    never ran).
+    """
+
+    stats = filter_stats_months(DriverMonthlyStats.objects.all(), since, until)
+    rides = Ride.objects.filter(driver__isnull=False, dropoff_at__isnull=False, pickup_started_at__isnull=False)
+    if since:
+        rides = rides.filter(dropoff_at__gte=since)
+    if until:
+        rides = rides.filter(dropoff_at__lt=until)
+
+    ride_months = {timezone.localtime(month).date() for month in rides.datetimes('dropoff_at', 'month')}
+    stats_months = set(stats.values_list('month', flat=True).distinct())
+    dirty_months = set(stats.filter(is_dirty=True).values_list('month', flat=True).distinct())
+
+    return dirty_months | (ride_months - stats_months)
+
+
+def iter_driver_trips_over_1_hour(since=None, until=None, chunk_size=2000, use_stats=True):
+    """
+    - Stream report rows as tuples, DRIVER_TRIPS_COLUMNS order.
+    - Reads the rollup when the range is whole months, rides otherwise.
+    Months the rollup can't answer(get_stale_months) are read from the
+    rides too, merged in order.
+    """
+
+    if not (use_stats and is_whole_months(since, until)):
+        querysets = [driver_trips_over_1_hour(since, until)]
+    else:
+        stale_months = get_stale_months(since, until)
+        querysets = [driver_trips_over_1_hour_from_stats(since, until, exclude_months=stale_months)]
+        if stale_months:
+            querysets.append(driver_trips_over_1_hour(since, until, months=stale_months))
+
+    def order(row):
+        # Rollup months are dates, TruncMonth ones datetimes
+        month = row['month']
+        if isinstance(month, datetime):
+            month = timezone.localtime(month).date()
+
+        return month, row['driver_name'], row['driver_id']
+
+    rows = heapq.merge(*(queryset.iterator(chunk_size=chunk_size) for queryset in querysets), key=order)
+    for row in rows:
+        yield row['driver_name'], row['month'].strftime('%Y-%m'), row['trips_over_1_hour']
+
+
+def rebuild_driver_stats(month):
+    """
+    - Recompute one month of DriverMonthlyStats from the rides.
+    - month is the first day of the month.
+    """
+
+    since, until = get_month_bounds(month)
+    duration = ExpressionWrapper(
+        F('dropoff_at') - F('pickup_started_at'), output_field=DurationField()
+    )
+
+    rows = (
+        Ride.objects
+        .filter(
+            driver__isnull=False,
+            pickup_started_at__isnull=False,
+            dropoff_at__gte=since,
+            dropoff_at__lt=until,
+        )
+        .annotate(duration=duration)
+        .values('driver_id')
+        .annotate(
+            trip_count=Count('id'),
+            over_1h_count=Count('id', filter=Q(duration__gt=DriverMonthlyStats.LONG_TRIP)),
+            total_duration=Sum('duration'),
+        )
+    )
+
+    with transaction.atomic():
+        DriverMonthlyStats.objects.filter(month=month).delete()
+        stats = DriverMonthlyStats.objects.bulk_create([
+            DriverMonthlyStats(month=month, **row) for row in rows
+        ])
+
+    return len(stats)
+
+
+def iter_ride_estimates(since=None, until=None, chunk_size=10000):
+    """
+    - Every ride with its trip length, ETA and fare(api/estimates.py),
+    RIDE_ESTIMATE_COLUMNS rows.
+    - since/until bound the pickup time, until is exclusive.
+    - Read in chunks of chunk_size by id, each chunk estimated at once.
+    """
+
+    rides = Ride.objects.all()
+    if since:
+        rides = rides.filter(pickup_time__gte=since)
+    if until:
+        rides = rides.filter(pickup_time__lt=until)
+
+    last_id = 0
+    while True:
+        chunk = rides.filter(id__gt=last_id).order_by('id')[:chunk_size]
+        columns, estimates = estimate_queryset(chunk, 'id', 'rider_id', 'driver_id', 'status', 'pickup_time')
+        ids = columns[0]
+        if not ids:
+            return
+
+        # naive local time: openpyxl can't write aware datetimes
+        pickup_times = [timezone.localtime(value).replace(tzinfo=None) for value in columns[4]]
+        yield from zip(*columns[:4], pickup_times, *(estimates[field].tolist() for field in ESTIMATE_FIELDS))
+        last_id = ids[-1]
+
+
+def write_report(rows, path, columns):
+    """
+    - Write rows to .xlsx (openpyxl write-only mode) or .csv as they come,
+    nothing is kept in memory.
+    - Returns the number of rows written.
+    """
+
+    count = 0
+    path = str(path)
+
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+
+        return count
+
+    if not path.endswith('.xlsx'):
+        raise ValueError(f"Unsupported report format: '{path}', use .xlsx or .csv")
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(columns)
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(path)
+
+    return count
@@ -0,0 +1,63 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICA_DB_ALIAS = 'replica'
+
+# Alias reads of the current request/block go to, None for the primary.
+_read_alias = ContextVar('read_alias', default=None)
+
+
+@contextmanager
+def read_from_replica(enabled=True):
+    """
+    - Reads inside the block go to the replica(when one is configured):
+        with read_from_replica():
+            ...
+    - Also follows the block into sync_to_async threads(async ORM).
+    """
+
+    token = _read_alias.set(REPLICA_DB_ALIAS if enabled else None)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    - DATABASE_ROUTERS when a replica is configured, see: ride/settings.py
+    - Every write, and every read outside read_from_replica(), goes to the
+    primary('default'): only actions that opted in(ReplicaReadsMixin) can
+    read data behind the primary by the replica's lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets the schema from the primary.
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadsMixin:
+    """
+    - Viewset actions in replica_actions read from the replica, the others
+    (book, update_status...) read and write on the primary.
+    """
+    replica_actions = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        # action_map is set by as_view(), self.action only once dispatch starts.
+        action = self.action_map.get(request.method.lower())
+
+        with read_from_replica(action in self.replica_actions):
+            return super().dispatch(request, *args, **kwargs)
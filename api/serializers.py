@@ -1,10 +1,107 @@
+from decimal import Decimal
+from operator import attrgetter
+
+from django.db import models
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+
+from .estimates import estimate_rides
+from .metrics import serializer_duration, timed
+from .querysets import parse_coordinates
+from .models import RideUser, Ride, RideEvent, DriverMonthlyStats, ReportJob
+from .reports import get_date_range
+
+
+COORDINATE_DECIMAL_PLACES = 16
+
+
+def format_coordinate(value):
+    """
+    - Pads the shortest repr of the float instead of building a Decimal.
+    """
+
+    text = repr(float(value))
+    whole, _, fraction = text.partition('.')
+
+    if 'e' in text or len(fraction) > COORDINATE_DECIMAL_PLACES:
+        return format(Decimal(text), f'.{COORDINATE_DECIMAL_PLACES}f')
+
+    return f'{whole}.{fraction.ljust(COORDINATE_DECIMAL_PLACES, "0")}'
+
+
+def format_datetime(value):
+    """
+    - Same output as DRF's DateTimeField(ISO 8601, 'Z' for UTC).
+    """
+
+    if not value:
+        return None
+
+    if timezone.is_aware(value):
+        value = value.astimezone(timezone.get_current_timezone())
+
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+
+    return value
 
-from .models import RideUser, Ride, RideEvent
 
+class CoordinateField(serializers.FloatField):
+    """
+    - Coordinates are stored as floats but are still rendered the way
+    the old DecimalField(decimal_places=16) did, ie: "14.5995000000000000".
+    - Only finite lat(*_lat) in [-90, 90] and long in [-180, 180] are
+    accepted, FloatField alone takes "nan", "inf" and "1e308".
+    """
+    default_error_messages = {
+        'invalid_coordinate': "A valid {axis} is required.",
+    }
 
-class RideUserSerializer(serializers.ModelSerializer):
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        is_lat = self.field_name.endswith('lat')
+        coordinates = parse_coordinates(value, 0) if is_lat else parse_coordinates(0, value)
+        if coordinates is None:
+            self.fail('invalid_coordinate', axis='latitude' if is_lat else 'longitude')
+
+        return value
+
+    def to_representation(self, value):
+        return format_coordinate(value)
+
+
+class RideModelSerializer(serializers.ModelSerializer):
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.FloatField: CoordinateField,
+    }
+
+
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with timed(serializer_duration, serializer=type(self.child).__name__):
+            return super().data
+
+
+class TimedSerializerMixin:
+    """
+    - Times building .data, see: api_serializer_duration_seconds at /metrics
+    - many=True is timed as a whole with Meta.list_serializer_class = TimedListSerializer,
+    nested serializers are part of their parent's time.
+    """
+
+    @property
+    def data(self):
+        with timed(serializer_duration, serializer=type(self).__name__):
+            return super().data
+
+
+class RideUserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
+        list_serializer_class = TimedListSerializer
         model = RideUser
         fields = [
             'id', 
@@ -39,10 +136,11 @@ class CreateRideUserSerializer(serializers.ModelSerializer):
         return user
 
 
-class RideEventSerializer(serializers.ModelSerializer):
+class RideEventSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     ride = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
+        list_serializer_class = TimedListSerializer
         model = RideEvent
         fields = [
             'id',
@@ -53,15 +151,60 @@ class RideEventSerializer(serializers.ModelSerializer):
         read_only_fields = ['created']
 
 
-class RideSerializer(serializers.ModelSerializer):
+class RideListSerializer(TimedListSerializer):
+    """
+    - Estimates every ride of the list in one vectorized pass(api/estimates.py)
+    instead of one at a time, unless ?fields= leaves 'estimate' out.
+    """
+
+    def to_representation(self, data):
+        rides = data.all() if isinstance(data, models.manager.BaseManager) else data
+        if self.needs_estimates():
+            rides = estimate_rides(rides)
+
+        return super().to_representation(rides)
+
+    def needs_estimates(self):
+        # FastRideSerializer has accessors instead of fields
+        accessors = getattr(self.child, 'accessors', None)
+        if accessors is not None:
+            return any(name == 'estimate' for name, _ in accessors)
+
+        return 'estimate' in self.child.fields
+
+
+class RideSerializer(TimedSerializerMixin, RideModelSerializer):
     rider = RideUserSerializer(read_only=True)
     driver = RideUserSerializer(read_only=True)
     recent_events = RideEventSerializer(many=True, read_only=True)
     distance_km = serializers.SerializerMethodField()
+    # Trip length, ETA and fare, see: api/estimates.py
+    estimate = serializers.SerializerMethodField()
 
     class Meta:
+        list_serializer_class = RideListSerializer
         model = Ride
-        fields = "__all__"
+        # pickup_cell is internal to the distance search.
+        exclude = ['pickup_cell']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # ?fields= and ?expand=, see: RideViewset.get_field_params
+        fields = self.context.get('fields')
+        expand = self.context.get('expand')
+
+        if expand is not None:
+            for name in ('rider', 'driver'):
+                if name not in expand:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+            if 'events' not in expand:
+                self.fields.pop('recent_events')
+
+        if fields is not None:
+            for name in list(self.fields):
+                if name not in fields:
+                    self.fields.pop(name)
 
     def get_distance_km(self, obj):
         distance_km = getattr(obj, 'distance_km', None)
@@ -71,9 +214,166 @@ class RideSerializer(serializers.ModelSerializer):
 
         return round(distance_km, 2)
 
+    def get_estimate(self, obj):
+        # Set by RideListSerializer for lists
+        if not hasattr(obj, 'estimate'):
+            estimate_rides([obj])
+
+        return obj.estimate
+
+
+class FastRideSerializer(TimedSerializerMixin, serializers.BaseSerializer):
+    """
+    - Read-only drop-in for RideSerializer on list pages(?serializer=fast).
+    - Same JSON, but each field is read through an accessor compiled once
+    from RideSerializer's fields instead of DRF's field machinery.
+    """
+    _accessors = None
+    SKIP = object()
 
-class CreateRideSerializer(serializers.ModelSerializer):
     class Meta:
+        list_serializer_class = RideListSerializer
+
+    @classmethod
+    def get_accessors(cls):
+        if cls._accessors is None:
+            cls._accessors = [
+                (name, cls.build_accessor(name, field))
+                for name, field in RideSerializer().fields.items()
+            ]
+
+        return cls._accessors
+
+    @classmethod
+    def build_accessor(cls, name, field):
+        user_fields = RideUserSerializer.Meta.fields
+
+        def user(ride):
+            value = getattr(ride, name)
+            if value is None:
+                return None
+
+            return {user_field: getattr(value, user_field) for user_field in user_fields}
+
+        def events(ride):
+            # Not prefetched(ie: right after booking), RideSerializer skips it too.
+            if not hasattr(ride, name):
+                return cls.SKIP
+
+            return [
+                {
+                    'id': event.id,
+                    'ride': event.ride_id,
+                    'description': event.description,
+                    'created': format_datetime(event.created),
+                }
+                for event in getattr(ride, name)
+            ]
+
+        def distance(ride):
+            distance_km = getattr(ride, 'distance_km', None)
+
+            return round(distance_km, 2) if distance_km else None
+
+        def estimate(ride):
+            if not hasattr(ride, 'estimate'):
+                estimate_rides([ride])
+
+            return ride.estimate
+
+        if isinstance(field, RideUserSerializer):
+            return user
+        if isinstance(field, serializers.ListSerializer):
+            return events
+        if name == 'distance_km':
+            return distance
+        if name == 'estimate':
+            return estimate
+        if isinstance(field, CoordinateField):
+            return lambda ride: format_coordinate(getattr(ride, name))
+        if isinstance(field, serializers.DateTimeField):
+            return lambda ride: format_datetime(getattr(ride, name))
+
+        return lambda ride: getattr(ride, name)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accessors = self.get_accessors()
+
+        # Same ?fields= and ?expand= handling as RideSerializer
+        fields = self.context.get('fields')
+        expand = self.context.get('expand')
+        if fields is None and expand is None:
+            return
+
+        accessors = []
+        for name, accessor in self.accessors:
+            if fields is not None and name not in fields:
+                continue
+            if expand is not None:
+                if name == 'recent_events' and 'events' not in expand:
+                    continue
+                if name in ('rider', 'driver') and name not in expand:
+                    accessor = attrgetter(f'{name}_id')
+            accessors.append((name, accessor))
+
+        self.accessors = accessors
+
+    def to_representation(self, ride):
+        data = {}
+        for name, accessor in self.accessors:
+            value = accessor(ride)
+            if value is not self.SKIP:
+                data[name] = value
+
+        return data
+
+
+class RideUserPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    - Uses the users looked up by CreateRideListSerializer when there
+    are any, instead of one query per rider/driver.
+    """
+
+    def to_internal_value(self, data):
+        users = self.context.get('prefetched_users')
+        if users is None:
+            return super().to_internal_value(data)
+
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        if pk not in users:
+            self.fail('does_not_exist', pk_value=data)
+
+        return users[pk]
+
+
+class CreateRideListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        # Look up every rider/driver of the list in one query.
+        pks = set()
+        for item in data if isinstance(data, list) else []:
+            for field in ('rider', 'driver'):
+                try:
+                    pks.add(int(item.get(field)))
+                except (AttributeError, TypeError, ValueError):
+                    pass
+
+        self._context['prefetched_users'] = RideUser.objects.in_bulk(pks)
+
+        return super().to_internal_value(data)
+
+
+class CreateRideSerializer(RideModelSerializer):
+    serializer_related_field = RideUserPrimaryKeyField
+
+    class Meta:
+        list_serializer_class = CreateRideListSerializer
         model = Ride
         fields = [
             'rider',
@@ -84,3 +384,159 @@ class CreateRideSerializer(serializers.ModelSerializer):
             'dropoff_long',
             'pickup_time'
         ]
+
+
+class StrictIntegerField(serializers.IntegerField):
+    """
+    - JSON integers only, IntegerField would also take "1" and 1.0.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, int):
+            self.fail('invalid')
+
+        return super().to_internal_value(data)
+
+
+class RideStatusListSerializer(serializers.ListSerializer):
+    """
+    - Looks up every ride of the list in one query(context 'rides'),
+    then reports rides listed more than once along with the other errors.
+    """
+
+    def to_internal_value(self, data):
+        items = data if isinstance(data, list) else []
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        rides = Ride.objects.only('id', 'driver_id', 'pickup_started_at', 'dropoff_at').in_bulk(
+            [ride_id for ride_id in ids if type(ride_id) is int]
+        )
+        self._context['rides'] = rides
+
+        try:
+            validated_data = super().to_internal_value(data)
+            errors = [{} for _ in validated_data]
+        except serializers.ValidationError as e:
+            if not isinstance(e.detail, list):
+                raise
+            validated_data, errors = None, e.detail
+
+        seen = set()
+        for item, item_errors in zip(items, errors):
+            ride_id = item.get('id') if isinstance(item, dict) else None
+            if 'id' in item_errors or ride_id not in rides:
+                continue
+            if ride_id in seen:
+                item_errors['id'] = [f"Ride {ride_id} is listed more than once."]
+            seen.add(ride_id)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return validated_data
+
+
+class RideStatusSerializer(serializers.Serializer):
+    """
+    - One item of RideViewset.bulk_update_status, validated data has the
+    ride instead of its id.
+    """
+    id = StrictIntegerField()
+    status = serializers.ChoiceField(choices=Ride.StatusChoices.choices)
+
+    class Meta:
+        list_serializer_class = RideStatusListSerializer
+
+    def validate_id(self, value):
+        if value not in self.context['rides']:
+            raise serializers.ValidationError(f"Ride {value} does not exist.")
+
+        return value
+
+    def validate(self, attrs):
+        return {'ride': self.context['rides'][attrs['id']], 'status': attrs['status']}
+
+
+class RideEventHistorySerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    - Hot and archived events of a ride(values() rows), see: RideViewset.history
+    """
+    id = serializers.IntegerField()
+    ride = serializers.IntegerField()
+    description = serializers.CharField()
+    created = serializers.DateTimeField()
+    archived = serializers.BooleanField()
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+
+
+class DriverMonthlyStatsSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    driver_name = serializers.CharField(source='driver.get_full_name', read_only=True)
+    avg_duration = serializers.DurationField(read_only=True)
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+        model = DriverMonthlyStats
+        fields = [
+            'driver',
+            'driver_name',
+            'month',
+            'trip_count',
+            'over_1h_count',
+            'total_duration',
+            'avg_duration',
+            'is_dirty',
+        ]
+
+
+class ReportJobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        list_serializer_class = TimedListSerializer
+        model = ReportJob
+        fields = [
+            'id',
+            'kind',
+            'params',
+            'status',
+            'requested_by',
+            'created',
+            'started',
+            'finished',
+            'rows',
+            'error',
+            'download',
+        ]
+
+    def get_download(self, obj):
+        if obj.status != ReportJob.StatusChoices.DONE:
+
+            return None
+
+        return reverse('api:reportjob-download', args=[obj.id], request=self.context.get('request'))
+
+
+class ReportRequestSerializer(serializers.Serializer):
+    """
+    - Params of a queued report, same as the export commands' options.
+    - Validated data is the job's params: only what was sent, as strings,
+    so identical requests get the same key(see: api/jobs.py).
+    """
+
+    format = serializers.ChoiceField(choices=['xlsx', 'csv'], default='xlsx')
+    month = serializers.CharField(required=False, help_text="YYYY-MM")
+    since = serializers.CharField(required=False, help_text="YYYY-MM-DD")
+    until = serializers.CharField(required=False, help_text="YYYY-MM-DD, exclusive")
+
+    def validate(self, attrs):
+        try:
+            get_date_range(attrs.get('month'), attrs.get('since'), attrs.get('until'))
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+        return {name: value for name, value in attrs.items() if value not in (None, '', False)}
+
+
+class DriverTripsReportSerializer(ReportRequestSerializer):
+    raw = serializers.BooleanField(default=False, help_text="Compute from the rides instead of the rollup")
@@ -0,0 +1,41 @@
+from django.conf import settings
+
+# SQLITE_TUNING profile, SQLITE_PRAGMAS in ride/settings.py overrides single ones.
+TUNED_PRAGMAS = {
+    # Readers don't block the writer and the writer doesn't block readers.
+    'journal_mode': 'WAL',
+    # WAL stays consistent with NORMAL, only the last commits can be lost on power loss.
+    'synchronous': 'NORMAL',
+    # ms a connection waits for the write lock before 'database is locked'
+    'busy_timeout': 5000,
+    # Read the file through a 256MB memory map instead of read() calls.
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative: KiB, 64MB page cache per connection
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+}
+
+
+def get_pragmas():
+    return {**TUNED_PRAGMAS, **getattr(settings, 'SQLITE_PRAGMAS', {})}
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    - connection_created receiver(ApiConfig.ready), applies the SQLite
+    profile to every new connection when SQLITE_TUNING is on.
+    - Transactions also start with BEGIN IMMEDIATE: a transaction that reads
+    then writes(ie: update_status) otherwise fails right away with
+    'database is locked' when another one writes meanwhile, busy_timeout
+    only helps when the lock is taken first.
+    """
+
+    if connection.vendor != 'sqlite' or not getattr(settings, 'SQLITE_TUNING', False):
+        return
+
+    with connection.cursor() as cursor:
+        for name, value in get_pragmas().items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+    if connection.transaction_mode is None:
+        connection.transaction_mode = 'IMMEDIATE'
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+from django.db import transaction
+
+from .serializers import RideEventSerializer
+
+
+class Subscription:
+    """
+    - One watcher of a ride: a bounded queue on the watcher's event loop.
+    - A watcher too slow to keep up is marked overflowed instead of
+    growing the queue, it should reconnect and catch up from the database.
+    """
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, item):
+        # Runs on self.loop, see: RideEventBroker.publish
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class RideEventBroker:
+    """
+    - In-process pub/sub of RideEvents per ride, for the event streams
+    (api/async_views.py).
+    - publish() can be called from any thread(sync views), the events are
+    handed to each watcher's event loop with call_soon_threadsafe.
+    - Only watchers connected to the same process get the events, see:
+    RIDE_EVENT_STREAM_TIMEOUT in ride/settings.py
+    """
+
+    def __init__(self, maxsize=100):
+        self.maxsize = maxsize
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, ride_id):
+        subscription = Subscription(asyncio.get_running_loop(), self.maxsize)
+        with self.lock:
+            self.subscriptions.setdefault(ride_id, set()).add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, ride_id, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(ride_id)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.subscriptions[ride_id]
+
+    def has_subscribers(self, ride_id):
+        return ride_id in self.subscriptions
+
+    def publish(self, ride_id, item):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(ride_id, ()))
+
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, item)
+            except RuntimeError:
+                # The watcher's loop is closed, it is gone.
+                self.unsubscribe(ride_id, subscription)
+
+
+broker = RideEventBroker()
+
+
+def publish_ride_events(*events):
+    """
+    - Push new events to their ride's watchers, once the current
+    transaction commits. Only serialized for rides someone watches.
+    """
+
+    def publish():
+        for event in events:
+            if broker.has_subscribers(event.ride_id):
+                broker.publish(event.ride_id, RideEventSerializer(event).data)
+
+    transaction.on_commit(publish)
@@ -1,3 +1,1248 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import random
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import Prefetch
+from django.test import AsyncClient, TestCase, override_settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from .cache import get_response_cache
+from .authentication import RideTokenObtainPairSerializer, get_claims_cache, get_claims_version, invalidate_user_claims
+from .estimates import estimate_queryset, haversine_km, haversine_km_scalar
+from .instrumentation import track_queries
+from .jobs import claim_job, get_reports_dir, requeue_stale_jobs, run_job, work
+from .locations import driver_index
+from .metrics import Registry, merge_snapshots, render
+from .models import RideUser, Ride, RideEvent, RideEventArchive, DriverLocation, DriverMonthlyStats, ReportJob
+from .querysets import calculate_distance, filter_within_radius, get_grid_cell
+from .reports import iter_driver_trips_over_1_hour, rebuild_driver_stats
+from .serializers import RideSerializer, FastRideSerializer
+from .streams import RideEventBroker, broker
+
+
+class FastRideSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin',
+            role=RideUser.RoleChoices.ADMIN,
+            is_staff=True,
+            is_superuser=True,
+        )
+        rider = RideUser.objects.create(
+            username='rider', email='rider@example.com', first_name='Emma', phone_number='1'
+        )
+        driver = RideUser.objects.create(
+            username='driver', role=RideUser.RoleChoices.DRIVER, phone_number='2'
+        )
+        coordinates = [
+            (14.5995, 120.9842),
+            (-33.8688, 151.0),
+            (0.1 + 0.2, -0.00001),
+            (14.123456789012345, 121.98765432109876),
+        ]
+
+        for i, (lat, long) in enumerate(coordinates):
+            ride = Ride.objects.create(
+                rider=rider,
+                driver=driver if i % 2 else None,
+                pickup_lat=lat,
+                pickup_long=long,
+                dropoff_lat=lat + 0.5,
+                dropoff_long=long - 0.5,
+                pickup_time=timezone.now() - timedelta(hours=i),
+                dropoff_at=timezone.now() if i == 3 else None,
+            )
+            RideEvent.objects.create(ride=ride, description='Driver is on the way. ')
+            old_event = RideEvent.objects.create(ride=ride, description='Old event. ')
+            RideEvent.objects.filter(id=old_event.id).update(created=timezone.now() - timedelta(days=2))
+
+    def get_rides(self):
+        cutoff = timezone.now() - timedelta(hours=24)
+        recent_events = Prefetch(
+            'events',
+            queryset=RideEvent.objects.filter(created__gte=cutoff),
+            to_attr='recent_events',
+        )
+        queryset = Ride.objects.select_related('driver', 'rider').prefetch_related(recent_events)
+
+        return list(calculate_distance(queryset, 14.5995, 120.9842).order_by('-pickup_time'))
+
+    def test_same_json_as_ride_serializer(self):
+        rides = self.get_rides()
+        renderer = JSONRenderer()
+
+        self.assertEqual(
+            renderer.render(FastRideSerializer(rides, many=True).data),
+            renderer.render(RideSerializer(rides, many=True).data),
+        )
+
+    def test_same_json_without_prefetched_events(self):
+        ride = Ride.objects.select_related('driver', 'rider').first()
+
+        self.assertEqual(FastRideSerializer(ride).data, RideSerializer(ride).data)
+
+    def test_same_json_with_fields_and_expand(self):
+        rides = self.get_rides()
+        renderer = JSONRenderer()
+
+        for context in [
+            {'fields': {'id', 'status', 'pickup_time'}, 'expand': None},
+            {'fields': None, 'expand': set()},
+            {'fields': {'id', 'rider', 'driver', 'recent_events'}, 'expand': {'driver'}},
+        ]:
+            with self.subTest(**context):
+                self.assertEqual(
+                    renderer.render(FastRideSerializer(rides, many=True, context=context).data),
+                    renderer.render(RideSerializer(rides, many=True, context=context).data),
+                )
+
+    def test_list_endpoint_serializer_fast(self):
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        url = '/api/rides/?lat=14.5995&long=120.9842&ordering=distance_km'
+
+        response = client.get(url)
+        fast_response = client.get(f'{url}&serializer=fast')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(fast_response.content, response.content)
+
+
+class QueryBudgetMixin:
+    """
+    - assertMaxQueries: fail when a block runs more queries than its
+    budget, listing them. Unlike assertNumQueries, fewer is fine.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, budget, msg=None):
+        with track_queries(keep_statements=True) as stats:
+            yield stats
+
+        if stats.count > budget:
+            statements = '\n'.join(f'  {sql}' for sql in stats.statements)
+            self.fail(self._formatMessage(msg, f'{stats.count} queries, budget {budget}:\n{statements}'))
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=0, JWT_TRUST_CLAIMS=True)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    - Query budget of every viewset action, with several rides/events
+    so an N+1 goes over it. Requests use real access tokens, trusting
+    their claims(JWT_TRUST_CLAIMS): without it each costs 1 more query.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin',
+            role=RideUser.RoleChoices.ADMIN,
+            is_staff=True,
+            is_superuser=True,
+        )
+        cls.riders = [
+            RideUser.objects.create(username=f'rider{i}', email=f'rider{i}@example.com', phone_number=f'1{i}')
+            for i in range(3)
+        ]
+        cls.drivers = [
+            RideUser.objects.create(username=f'driver{i}', role=RideUser.RoleChoices.DRIVER, phone_number=f'2{i}')
+            for i in range(3)
+        ]
+        cls.rides = []
+        for i in range(6):
+            ride = Ride.objects.create(
+                rider=cls.riders[i % 3],
+                driver=cls.drivers[i % 3],
+                pickup_lat=14.5995 + i / 100,
+                pickup_long=120.9842,
+                dropoff_lat=14.5547,
+                dropoff_long=121.0244,
+                pickup_time=timezone.now() - timedelta(hours=i),
+                pickup_started_at=timezone.now() - timedelta(hours=i),
+            )
+            RideEvent.objects.bulk_create([
+                RideEvent(ride=ride, description='Driver is on the way. '),
+                RideEvent(ride=ride, description='Driver is at the pickup point. '),
+            ])
+            cls.rides.append(ride)
+
+        DriverLocation.objects.bulk_create([
+            DriverLocation(driver=driver, lat=14.6 + i / 100, long=121.0, updated=timezone.now())
+            for i, driver in enumerate(cls.drivers)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        get_claims_cache().clear()
+        driver_index.clear()
+        self.client = APIClient()
+        token = RideTokenObtainPairSerializer.get_token(self.admin).access_token
+        # Read once per JWT_CLAIMS_CACHE_TIMEOUT, not per request
+        get_claims_version(self.admin.pk)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def assertBudgets(self, requests):
+        for name, method, url, data, budget in requests:
+            with self.subTest(name):
+                with self.assertMaxQueries(budget, name):
+                    response = getattr(self.client, method)(url, data, format='json')
+
+                self.assertLess(response.status_code, 300, response.content)
+
+    def booking(self, i=0):
+        return {
+            'rider': self.riders[i % 3].id,
+            'driver': self.drivers[i % 3].id,
+            'pickup_lat': '14.5995',
+            'pickup_long': '120.9842',
+            'dropoff_lat': '14.5547',
+            'dropoff_long': '121.0244',
+            'pickup_time': timezone.now().isoformat(),
+        }
+
+    def test_ride_viewset_budgets(self):
+        ride = self.rides[0]
+        rider = self.riders[0]
+
+        self.assertBudgets([
+            # COUNT(*), rides with rider/driver, recent_events
+            ('list', 'get', '/api/rides/', None, 3),
+            ('list ?status=', 'get', '/api/rides/?status=PU', None, 3),
+            ('list ?rider__email=', 'get', f'/api/rides/?rider__email={rider.email}', None, 3),
+            ('list ?fields=', 'get', '/api/rides/?fields=id,status', None, 2),
+            ('list ?expand=', 'get', '/api/rides/?expand=', None, 2),
+            ('list ?serializer=fast', 'get', '/api/rides/?serializer=fast', None, 3),
+            ('list ?pagination=cursor', 'get', '/api/rides/?pagination=cursor', None, 2),
+            ('list ?radius_km=', 'get',
+                '/api/rides/?lat=14.5995&long=120.9842&radius_km=5&ordering=distance_km', None, 3),
+            ('async list', 'get', '/api/async/rides/', None, 3),
+            ('retrieve', 'get', f'/api/rides/{ride.id}/', None, 2),
+            ('async retrieve', 'get', f'/api/async/rides/{ride.id}/', None, 2),
+            ('history', 'get', f'/api/rides/{ride.id}/history/', None, 3),
+            # rider, driver, ride, event
+            ('book', 'post', '/api/rides/book/', self.booking(), 4),
+            ('bulk_book', 'post', '/api/rides/bulk_book/', [self.booking(i) for i in range(5)], 5),
+            ('update_status', 'post', f'/api/rides/{ride.id}/update_status/', {'status': 'ER'}, 5),
+            ('update_status drop-off', 'post', f'/api/rides/{ride.id}/update_status/', {'status': 'DO'}, 9),
+            # One stats upsert per driver/month(3 drivers), not per ride
+            ('bulk_update_status', 'post', '/api/rides/bulk_update_status/', [
+                {'id': ride.id, 'status': 'DO'} for ride in self.rides[1:5]
+            ], 15),
+            ('delete_forever', 'delete', f'/api/rides/{self.rides[5].id}/delete_forever/', None, 4),
+        ])
+
+    def test_ride_user_viewset_budgets(self):
+        rider = self.riders[0]
+        driver = self.drivers[0]
+
+        self.assertBudgets([
+            ('ping', 'post', f'/api/users/{driver.id}/ping/', {'lat': 14.61, 'long': 121.0}, 1),
+            # pings since the last sync, available drivers
+            ('nearest_drivers', 'get', '/api/users/nearest_drivers/?lat=14.6&long=121.0&k=2', None, 2),
+            ('list', 'get', '/api/users/', None, 1),
+            ('retrieve', 'get', f'/api/users/{rider.id}/', None, 1),
+            ('register', 'post', '/api/users/register/', {
+                'username': 'new_rider',
+                'password': 'Secret-123',
+                'email': 'new_rider@example.com',
+                'phone_number': '99',
+            }, 2),
+            # + the claims_version bump
+            ('update_role', 'post', f'/api/users/{rider.id}/update_role/', {'role': 'DR'}, 3),
+            ('update_user', 'patch', f'/api/users/{rider.id}/update_user/', {'first_name': 'Emma'}, 2),
+            ('set_inactive', 'post', f'/api/users/{rider.id}/set_inactive/', None, 3),
+        ])
+
+    def test_ride_event_viewset_budgets(self):
+        ride = self.rides[0]
+        event = ride.events.first()
+
+        self.assertBudgets([
+            ('create', 'post', '/api/events/', {'ride_id': ride.id, 'description': 'Passenger on board.'}, 2),
+            ('destroy', 'delete', f'/api/events/{event.id}/', None, 2),
+        ])
+
+    def test_book_rejects_invalid_coordinates(self):
+        rides = Ride.objects.count()
+        for field, value in [
+            ('pickup_lat', 'nan'),
+            ('pickup_long', 'inf'),
+            ('dropoff_lat', '1e308'),
+            ('dropoff_lat', '90.5'),
+            ('dropoff_long', '-180.5'),
+        ]:
+            with self.subTest(field=field, value=value):
+                response = self.client.post('/api/rides/book/', {**self.booking(), field: value}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json())
+
+                response = self.client.post(
+                    '/api/rides/bulk_book/', [self.booking(), {**self.booking(), field: value}], format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.json()['errors'][1]), [field])
+
+        self.assertEqual(Ride.objects.count(), rides)
+
+    def test_bulk_book_is_all_or_nothing(self):
+        rides, events = Ride.objects.count(), RideEvent.objects.count()
+        invalid_rider = {**self.booking(1), 'rider': 999999}
+        invalid_lat = {**self.booking(2), 'pickup_lat': 'north'}
+
+        response = self.client.post(
+            '/api/rides/bulk_book/', [self.booking(0), invalid_rider, self.booking(3), invalid_lat], format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(errors[0], {})
+        self.assertEqual(list(errors[1]), ['rider'])
+        self.assertEqual(errors[2], {})
+        self.assertEqual(list(errors[3]), ['pickup_lat'])
+        self.assertEqual((Ride.objects.count(), RideEvent.objects.count()), (rides, events))
+
+        response = self.client.post('/api/rides/bulk_book/', [self.booking(i) for i in range(3)], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Ride.objects.count(), rides + 3)
+        self.assertEqual(RideEvent.objects.count(), events + 3)
+
+    def test_bulk_update_status(self):
+        rides = self.rides[:2]
+        response = self.client.post('/api/rides/bulk_update_status/', [
+            {'id': rides[0].id, 'status': 'DO'},
+            {'id': rides[1].id, 'status': 'ER'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+
+        ride = Ride.objects.get(id=rides[0].id)
+        events = RideEvent.objects.filter(id__in=[event['id'] for event in response.json()['data']])
+        self.assertEqual(ride.status, Ride.StatusChoices.DROPOFF)
+        self.assertEqual({event.created for event in events}, {ride.dropoff_at})
+
+    def test_bulk_update_status_is_all_or_nothing(self):
+        ride, other = self.rides[:2]
+        events = RideEvent.objects.count()
+
+        response = self.client.post('/api/rides/bulk_update_status/', [
+            {'id': ride.id, 'status': 'ER'},
+            {'id': other.id, 'status': 'XX'},
+            {'id': ride.id, 'status': 'DO'},
+            {'id': 999999, 'status': 'ER'},
+            {'id': str(other.id), 'status': 'ER'},
+            {'id': other.id + 0.5, 'status': 'ER'},
+            {'id': float(other.id), 'status': 'ER'},
+            {'id': True, 'status': 'ER'},
+            {'status': 'ER'},
+            'ER',
+        ], format='json')
+
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(len(errors), 10)
+        self.assertEqual(errors[0], {})
+        self.assertEqual(list(errors[1]), ['status'])
+        self.assertEqual(errors[2], {'id': [f"Ride {ride.id} is listed more than once."]})
+        self.assertEqual(errors[3], {'id': ["Ride 999999 does not exist."]})
+        for item_errors in errors[4:9]:
+            self.assertEqual(list(item_errors), ['id'])
+        self.assertIn('non_field_errors', errors[9])
+
+        self.assertEqual(Ride.objects.get(id=ride.id).status, ride.status)
+        self.assertEqual(RideEvent.objects.count(), events)
+
+    def test_book_response_has_recent_events(self):
+        response = self.client.post('/api/rides/book/', self.booking(), format='json')
+
+        events = response.json()['data']['recent_events']
+        self.assertEqual([event['description'] for event in events], ['Driver is on the way. '])
+
+    def test_booked_rides_and_events_share_a_time(self):
+        response = self.client.post('/api/rides/book/', self.booking(), format='json')
+        ride_ids = [response.json()['data']['id']]
+        response = self.client.post('/api/rides/bulk_book/', [self.booking(i) for i in range(3)], format='json')
+        ride_ids += [ride['id'] for ride in response.json()['data']]
+
+        for ride in Ride.objects.filter(id__in=ride_ids).prefetch_related('events'):
+            self.assertEqual([event.created for event in ride.events.all()], [ride.pickup_started_at])
+
+    @override_settings(DEBUG=True)
+    def test_query_headers_in_debug(self):
+        with track_queries() as stats:
+            response = self.client.get('/api/rides/')
+
+        self.assertEqual(response['X-Query-Count'], str(stats.count))
+        self.assertIn('X-Query-Time-Ms', response)
+        self.assertIn('X-Slowest-Query-Ms', response)
+
+
+class NearestDriversTests(TestCase):
+    """
+    - api/users/nearest_drivers/: nearest first, only active drivers
+    without a ride in progress and with a recent ping.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin',
+            role=RideUser.RoleChoices.ADMIN,
+            is_staff=True,
+            is_superuser=True,
+        )
+        cls.rider = RideUser.objects.create(username='rider', phone_number='1')
+        cls.drivers = [
+            RideUser.objects.create(username=f'driver{i}', role=RideUser.RoleChoices.DRIVER, phone_number=f'2{i}')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        driver_index.clear()
+        self.client = APIClient()
+        token = RideTokenObtainPairSerializer.get_token(self.admin).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        # driver4 nearest(1.1km) ... driver0 farthest(5.6km)
+        for i, driver in enumerate(self.drivers):
+            response = self.client.post(
+                f'/api/users/{driver.id}/ping/', {'lat': 14.6 + (5 - i) / 100, 'long': 121.0}, format='json'
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def get_nearest(self, **params):
+        response = self.client.get('/api/users/nearest_drivers/', {'lat': 14.6, 'long': 121.0, **params})
+        self.assertEqual(response.status_code, 200)
+
+        return [driver['username'] for driver in response.json()['data']]
+
+    def test_nearest_first(self):
+        self.assertEqual(self.get_nearest(k=3), ['driver4', 'driver3', 'driver2'])
+        self.assertEqual(self.get_nearest(k=10, radius_km=2.5), ['driver4', 'driver3'])
+
+    def test_busy_and_inactive_drivers_are_left_out(self):
+        Ride.objects.create(
+            rider=self.rider,
+            driver=self.drivers[4],
+            pickup_lat=14.6,
+            pickup_long=121.0,
+            dropoff_lat=14.5,
+            dropoff_long=121.0,
+            pickup_time=timezone.now(),
+        )
+        Ride.objects.create(
+            rider=self.rider,
+            driver=self.drivers[2],
+            pickup_lat=14.6,
+            pickup_long=121.0,
+            dropoff_lat=14.5,
+            dropoff_long=121.0,
+            pickup_time=timezone.now(),
+            status=Ride.StatusChoices.COMPLETED,
+        )
+        RideUser.objects.filter(id=self.drivers[3].id).update(is_active=False)
+
+        self.assertEqual(self.get_nearest(k=2), ['driver2', 'driver1'])
+
+    def test_pings_move_drivers_and_old_pings_expire(self):
+        self.client.post(f'/api/users/{self.drivers[0].id}/ping/', {'lat': 14.6, 'long': 121.0}, format='json')
+        self.assertEqual(self.get_nearest(k=1), ['driver0'])
+
+        # Saved by another process: picked up by the next lookup's sync
+        DriverLocation.objects.filter(driver=self.drivers[1]).update(
+            lat=14.6, long=121.0001, updated=timezone.now()
+        )
+        self.assertEqual(self.get_nearest(k=2), ['driver0', 'driver1'])
+
+        with override_settings(DRIVER_LOCATION_MAX_AGE=0):
+            self.assertEqual(self.get_nearest(k=1), [])
+
+    def test_only_drivers_can_ping(self):
+        response = self.client.post(f'/api/users/{self.rider.id}/ping/', {'lat': 14.6, 'long': 121.0}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(DriverLocation.objects.filter(driver=self.rider).exists())
+
+    def test_drivers_ping_for_themselves_only(self):
+        driver, other = self.drivers[0], self.drivers[1]
+        client = APIClient()
+        token = RideTokenObtainPairSerializer.get_token(driver).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        response = client.post(f'/api/users/{driver.id}/ping/', {'lat': 14.6, 'long': 121.0}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(DriverLocation.objects.get(driver=driver).lat, 14.6)
+
+        response = client.post(f'/api/users/{other.id}/ping/', {'lat': 14.6, 'long': 121.0}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertNotEqual(DriverLocation.objects.get(driver=other).lat, 14.6)
+
+        # Everything else stays admin only
+        self.assertEqual(client.get('/api/users/').status_code, 403)
+        self.assertEqual(client.get('/api/users/nearest_drivers/', {'lat': 14.6, 'long': 121.0}).status_code, 403)
+
+
+class EstimateTests(TestCase):
+    def test_haversine_matches_scalar(self):
+        rng = random.Random(0)
+        points = [
+            (rng.uniform(-90, 90), rng.uniform(-180, 180), rng.uniform(-90, 90), rng.uniform(-180, 180))
+            for _ in range(1000)
+        ]
+        # Same point and antipodes
+        points += [(14.5995, 120.9842, 14.5995, 120.9842), (0.0, 0.0, 0.0, 180.0)]
+
+        actual = haversine_km(*zip(*points)).tolist()
+        for distance, point in zip(actual, points):
+            self.assertAlmostEqual(distance, haversine_km_scalar(*point), delta=1e-6)
+
+        # Manila to Makati, ~6.6km
+        self.assertAlmostEqual(float(haversine_km(14.5995, 120.9842, 14.5547, 121.0244)), 6.598, delta=0.001)
+
+    def test_list_estimates_match_single_ride(self):
+        admin = RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+        rider = RideUser.objects.create(username='rider')
+        for i in range(5):
+            Ride.objects.create(
+                rider=rider,
+                pickup_lat=14.5995,
+                pickup_long=120.9842,
+                dropoff_lat=14.5 + i / 10,
+                dropoff_long=121.0 - i / 20,
+                pickup_time=timezone.now(),
+            )
+
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0):
+            listed = {ride['id']: ride['estimate'] for ride in client.get('/api/rides/').data['results']}
+
+        for ride in Ride.objects.all():
+            self.assertEqual(listed[ride.id], RideSerializer(ride).data['estimate'])
+
+        # export_rides' path
+        [ids], estimates = estimate_queryset(Ride.objects.all(), 'id')
+        self.assertEqual([listed[ride_id]['fare'] for ride_id in ids], estimates['fare'].tolist())
+
+
+class ReportJobTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+        driver = RideUser.objects.create(
+            username='driver', first_name='Juan', last_name='Cruz', role=RideUser.RoleChoices.DRIVER
+        )
+        dropoff_at = timezone.make_aware(timezone.datetime(2025, 11, 10, 12))
+        Ride.objects.create(
+            driver=driver,
+            pickup_lat=14.5995,
+            pickup_long=120.9842,
+            dropoff_lat=14.5547,
+            dropoff_long=121.0244,
+            pickup_time=dropoff_at - timedelta(hours=2),
+            pickup_started_at=dropoff_at - timedelta(hours=2),
+            dropoff_at=dropoff_at,
+            status=Ride.StatusChoices.DROPOFF,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(REPORTS_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def queue(self, kind='driver_trips', **params):
+        return self.client.post(f'/api/reports/{kind}/', params, format='json')
+
+    def test_identical_requests_share_a_job(self):
+        # Lookup, then the insert(in a savepoint)
+        with self.assertMaxQueries(4):
+            response = self.queue(month='2025-11', raw=True)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['data']['id']
+
+        self.assertEqual(self.queue(month='2025-11', raw=True).data['data']['id'], job_id)
+        self.assertNotEqual(self.queue(month='2025-11').data['data']['id'], job_id)
+        self.assertEqual(self.queue(month='2025-13').status_code, 400)
+        self.assertEqual(self.queue(month='2025-11', since='2025-11-01').status_code, 400)
+
+        # Once done, the same request queues a new job
+        with self.assertLogs('api.jobs', level='INFO'):
+            work('test', once=True)
+        self.assertNotEqual(self.queue(month='2025-11', raw=True).data['data']['id'], job_id)
+
+    def test_worker_writes_the_report(self):
+        job_id = self.queue(month='2025-11', raw=True, format='csv').data['data']['id']
+        self.assertEqual(self.client.get(f'/api/reports/{job_id}/download/').status_code, 409)
+
+        with self.assertLogs('api.jobs', level='INFO') as logs:
+            work('test', once=True)
+        self.assertIn(f'Report job {job_id} done', logs.output[0])
+
+        job = self.client.get(f'/api/reports/{job_id}/').data
+        self.assertEqual(job['status'], ReportJob.StatusChoices.DONE)
+        self.assertEqual(job['rows'], 1)
+
+        response = self.client.get(job['download'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            b''.join(response.streaming_content).decode().splitlines(),
+            ['driver_name,month,trips_over_1_hour', 'Juan Cruz,2025-11,1'],
+        )
+
+    def test_failed_job_keeps_the_error(self):
+        job = ReportJob.objects.create(
+            kind=ReportJob.KindChoices.RIDE_ESTIMATES, params={'since': 'yesterday'}, key='invalid'
+        )
+
+        with self.assertLogs('api.jobs', level='ERROR'):
+            work('test', once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.StatusChoices.FAILED)
+        self.assertIn("Invalid date 'yesterday'", job.error)
+
+    def test_requeued_job_is_left_to_its_new_worker(self):
+        job_id = self.queue(month='2025-11', raw=True, format='csv').data['data']['id']
+        stale = claim_job('old')
+        # Taken as lost(ie: past REPORT_JOB_TIMEOUT) and claimed again meanwhile
+        ReportJob.objects.filter(id=job_id).update(started=timezone.now() - timedelta(days=1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        current = claim_job('new')
+
+        with self.assertLogs('api.jobs', level='WARNING'):
+            run_job(stale)
+
+        job = ReportJob.objects.get(id=job_id)
+        self.assertEqual((job.status, job.worker), (ReportJob.StatusChoices.RUNNING, 'new'))
+        self.assertEqual(list(get_reports_dir().iterdir()), [])
+
+        with self.assertLogs('api.jobs', level='INFO'):
+            run_job(current)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.StatusChoices.DONE)
+        self.assertEqual([path.name for path in get_reports_dir().iterdir()], [job.file])
+
+
+@override_settings(JWT_TRUST_CLAIMS=True)
+class ClaimsInvalidationTests(TestCase):
+    """
+    - Tokens issued before a role/is_active change are rejected, whatever
+    happens to the claims cache meanwhile.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+        cls.admin2 = RideUser.objects.create(
+            username='admin2', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+
+    def setUp(self):
+        get_claims_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+        self.token = RideTokenObtainPairSerializer.get_token(self.admin2).access_token
+
+    def get_with_token(self):
+        return APIClient().get('/api/users/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_update_role(self):
+        self.assertEqual(self.get_with_token().status_code, 200)
+        self.client.post(f'/api/users/{self.admin2.id}/update_role/', {'role': 'RD'}, format='json')
+        self.assertEqual(self.get_with_token().status_code, 401)
+
+        # Evicted/lost cache entries are read from the database again
+        get_claims_cache().clear()
+        self.assertEqual(self.get_with_token().status_code, 401)
+
+    def test_set_inactive(self):
+        self.client.post(f'/api/users/{self.admin2.id}/set_inactive/')
+        self.assertEqual(self.get_with_token().status_code, 401)
+
+    def test_admin_save_model(self):
+        self.client.force_login(self.admin)
+        url = f'/admin/api/rideuser/{self.admin2.id}/change/'
+        response = self.client.get(url)
+        form = response.context['adminform'].form
+        data = {name: value for name, value in form.initial.items() if value is not None}
+        data['role'] = RideUser.RoleChoices.RIDER
+
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.get_with_token().status_code, 401)
+
+    def test_stale_instance_save_keeps_the_version(self):
+        stale = RideUser.objects.get(id=self.admin2.id)
+        invalidate_user_claims(self.admin2.id)
+        stale.first_name = 'Ana'
+        stale.save()
+
+        get_claims_cache().clear()
+        self.assertEqual(self.get_with_token().status_code, 401)
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=30)
+class ResponseCacheTests(TestCase):
+    """
+    - The API's writes invalidate cached ride list/retrieve responses.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+        cls.rider = RideUser.objects.create(username='rider', phone_number='1')
+        cls.driver = RideUser.objects.create(username='driver', role=RideUser.RoleChoices.DRIVER, phone_number='2')
+        cls.ride = Ride.objects.create(
+            rider=cls.rider,
+            driver=cls.driver,
+            pickup_lat=14.5995,
+            pickup_long=120.9842,
+            dropoff_lat=14.5547,
+            dropoff_long=121.0244,
+            pickup_time=timezone.now(),
+            pickup_started_at=timezone.now(),
+        )
+
+    def setUp(self):
+        get_response_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        return response
+
+    def write(self, method, url, data=None):
+        # Versions are bumped on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+
+        return response
+
+    def assertCached(self, url):
+        first = self.get(url)
+        self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+
+        return first.data
+
+    def test_book(self):
+        self.assertEqual(self.assertCached('/api/rides/')['count'], 1)
+        self.write('post', '/api/rides/book/', {
+            'rider': self.rider.id,
+            'driver': self.driver.id,
+            'pickup_lat': '14.5995',
+            'pickup_long': '120.9842',
+            'dropoff_lat': '14.5547',
+            'dropoff_long': '121.0244',
+            'pickup_time': timezone.now().isoformat(),
+        })
+
+        response = self.get('/api/rides/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 2)
+
+    def test_update_status(self):
+        url = f'/api/rides/{self.ride.id}/'
+        self.assertCached('/api/rides/')
+        self.assertCached(url)
+        self.write('post', f'/api/rides/{self.ride.id}/update_status/', {'status': Ride.StatusChoices.ENROUTE})
+
+        self.assertEqual(self.get(url).data['status'], Ride.StatusChoices.ENROUTE)
+        self.assertEqual(self.get('/api/rides/').data['results'][0]['status'], Ride.StatusChoices.ENROUTE)
+
+    def test_delete_forever(self):
+        url = f'/api/rides/{self.ride.id}/'
+        self.assertCached('/api/rides/')
+        self.assertCached(url)
+        self.write('delete', f'/api/rides/{self.ride.id}/delete_forever/')
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.get('/api/rides/').data['count'], 0)
+
+    def test_events(self):
+        url = f'/api/rides/{self.ride.id}/'
+        self.assertEqual(self.assertCached(url)['recent_events'], [])
+        event = self.write('post', '/api/events/', {'ride_id': self.ride.id, 'description': 'Traffic. '}).data['data']
+
+        self.assertEqual([item['id'] for item in self.get(url).data['recent_events']], [event['id']])
+
+        self.write('delete', f"/api/events/{event['id']}/")
+        self.assertEqual(self.get(url).data['recent_events'], [])
+
+
+class DistanceSearchTests(TestCase):
+    """
+    - Rides narrowed down by grid cell(filter_within_radius) are exactly the
+    ones within radius_km by the distance_km annotation alone.
+    """
+
+    centers = [
+        (14.5995, 120.9842),
+        # Poles: every longitude is within reach
+        (89.99, 10.0),
+        (-89.95, -170.0),
+        # Antimeridian: distance_km doesn't wrap around, neither does the grid
+        (0.0, 179.99),
+        (-16.5, -179.98),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        points = []
+        for lat, long in cls.centers:
+            for _ in range(60):
+                points.append((
+                    min(max(lat + rng.uniform(-0.5, 0.5), -90), 90),
+                    min(max(long + rng.uniform(-0.5, 0.5), -180), 180),
+                ))
+        points += [(90.0, 0.0), (-90.0, 180.0), (0.0, -180.0), (0.0, 180.0)]
+
+        Ride.objects.bulk_create([
+            Ride(
+                pickup_lat=lat,
+                pickup_long=long,
+                dropoff_lat=lat,
+                dropoff_long=long,
+                pickup_time=timezone.now(),
+                pickup_cell=get_grid_cell(lat, long),
+            )
+            for lat, long in points
+        ])
+
+    def test_grid_matches_distance_annotation(self):
+        for lat, long in self.centers:
+            for radius_km in (0, 0.5, 3, 10, 40, 120, 5000):
+                with self.subTest(lat=lat, long=long, radius_km=radius_km):
+                    expected = calculate_distance(Ride.objects.all(), lat, long).filter(distance_km__lte=radius_km)
+                    actual = filter_within_radius(Ride.objects.all(), lat, long, radius_km)
+
+                    self.assertEqual(
+                        sorted(actual.values_list('id', flat=True)),
+                        sorted(expected.values_list('id', flat=True)),
+                    )
+
+    def test_invalid_radius(self):
+        client = APIClient()
+        client.force_authenticate(user=RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        ))
+
+        for radius_km in ('inf', '1e400', 'nan', '-1', 'abc'):
+            with self.subTest(radius_km=radius_km):
+                response = client.get(f'/api/rides/?lat=14.6&long=121&radius_km={radius_km}')
+                self.assertEqual(response.status_code, 400)
+
+
+class CursorPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+        # 5 rides per pickup_time: pages have to split ties by id
+        start = timezone.now()
+        Ride.objects.bulk_create([
+            Ride(
+                pickup_lat=14.5995,
+                pickup_long=120.9842,
+                dropoff_lat=14.5547,
+                dropoff_long=121.0244,
+                pickup_time=start + timedelta(minutes=i // 5),
+            )
+            for i in range(23)
+        ])
+        cls.ride_ids = set(Ride.objects.values_list('id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def get_pages(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn('count', data)
+            pages.append([ride['id'] for ride in data['results']])
+            url = data[link]
+
+        return pages
+
+    def test_every_ride_once_both_ways(self):
+        for ordering in ('pickup_time', '-pickup_time'):
+            with self.subTest(ordering=ordering):
+                pages = self.get_pages(f'/api/rides/?pagination=cursor&page_size=4&ordering={ordering}', 'next')
+                ids = [ride_id for page in pages for ride_id in page]
+                self.assertEqual(len(pages), 6)
+                self.assertEqual(len(ids), len(self.ride_ids))
+                self.assertEqual(set(ids), self.ride_ids)
+
+                # Back from the last page: the same pages, in reverse
+                last_page = self.client.get(
+                    f'/api/rides/?pagination=cursor&page_size=4&ordering={ordering}'
+                ).json()
+                while last_page['next']:
+                    last_page = self.client.get(last_page['next']).json()
+                previous_pages = self.get_pages(last_page['previous'], 'previous')
+                self.assertEqual(previous_pages[::-1], pages[:-1])
+
+    def test_distance_ordering_uses_page_numbers(self):
+        response = self.client.get(
+            '/api/rides/?pagination=cursor&lat=14.5995&long=120.9842&ordering=distance_km'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], len(self.ride_ids))
+
+
+class ArchiveRideEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+        cls.ride, other = Ride.objects.bulk_create([
+            Ride(
+                pickup_lat=14.5995,
+                pickup_long=120.9842,
+                dropoff_lat=14.5547,
+                dropoff_long=121.0244,
+                pickup_time=timezone.now(),
+            )
+            for _ in range(2)
+        ])
+
+        now = timezone.now()
+        # Two old events at the same time: history breaks the tie by id
+        ages = [200, 150, 150, 91, 89, 1]
+        for ride, age in [(cls.ride, age) for age in ages] + [(other, 120)]:
+            event = RideEvent.objects.create(ride=ride, description=f'{age} days ago. ')
+            RideEvent.objects.filter(id=event.id).update(created=now - timedelta(days=age))
+
+        cls.old_ids = set(RideEvent.objects.filter(created__lt=now - timedelta(days=90)).values_list('id', flat=True))
+        cls.recent_ids = set(RideEvent.objects.values_list('id', flat=True)) - cls.old_ids
+
+    def archive(self, **options):
+        call_command('archive_ride_events', stdout=StringIO(), **options)
+
+    def test_old_events_are_moved(self):
+        self.archive(days=90, dry_run=True)
+        self.assertFalse(RideEventArchive.objects.exists())
+
+        self.archive(days=90, batch_size=2)
+
+        self.assertEqual(set(RideEvent.objects.values_list('id', flat=True)), self.recent_ids)
+        self.assertEqual(set(RideEventArchive.objects.values_list('id', flat=True)), self.old_ids)
+        for event in RideEventArchive.objects.all():
+            self.assertEqual(event.month, RideEventArchive.get_month(event.created))
+
+        with self.assertRaises(CommandError):
+            self.archive(days=0)
+
+    def test_rerun_after_a_partial_run(self):
+        # Interrupted after the archive insert, before the delete
+        first = list(RideEvent.objects.filter(id__in=self.old_ids).order_by('created', 'id')[:2])
+        RideEventArchive.objects.bulk_create([
+            RideEventArchive(
+                id=event.id,
+                ride_id=event.ride_id,
+                description=event.description,
+                created=event.created,
+                month=RideEventArchive.get_month(event.created),
+            )
+            for event in first
+        ])
+
+        self.archive(days=90)
+
+        self.assertEqual(set(RideEvent.objects.values_list('id', flat=True)), self.recent_ids)
+        self.assertEqual(RideEventArchive.objects.count(), len(self.old_ids))
+
+    def test_history_reads_both_tables_in_order(self):
+        self.archive(days=90)
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+
+        events, url = [], f'/api/rides/{self.ride.id}/history/?page_size=4'
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            events += response.json()['results']
+            url = response.json()['next']
+
+        self.assertEqual(len(events), 6)
+        self.assertEqual({event['ride'] for event in events}, {self.ride.id})
+        order = [(parse_datetime(event['created']), event['id']) for event in events]
+        self.assertEqual(order, sorted(order))
+        self.assertEqual(
+            [event['archived'] for event in events],
+            [event['id'] in self.old_ids for event in events],
+        )
+        self.assertEqual([event['archived'] for event in events], [True] * 4 + [False] * 2)
+
+
+class RideEventStreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+        cls.ride = Ride.objects.create(
+            pickup_lat=14.5995,
+            pickup_long=120.9842,
+            dropoff_lat=14.5547,
+            dropoff_long=121.0244,
+            pickup_time=timezone.now(),
+        )
+        cls.events = [
+            RideEvent.objects.create(ride=cls.ride, description=f'Event {i}. ') for i in range(3)
+        ]
+
+    def setUp(self):
+        token = RideTokenObtainPairSerializer.get_token(self.admin).access_token
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.url = f'/api/rides/{self.ride.id}/events/stream/'
+
+    def test_long_poll_catches_up_then_times_out(self):
+        first, *missed = self.events
+
+        response = self.client.get(self.url, {'after': first.id, 'wait': 5}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event['id'] for event in response.json()], [event.id for event in missed])
+
+        # Same from EventSource's reconnect header
+        response = self.client.get(self.url, {'wait': 5}, headers={**self.headers, 'Last-Event-ID': str(first.id)})
+        self.assertEqual([event['id'] for event in response.json()], [event.id for event in missed])
+
+        # Nothing missed, nothing published: [] after the wait
+        response = self.client.get(self.url, {'after': missed[-1].id, 'wait': 0.05}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        self.assertFalse(broker.has_subscribers(self.ride.id))
+
+        response = self.client.get(self.url, {'after': 'last', 'wait': 1}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_long_poll_gets_events_published_from_another_thread(self):
+        last_id = self.events[-1].id
+        request = asyncio.ensure_future(
+            AsyncClient().get(self.url, {'after': last_id, 'wait': 5}, headers=self.headers)
+        )
+
+        while not broker.has_subscribers(self.ride.id) and not request.done():
+            await asyncio.sleep(0.01)
+        # ie: update_status in a WSGI thread
+        publisher = threading.Thread(target=broker.publish, args=(self.ride.id, {'id': last_id + 1}))
+        publisher.start()
+        publisher.join()
+
+        response = await request
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'id': last_id + 1}])
+
+    def test_slow_watcher_overflows(self):
+        watchers = RideEventBroker(maxsize=2)
+
+        async def watch():
+            subscription = watchers.subscribe(1)
+            for i in range(3):
+                publisher = threading.Thread(target=watchers.publish, args=(1, {'id': i}))
+                publisher.start()
+                publisher.join()
+            # Let the loop run the call_soon_threadsafe callbacks
+            await asyncio.sleep(0.01)
+            watchers.unsubscribe(1, subscription)
+
+            return subscription
+
+        subscription = asyncio.run(watch())
+
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual([subscription.queue.get_nowait() for _ in range(2)], [{'id': 0}, {'id': 1}])
+        self.assertFalse(watchers.has_subscribers(1))
+
+
+class MetricsTests(TestCase):
+    def test_render_merged_snapshots(self):
+        snapshots = []
+        for duration in (0.02, 3.0):
+            # One registry per worker process, read back from their snapshot files
+            worker = Registry()
+            worker.counter('requests_total', "Requests.", ('action', 'status')).inc(action='list', status=200)
+            worker.histogram('duration_seconds', "Latency.", ('action',), buckets=(0.1, 1.0)).observe(
+                duration, action='list'
+            )
+            snapshots.append(json.loads(json.dumps(worker.snapshot())))
+
+        self.assertEqual(render(merge_snapshots(snapshots)), '\n'.join([
+            '# HELP duration_seconds Latency.',
+            '# TYPE duration_seconds histogram',
+            'duration_seconds_bucket{action="list",le="0.1"} 1',
+            'duration_seconds_bucket{action="list",le="1.0"} 1',
+            'duration_seconds_bucket{action="list",le="+Inf"} 2',
+            'duration_seconds_sum{action="list"} 3.02',
+            'duration_seconds_count{action="list"} 2',
+            '# HELP requests_total Requests.',
+            '# TYPE requests_total counter',
+            'requests_total{action="list",status="200"} 2',
+        ]) + '\n')
+
+    def test_metrics_need_a_token_without_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'# TYPE api_requests_total counter', response.content)
+
+
+class InvalidIdTests(TestCase):
+    def test_invalid_ids_are_not_found(self):
+        client = APIClient()
+        client.force_authenticate(user=RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        ))
+
+        self.assertEqual(client.get('/api/rides/abc/').status_code, 404)
+        self.assertEqual(client.get('/api/rides/abc/history/').status_code, 404)
+        self.assertEqual(client.delete('/api/events/abc/').status_code, 404)
+        response = client.post('/api/events/', {'ride_id': 'abc', 'description': 'Traffic. '}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100, RESPONSE_CACHE_TIMEOUT=0)
+class CompressionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+        Ride.objects.bulk_create([
+            Ride(
+                pickup_lat=14.5995,
+                pickup_long=120.9842,
+                dropoff_lat=14.5547,
+                dropoff_long=121.0244,
+                pickup_time=timezone.now(),
+            )
+            for _ in range(10)
+        ])
+
+    def test_json_is_gzipped_with_random_bytes(self):
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        responses = [client.get('/api/rides/', HTTP_ACCEPT_ENCODING='gzip') for _ in range(5)]
+
+        for response in responses:
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(json.loads(gzip.decompress(response.content))['count'], 10)
+        # BREACH mitigation: the compressed length varies between identical responses
+        self.assertGreater(len({len(response.content) for response in responses}), 1)
+
+    def test_html_is_not_compressed(self):
+        self.client.force_login(self.admin)
+        response = self.client.get('/admin/', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class DriverStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = RideUser.objects.create(
+            username='admin', role=RideUser.RoleChoices.ADMIN, is_staff=True, is_superuser=True
+        )
+        cls.driver = RideUser.objects.create(
+            username='driver', first_name='Juan', last_name='Cruz', role=RideUser.RoleChoices.DRIVER
+        )
+        cls.dropoff_at = timezone.make_aware(timezone.datetime(2025, 11, 10, 12))
+        cls.ride = Ride.objects.create(
+            driver=cls.driver,
+            pickup_lat=14.5995,
+            pickup_long=120.9842,
+            dropoff_lat=14.5547,
+            dropoff_long=121.0244,
+            pickup_time=cls.dropoff_at - timedelta(hours=2),
+            pickup_started_at=cls.dropoff_at - timedelta(hours=2),
+            dropoff_at=cls.dropoff_at,
+            status=Ride.StatusChoices.DROPOFF,
+        )
+
+    def export(self):
+        return list(iter_driver_trips_over_1_hour(
+            timezone.make_aware(timezone.datetime(2025, 11, 1)),
+            timezone.make_aware(timezone.datetime(2025, 12, 1)),
+        ))
+
+    def test_empty_rollup_reads_the_rides(self):
+        self.assertEqual(self.export(), [('Juan Cruz', '2025-11', 1)])
+
+    def test_dirty_month_reads_the_rides(self):
+        rebuild_driver_stats(date(2025, 11, 1))
+        self.assertEqual(self.export(), [('Juan Cruz', '2025-11', 1)])
+
+        # Now a 30 minute trip, not rebuilt yet
+        Ride.objects.filter(id=self.ride.id).update(pickup_started_at=self.dropoff_at - timedelta(minutes=30))
+        DriverMonthlyStats.mark_dirty(self.driver.id, self.dropoff_at)
+        self.assertEqual(self.export(), [])
+
+        call_command('rebuild_driver_stats', stdout=StringIO())
+        self.assertEqual(self.export(), [])
+        self.assertFalse(DriverMonthlyStats.objects.filter(is_dirty=True).exists())
+
+    def test_pickup_after_dropoff_marks_the_month_dirty(self):
+        rebuild_driver_stats(date(2025, 11, 1))
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+
+        response = client.post(f'/api/rides/{self.ride.id}/update_status/', {'status': Ride.StatusChoices.PICKUP})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(DriverMonthlyStats.objects.get(driver=self.driver, month=date(2025, 11, 1)).is_dirty)
+
+    def test_backfill_marks_the_months_dirty(self):
+        rebuild_driver_stats(date(2025, 11, 1))
+        event = RideEvent.objects.create(
+            ride=self.ride, description=RideEvent.get_description_by_status(Ride.StatusChoices.DROPOFF)
+        )
+        RideEvent.objects.filter(id=event.id).update(created=self.dropoff_at + timedelta(days=30))
+
+        call_command('backfill_ride_timestamps', overwrite=True, stdout=StringIO())
+
+        dirty = DriverMonthlyStats.objects.filter(driver=self.driver, is_dirty=True)
+        self.assertEqual(set(dirty.values_list('month', flat=True)), {date(2025, 11, 1), date(2025, 12, 1)})
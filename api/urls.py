@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import RideUserViewset, RideViewset, RideEventViewset
+from .async_views import AsyncRideView, RideEventStreamView
+from .views import RideUserViewset, RideViewset, RideEventViewset, DriverMonthlyStatsViewset, ReportJobViewset
 
 app_name = 'api'
 
@@ -9,7 +10,14 @@ router = routers.DefaultRouter()
 router.register('users', RideUserViewset)
 router.register('rides', RideViewset, basename='ride')
 router.register('events', RideEventViewset, basename='rideevent')
+router.register('driver-stats', DriverMonthlyStatsViewset)
+router.register('reports', ReportJobViewset)
 
 urlpatterns = [
     path('', include(router.urls)),
+
+    # Async-native ride list/retrieve, for ASGI servers(see: api/async_views.py)
+    path('async/rides/', AsyncRideView.as_view(), name='async-ride-list'),
+    path('async/rides/<str:pk>/', AsyncRideView.as_view(), name='async-ride-detail'),
+    path('rides/<str:pk>/events/stream/', RideEventStreamView.as_view(), name='ride-event-stream'),
 ]
\ No newline at end of file
@@ -1,30 +1,48 @@
 from datetime import timedelta
 
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.http import FileResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Prefetch
+from django.db import transaction
+from django.db.models import BooleanField, Prefetch, Value
 from django.utils import timezone
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.filters import OrderingFilter
+# DRF's: a pk that isn't a valid id(ie: 'abc') is a 404, not a 500.
+from rest_framework.generics import get_object_or_404
 
-from .models import RideUser, Ride, RideEvent
+from .models import RideUser, Ride, RideEvent, RideEventArchive, DriverMonthlyStats, ReportJob
 from .serializers import (
     RideUserSerializer, 
     CreateRideUserSerializer,
     RideSerializer,
+    FastRideSerializer,
     CreateRideSerializer,
-    RideEventSerializer
+    RideStatusSerializer,
+    RideEventSerializer,
+    RideEventHistorySerializer,
+    DriverMonthlyStatsSerializer,
+    ReportJobSerializer,
+    ReportRequestSerializer,
+    DriverTripsReportSerializer,
 )
-from .permissions import IsRideUserAdmin
-from .pagination import RidesPagination
-from .querysets import calculate_distance
-
-
-class RideUserViewset(viewsets.ReadOnlyModelViewSet):
+from .permissions import IsRideUserAdmin, IsDriverSelf
+from .authentication import invalidate_user_claims
+from .cache import CachedResponseMixin, bump_table_versions
+from .jobs import enqueue_report, get_reports_dir
+from .pagination import RidesPagination, RidesCursorPagination, use_cursor_pagination
+from .locations import nearest_available_drivers, save_driver_location
+from .querysets import calculate_distance, filter_within_radius, parse_coordinates, parse_radius
+from .routers import ReplicaReadsMixin
+from .streams import publish_ride_events
+
+
+class RideUserViewset(ReplicaReadsMixin, viewsets.ReadOnlyModelViewSet):
     """
     - 'CRUD' for Users(RideUser)
     - Change role, set inactive, and update profile are separated
@@ -34,6 +52,9 @@ class RideUserViewset(viewsets.ReadOnlyModelViewSet):
     queryset = RideUser.objects.all()
     serializer_class = RideUserSerializer
     permission_classes = [IsRideUserAdmin, IsAdminUser]
+    # Read from the replica when there is one, see: api/routers.py
+    replica_actions = ('list', 'retrieve')
+    nearest_drivers_max_k = 50
 
     # Create/register new user
     @action(
@@ -72,6 +93,8 @@ class RideUserViewset(viewsets.ReadOnlyModelViewSet):
         current_role = user.get_role_display()       
         user.role = role
         user.save()
+        invalidate_user_claims(user.pk)
+        bump_table_versions('rideuser')
         updated_role = user.get_role_display()
 
         return Response({
@@ -95,6 +118,8 @@ class RideUserViewset(viewsets.ReadOnlyModelViewSet):
         
         user.is_active = False
         user.save()
+        invalidate_user_claims(user.pk)
+        bump_table_versions('rideuser')
 
         return Response(
             {
@@ -130,20 +155,100 @@ class RideUserViewset(viewsets.ReadOnlyModelViewSet):
             if field in request.data:
                 setattr(user, field, request.data[field])
         user.save()
+        bump_table_versions('rideuser')
 
         return Response({
             "data": RideUserSerializer(user).data,
             "message": f"{user.username}'s user information is updated.",
             "status": "success"
         }, status=status.HTTP_200_OK)
+
+    # Driver's current location, sent every few seconds by the driver(or
+    # admins on their behalf). Kept light: one UPDATE, no user lookup.
+    @action(
+        detail=True,
+        methods=['post'],
+        permission_classes=[(IsRideUserAdmin & IsAdminUser) | IsDriverSelf],
+    )
+    def ping(self, request, pk=None):
+        coordinates = parse_coordinates(request.data.get('lat'), request.data.get('long'))
+        if coordinates is None:
+
+            return Response({
+                "error": "Valid lat and long are required. ",
+                "status": "failed"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            driver_id = int(pk)
+        except ValueError:
+            raise NotFound()
+
+        updated = save_driver_location(driver_id, *coordinates)
+        if updated is None:
+            raise NotFound("No driver matches the given query.")
+
+        return Response({
+            "data": {
+                "driver": driver_id,
+                "lat": coordinates[0],
+                "long": coordinates[1],
+                "updated": updated,
+            },
+            "status": "success"
+        }, status=status.HTTP_200_OK)
+
+    # k nearest active drivers not on a ride, see: api/locations.py
+    @action(
+        detail=False,
+        methods=['get'],
+    )
+    def nearest_drivers(self, request):
+        coordinates = parse_coordinates(request.query_params.get('lat'), request.query_params.get('long'))
+        if coordinates is None:
+
+            return Response({
+                "error": "Valid lat and long are required. ",
+                "status": "failed"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            k = int(request.query_params.get('k', 5))
+            radius_km = float(request.query_params.get('radius_km', settings.NEAREST_DRIVERS_MAX_KM))
+        except ValueError:
+            k = radius_km = None
+
+        if k is None or not 1 <= k <= self.nearest_drivers_max_k or not radius_km > 0:
+
+            return Response({
+                "error": f"k must be 1 to {self.nearest_drivers_max_k} and radius_km more than 0. ",
+                "status": "failed"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        drivers = nearest_available_drivers(*coordinates, k, min(radius_km, settings.NEAREST_DRIVERS_MAX_KM))
+        users = RideUserSerializer([driver for _, driver, _ in drivers], many=True).data
+
+        return Response({
+            "data": [
+                {
+                    **user,
+                    "distance_km": round(distance, 2),
+                    "location": {"lat": lat, "long": long, "updated": updated},
+                }
+                for user, (distance, _, (lat, long, updated)) in zip(users, drivers)
+            ],
+            "status": "success"
+        }, status=status.HTTP_200_OK)
     
 
-class RideViewset(viewsets.ReadOnlyModelViewSet):
+class RideViewset(ReplicaReadsMixin, CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """
     - For Rides (list, create/book, delete ONLY)
     - Edit should not be allowed, in irl: When there's a 
     change of mind, should book a new ride instead. Hence,
     status of ride should be sent as 'cancelled.'
+    - list/retrieve responses are cached until one of cache_tables
+    changes, see: api/cache.py
     """
     serializer_class = RideSerializer
     permission_classes = [IsRideUserAdmin, IsAdminUser]
@@ -151,26 +256,101 @@ class RideViewset(viewsets.ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status', 'rider__email']
     ordering_fields = ['pickup_time', 'distance_km']  
+    bulk_max_size = 5000
+    cache_tables = ('ride', 'rideevent', 'rideuser')
+    # Read from the replica when there is one, see: api/routers.py
+    replica_actions = ('list', 'retrieve', 'history')
+
+    @property
+    def paginator(self):
+        # Opt-in keyset pagination for deep pages, see: use_cursor_pagination
+        if not hasattr(self, '_paginator'):
+            if use_cursor_pagination(self.request):
+                self._paginator = RidesCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+
+        return self._paginator
+
+    def get_serializer_class(self):
+        # Opt-in hand-rolled serializer for list pages, same output.
+        if self.action == 'list':
+            fast = self.request.query_params.get('serializer') == 'fast'
+            if fast or getattr(settings, 'RIDES_FAST_SERIALIZER', False):
+                return FastRideSerializer
+
+        return super().get_serializer_class()
+
+    def get_field_params(self):
+        """
+        - ?fields=id,status,pickup_time only returns these fields.
+        - ?expand=rider,driver,events only nests these, rider/driver
+        are ids otherwise and recent_events is left out.
+        - None when not given: all fields, everything nested.
+        """
+
+        if self.action not in ('list', 'retrieve'):
+
+            return None, None
+
+        params = self.request.query_params
+        fields = expand = None
+
+        if params.get('fields'):
+            fields = {field.strip() for field in params['fields'].split(',') if field.strip()}
+        if 'expand' in params:
+            expand = {name.strip() for name in params['expand'].split(',') if name.strip()}
+
+        return fields, expand
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'], context['expand'] = self.get_field_params()
+
+        return context
 
     def get_queryset(self):
-        cutoff = timezone.now() - timedelta(hours=24)
-        recent_events = Prefetch(
-            'events',
-            queryset=RideEvent.objects.filter(created__gte=cutoff),
-            to_attr='recent_events',
-        )
-        queryset = Ride.objects.select_related('driver', 'rider').prefetch_related(recent_events)
+        fields, expand = self.get_field_params()
+
+        def is_needed(field, expand_name):
+            # Other actions(update_status, delete_forever...) only need the ride.
+            return self.action in ('list', 'retrieve') and (
+                (fields is None or field in fields) and
+                (expand is None or expand_name in expand)
+            )
+
+        # Only join/prefetch what the response will show.
+        queryset = Ride.objects.all()
+        related = [name for name in ('driver', 'rider') if is_needed(name, name)]
+        if related:
+            queryset = queryset.select_related(*related)
+
+        if is_needed('recent_events', 'events'):
+            cutoff = timezone.now() - timedelta(hours=24)
+            recent_events = Prefetch(
+                'events',
+                queryset=RideEvent.objects.filter(created__gte=cutoff),
+                to_attr='recent_events',
+            )
+            queryset = queryset.prefetch_related(recent_events)
 
         if self.action == 'list':            
             lat = self.request.query_params.get('lat')
             long = self.request.query_params.get('long')
+            radius_km = self.request.query_params.get('radius_km')
             
             # Check if calculating distance, need b
             if (lat and not long) or (not lat and long):
                 
                 return queryset
             
-            queryset = calculate_distance(queryset, lat, long)
+            # Narrow down to nearby grid cells before the exact distance
+            if radius_km:
+                if parse_radius(radius_km) is None:
+                    raise ValidationError({'radius_km': "A finite number of km, 0 or more, is required."})
+                queryset = filter_within_radius(queryset, lat, long, radius_km)
+            else:
+                queryset = calculate_distance(queryset, lat, long)
 
         return queryset.order_by('-pickup_time')
 
@@ -184,13 +364,19 @@ class RideViewset(viewsets.ReadOnlyModelViewSet):
     def book(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        ride = serializer.save()
+        # One time for the ride's pickup_started_at and its event.
+        now = timezone.now()
+        ride = serializer.save(pickup_started_at=now)
 
-        RideEvent.objects.create(
+        ride_event = RideEvent.objects.create(
             ride=ride,
-            description=RideEvent.get_description_by_status(Ride.StatusChoices.PICKUP)
+            description=RideEvent.get_description_by_status(Ride.StatusChoices.PICKUP),
+            created=now,
         )
-
+        bump_table_versions('ride', 'rideevent')
+        publish_ride_events(ride_event)
+        # Same as the Prefetch in get_queryset, without querying it back.
+        ride.recent_events = [ride_event]
 
         return Response({
             "data": RideSerializer(ride).data,
@@ -198,6 +384,83 @@ class RideViewset(viewsets.ReadOnlyModelViewSet):
             "status": "success"
         }, status=status.HTTP_200_OK)
     
+    # Book many rides at once, ie: scheduled rides imported by dispatch.
+    # All or nothing: errors are reported per item(same order as sent).
+    @action(
+        detail=False,
+        methods=['post'],
+        serializer_class=CreateRideSerializer
+    )
+    def bulk_book(self, request):
+        if not isinstance(request.data, list) or not request.data:
+
+            return Response({
+                "message": "A list of rides is required. ",
+                "status": "failed"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(
+            data=request.data, many=True, max_length=self.bulk_max_size
+        )
+        if not serializer.is_valid():
+
+            return Response({
+                "errors": serializer.errors,
+                "message": "No rides were booked, see errors. ",
+                "status": "failed"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        description = RideEvent.get_description_by_status(Ride.StatusChoices.PICKUP)
+        now = timezone.now()
+        rides = [
+            Ride(**ride_data, pickup_started_at=now)
+            for ride_data in serializer.validated_data
+        ]
+        # bulk_create skips save()
+        for ride in rides:
+            ride.set_pickup_cell()
+
+        with transaction.atomic():
+            Ride.objects.bulk_create(rides)
+            events = RideEvent.objects.bulk_create([
+                RideEvent(ride=ride, description=description, created=now) for ride in rides
+            ])
+            bump_table_versions('ride', 'rideevent')
+            publish_ride_events(*events)
+
+        for ride, ride_event in zip(rides, events):
+            ride.recent_events = [ride_event]
+
+        return Response({
+            "data": RideSerializer(rides, many=True).data,
+            "message": f"{len(rides)} rides are booked. ",
+            "status": "success"
+        }, status=status.HTTP_200_OK)
+
+    # All events of a ride, oldest first, including the ones moved to
+    # RideEventArchive by 'python manage.py archive_ride_events'.
+    @action(
+        detail=True,
+        methods=['get']
+    )
+    def history(self, request, pk=None):
+        ride = get_object_or_404(Ride.objects.only('id'), id=pk)
+        fields = ('id', 'ride', 'description', 'created')
+
+        events = RideEvent.objects.filter(ride=ride).values(*fields).annotate(
+            archived=Value(False, output_field=BooleanField())
+        )
+        archived_events = RideEventArchive.objects.filter(ride=ride).values(*fields).annotate(
+            archived=Value(True, output_field=BooleanField())
+        )
+        history = events.union(archived_events, all=True).order_by('created', 'id')
+
+        # Always page numbers, the cursor pagination is for rides.
+        paginator = RidesPagination()
+        page = paginator.paginate_queryset(history, request, view=self)
+
+        return paginator.get_paginated_response(RideEventHistorySerializer(page, many=True).data)
+
     # Delete ride(NOT SOFT-DELETE)
     @action(
         detail=True,
@@ -205,7 +468,9 @@ class RideViewset(viewsets.ReadOnlyModelViewSet):
     )
     def delete_forever(self, request, pk=None):
         ride = self.get_object()
+        DriverMonthlyStats.mark_dirty(ride.driver_id, ride.dropoff_at)
         ride.delete()
+        bump_table_versions('ride', 'rideevent')
 
         return Response({
             "message": f"Ride {pk} is deleted forever. ",
@@ -235,9 +500,6 @@ class RideViewset(viewsets.ReadOnlyModelViewSet):
                 "status": "failed"
             }, status=status.HTTP_404_NOT_FOUND)
         
-        ride.status = ride_status
-        ride.save()
-
         try:
             description = RideEvent.get_description_by_status(ride_status)
         except ValueError as e:
@@ -246,7 +508,19 @@ class RideViewset(viewsets.ReadOnlyModelViewSet):
                 "status": "failed"
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        ride_event = RideEvent.objects.create(ride=ride, description=description)
+        # Event first, so the ride's status timestamp is the event's time.
+        with transaction.atomic():
+            ride_event = RideEvent.objects.create(ride=ride, description=description)
+            previous_dropoff_at = ride.dropoff_at
+            ride.save(update_fields=ride.set_status(ride_status, ride_event.created))
+
+            if ride_status == Ride.StatusChoices.DROPOFF:
+                DriverMonthlyStats.record_dropoff(ride, previous_dropoff_at)
+            elif ride_status == Ride.StatusChoices.PICKUP:
+                DriverMonthlyStats.record_pickup(ride)
+
+            bump_table_versions('ride', 'rideevent')
+            publish_ride_events(ride_event)
 
         return Response({
             "data": RideEventSerializer(ride_event).data,
@@ -254,6 +528,76 @@ class RideViewset(viewsets.ReadOnlyModelViewSet):
             "status": "success"
         }, status=status.HTTP_200_OK)
 
+    # Update the status of many rides at once, ie: bursts of driver pings.
+    # All or nothing: errors are reported per item(same order as sent).
+    @action(
+        detail=False,
+        methods=['post']
+    )
+    def bulk_update_status(self, request):
+        if not isinstance(request.data, list) or not request.data:
+
+            return Response({
+                "message": "A list of {id, status} is required. ",
+                "status": "failed"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = RideStatusSerializer(
+            data=request.data, many=True, max_length=self.bulk_max_size
+        )
+        if not serializer.is_valid():
+
+            return Response({
+                "errors": serializer.errors,
+                "message": "No statuses were updated, see errors. ",
+                "status": "failed"
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        updates = [(item['ride'], item['status']) for item in serializer.validated_data]
+        rides = {ride.id: ride for ride, _ in updates}
+
+        # One UPDATE per status instead of one full-row save per ride.
+        ids_by_status = {}
+        for ride, ride_status in updates:
+            ids_by_status.setdefault(ride_status, []).append(ride.id)
+
+        now = timezone.now()
+        with transaction.atomic():
+            for ride_status, ride_ids in ids_by_status.items():
+                values = {'status': ride_status}
+                timestamp_field = Ride.STATUS_TIMESTAMP_FIELDS.get(ride_status)
+                if timestamp_field:
+                    values[timestamp_field] = now
+                Ride.objects.filter(id__in=ride_ids).update(**values)
+
+            # Same time as the rides' status timestamps, like update_status.
+            events = RideEvent.objects.bulk_create([
+                RideEvent(
+                    ride=ride,
+                    description=RideEvent.get_description_by_status(ride_status),
+                    created=now,
+                )
+                for ride, ride_status in updates
+            ])
+
+            for ride_id in ids_by_status.get(Ride.StatusChoices.DROPOFF, []):
+                ride = rides[ride_id]
+                previous_dropoff_at = ride.dropoff_at
+                ride.set_status(Ride.StatusChoices.DROPOFF, now)
+                DriverMonthlyStats.record_dropoff(ride, previous_dropoff_at)
+
+            for ride_id in ids_by_status.get(Ride.StatusChoices.PICKUP, []):
+                DriverMonthlyStats.record_pickup(rides[ride_id])
+
+            bump_table_versions('ride', 'rideevent')
+            publish_ride_events(*events)
+
+        return Response({
+            "data": RideEventSerializer(events, many=True).data,
+            "message": f"{len(events)} ride statuses are updated. ",
+            "status": "success"
+        }, status=status.HTTP_200_OK)
+
 
 class RideEventViewset(viewsets.ViewSet):
     """
@@ -284,6 +628,8 @@ class RideEventViewset(viewsets.ViewSet):
             ride=ride,
             description=description
         )
+        bump_table_versions('rideevent')
+        publish_ride_events(ride_event)
 
         return Response({
             "data": RideEventSerializer(ride_event).data,
@@ -294,8 +640,88 @@ class RideEventViewset(viewsets.ViewSet):
     def destroy(self, request, pk=None):
         ride_event = get_object_or_404(RideEvent, id=pk)
         ride_event.delete()
+        bump_table_versions('rideevent')
 
         return Response(
             {"message": f"Ride event {pk} deleted successfully.", "status": "success"},
             status=status.HTTP_204_NO_CONTENT
-        )
\ No newline at end of file
+        )
+
+
+class DriverMonthlyStatsViewset(viewsets.ReadOnlyModelViewSet):
+    """
+    - Read-only trip stats per driver per month(DriverMonthlyStats rollup).
+    - Filter with ?driver=<id>&month=YYYY-MM-01
+    """
+    queryset = DriverMonthlyStats.objects.select_related('driver').order_by('-month', 'driver_id')
+    serializer_class = DriverMonthlyStatsSerializer
+    permission_classes = [IsRideUserAdmin, IsAdminUser]
+    pagination_class = RidesPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['driver', 'month']
+    ordering_fields = ['month', 'trip_count', 'over_1h_count', 'total_duration']
+
+
+class ReportJobViewset(viewsets.ReadOnlyModelViewSet):
+    """
+    - Reports are exported in the background by 'manage.py run_report_jobs'
+    instead of in the request(see: api/jobs.py).
+    - POST 'api/reports/<kind>/' queues one(or returns the identical one
+    already queued/running), GET 'api/reports/<id>/' for its status,
+    'api/reports/<id>/download/' once done.
+    """
+    queryset = ReportJob.objects.order_by('-created', '-id')
+    serializer_class = ReportJobSerializer
+    permission_classes = [IsRideUserAdmin, IsAdminUser]
+    pagination_class = RidesPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['kind', 'status']
+
+    def enqueue(self, request, kind):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # request.user is built from the token's claims(id as a string), see: api/authentication.py
+        job, created = enqueue_report(kind, serializer.validated_data, int(request.user.id))
+
+        return Response({
+            "data": ReportJobSerializer(job, context=self.get_serializer_context()).data,
+            "message": "Report queued." if created else "Same report is already queued, returning its job.",
+            "status": "success"
+        }, status=status.HTTP_202_ACCEPTED)
+
+    # Driver trips over 1 hour per month, same as 'manage.py export_monthly'
+    @action(
+        detail=False,
+        methods=['post'],
+        serializer_class=DriverTripsReportSerializer,
+    )
+    def driver_trips(self, request):
+        return self.enqueue(request, ReportJob.KindChoices.DRIVER_TRIPS)
+
+    # Every ride with its estimate, same as 'manage.py export_rides'
+    @action(
+        detail=False,
+        methods=['post'],
+        serializer_class=ReportRequestSerializer,
+    )
+    def ride_estimates(self, request):
+        return self.enqueue(request, ReportJob.KindChoices.RIDE_ESTIMATES)
+
+    @action(
+        detail=True,
+        methods=['get'],
+    )
+    def download(self, request, pk=None):
+        job = self.get_object()
+        if job.status != ReportJob.StatusChoices.DONE:
+
+            return Response({
+                "error": f"Report is {job.get_status_display().lower()}, not ready. ",
+                "status": "failed"
+            }, status=status.HTTP_409_CONFLICT)
+
+        path = get_reports_dir() / job.file
+        if not path.exists():
+            raise NotFound("Report file no longer exists, queue it again.")
+
+        return FileResponse(path.open('rb'), as_attachment=True, filename=job.file)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,6 +48,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Query count/time per request, see: api/middleware.py
+    'api.middleware.QueryInstrumentationMiddleware',
+    # Compresses the final body, keep it before anything that changes it.
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,12 +83,98 @@ WSGI_APPLICATION = 'ride.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE=postgres switches to PostgreSQL(needs 'pip install psycopg[binary,pool]'),
+# configured with the DATABASE_* environment variables below:
+#   DATABASE_POOL_MAX_SIZE > 0: psycopg's connection pool per process,
+#   otherwise connections are kept open for DATABASE_CONN_MAX_AGE seconds.
+# A read replica is added as the 'replica' alias with DATABASE_REPLICA_HOST
+# (postgres) or DATABASE_REPLICA_NAME(sqlite file, ie: for trying it locally,
+# refreshed from the primary with 'python manage.py sync_sqlite_replica').
+# Only the actions in replica_actions(list/retrieve/history) and export_monthly
+# read from it, see: api/routers.py. They can be behind the primary by the
+# replica's lag, cached responses(RESPONSE_CACHE_TIMEOUT) included.
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgres':
+    DATABASE_POOL_MAX_SIZE = int(os.environ.get('DATABASE_POOL_MAX_SIZE', 0))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'ride'),
+            'USER': os.environ.get('DATABASE_USER', 'ride'),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+            'PORT': os.environ.get('DATABASE_PORT', '5432'),
+            # The pool keeps the connections itself, Django requires 0 with it.
+            'CONN_MAX_AGE': 0 if DATABASE_POOL_MAX_SIZE else int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if DATABASE_POOL_MAX_SIZE:
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+            'max_size': DATABASE_POOL_MAX_SIZE,
+            # Seconds a request waits for a free connection
+            'timeout': int(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+        }
+
+    if os.environ.get('DATABASE_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'OPTIONS': {**DATABASES['default']['OPTIONS']},
+            'HOST': os.environ['DATABASE_REPLICA_HOST'],
+            'PORT': os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
+
+    if os.environ.get('DATABASE_REPLICA_NAME'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ['DATABASE_REPLICA_NAME'],
+        }
+
+# 'api/users/nearest_drivers/': drivers whose last ping('api/users/<id>/ping/')
+# is older than DRIVER_LOCATION_MAX_AGE seconds are left out, and the search
+# goes at most NEAREST_DRIVERS_MAX_KM around the point. See: api/locations.py
+DRIVER_LOCATION_MAX_AGE = 300
+NEAREST_DRIVERS_MAX_KM = 20
+
+# Trip estimates on ride output('estimate') and 'manage.py export_rides': road
+# distance is the straight-line distance times RIDE_ROAD_FACTOR, driven at
+# RIDE_AVERAGE_SPEED_KMH, fare = base + per km + per minute, at least the
+# minimum. See: api/estimates.py
+RIDE_ROAD_FACTOR = 1.3
+RIDE_AVERAGE_SPEED_KMH = 20
+RIDE_FARE_BASE = 45
+RIDE_FARE_PER_KM = 15
+RIDE_FARE_PER_MINUTE = 2
+RIDE_FARE_MINIMUM = 75
+
+# Reports queued through 'api/reports/<kind>/' are written here by
+# 'manage.py run_report_jobs'. Jobs running for longer than REPORT_JOB_TIMEOUT
+# seconds(ie: worker killed) are queued again. See: api/jobs.py
+REPORTS_DIR = Path(os.environ.get('REPORTS_DIR', BASE_DIR / 'reports'))
+REPORT_JOB_TIMEOUT = 3600
+
+# Opt-in SQLite profile for single-node deployments(SQLITE_TUNING=1): WAL,
+# synchronous=NORMAL, busy_timeout, mmap, a bigger page cache and BEGIN IMMEDIATE
+# transactions, so concurrent writes wait for each other instead of failing with
+# 'database is locked'. SQLITE_PRAGMAS overrides single pragmas, ie: {'mmap_size': 0}
+# See: api/sqlite.py, 'python manage.py benchmark_sqlite' compares both.
+SQLITE_TUNING = os.environ.get('SQLITE_TUNING') == '1'
+SQLITE_PRAGMAS = {}
+
+if 'replica' in DATABASES:
+    # Tests run everything on the primary.
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
 
 
 # Password validation
@@ -106,7 +197,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -115,7 +206,111 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.OrderingFilter',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Responses smaller than this are sent uncompressed, see: api/middleware.py
+COMPRESSION_MIN_SIZE = 1024
+# Only these are compressed: HTML(admin/login) carries CSRF tokens, see BREACH.
+COMPRESSION_CONTENT_TYPES = ('application/json',)
+
+# Requests over QUERY_LOG_MAX_QUERIES queries or QUERY_LOG_SLOW_MS of total
+# database time are logged as warnings to 'api.queries', set its level to
+# DEBUG to log every request. See: QueryInstrumentationMiddleware
+QUERY_LOG_MAX_QUERIES = 20
+QUERY_LOG_SLOW_MS = 200
+
+# Prometheus metrics at /metrics, see: api/metrics.py
+# With several worker processes(ie: gunicorn -w 4) set METRICS_DIR to a directory
+# shared by them: each saves its metrics there every METRICS_FLUSH_INTERVAL seconds
+# and /metrics adds them up. Empty it before starting the server.
+# With METRICS_TOKEN set, scrapes need 'Authorization: Bearer <METRICS_TOKEN>',
+# without it /metrics is a 404 unless DEBUG is on.
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.queries': {
+            'handlers': ['console'],
+            'level': os.environ.get('QUERY_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        'api.jobs': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.RideTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.authentication.RideTokenRefreshSerializer',
+}
+
+# Trust role/is_active/is_staff claims of access tokens instead of loading the
+# user on every request. Changing a user through 'update_role'/'set_inactive'
+# (or the admin) bumps RideUser.claims_version, which rejects the tokens issued
+# before. Each request reads the current version from JWT_CLAIMS_CACHE(the
+# database on a miss), cached for JWT_CLAIMS_CACHE_TIMEOUT seconds: with a
+# process-local cache other worker processes keep accepting old tokens that
+# long, so only turn this on with a cache shared by every process(ie: Redis).
+# See: api/authentication.py
+JWT_TRUST_CLAIMS = False
+JWT_CLAIMS_CACHE = 'jwt_claims'
+JWT_CLAIMS_CACHE_TIMEOUT = 60
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Claims versions only(JWT_CLAIMS_CACHE), other entries can't push them out.
+    'jwt_claims': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'jwt-claims',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # Response cache(RESPONSE_CACHE_ALIAS), an entry per query params.
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+    },
 }
+# Seconds RideViewset list/retrieve responses are cached(0 disables, capped at
+# 300). Entries are invalidated by the API's writes, see: api/cache.py
+# Changes made outside the API(ie: admin) show up after at most this long.
+# Its own alias: its many entries would push other entries out of a shared one.
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = 30
+
+# Ride list pagination: 'page' (page numbers with a total count) or 'cursor'
+# (keyset on pickup_time/id, no count). Can also be picked per request
+# with ?pagination=cursor
+RIDES_PAGINATION = 'page'
+
+# Serialize ride list pages with the hand-rolled FastRideSerializer(same output)
+# instead of RideSerializer. Can also be picked per request with ?serializer=fast
+RIDES_FAST_SERIALIZER = False
+
+# 'api/rides/<id>/events/stream/'(server-sent events, see: api/async_views.py):
+# a comment is sent every HEARTBEAT seconds on idle streams, and streams end
+# after TIMEOUT seconds(EventSource reconnects and resumes with Last-Event-ID).
+# Events are published in-process(api/streams.py): with several worker
+# processes a watcher only gets the writes made by its own process live,
+# the others once it reconnects.
+RIDE_EVENT_STREAM_HEARTBEAT = 15
+RIDE_EVENT_STREAM_TIMEOUT = 300
 
 
 # Internationalization
@@ -2,6 +2,8 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from api.metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
 
@@ -11,4 +13,7 @@ urlpatterns = [
     # Authenticate users through auth tokens
     path('api/login/', TokenObtainPairView.as_view(), name='access_token'),
     path('api/refresh/', TokenRefreshView.as_view(), name='refresh_token'),
+
+    # Prometheus metrics, see: api/metrics.py
+    path('metrics', metrics_view, name='metrics'),
 ]